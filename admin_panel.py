@@ -7,10 +7,25 @@ from aiogram import types, Dispatcher
 from aiogram.dispatcher import FSMContext
 from aiogram.dispatcher.filters.state import State, StatesGroup
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardMarkup, KeyboardButton
+import asyncio
 import logging
+from datetime import datetime, timedelta
 
 from config import ADMIN_USER_ID
 from content_manager import content_manager
+from sheets import USE_GSHEET, sheets_connection, sheets_queue
+from data import (TICKET_STATUSES, get_ticket, set_ticket_status, is_ticket_archived, query_tickets,
+                  count_tickets_by_status)
+
+try:
+    from config import ADMIN_ORDERS_LIMIT
+except ImportError:
+    ADMIN_ORDERS_LIMIT = 20  # заказов в списке раздела «Заказы»
+
+try:
+    from config import ADMIN_HISTORY_LIMIT
+except ImportError:
+    ADMIN_HISTORY_LIMIT = 10  # версий в «🕘 История» разделов контента
 
 logger = logging.getLogger(__name__)
 
@@ -56,6 +71,11 @@ class AdminAbout(StatesGroup):
     edit_text = State()
 
 
+class AdminOrders(StatesGroup):
+    """Состояния для работы с заказами"""
+    lookup = State()
+
+
 # ==================== ГЛАВНОЕ МЕНЮ АДМИН-ПАНЕЛИ ====================
 
 # ==================== ГЛАВНОЕ МЕНЮ АДМИН-ПАНЕЛИ ====================
@@ -67,6 +87,8 @@ async def admin_main_menu(call: types.CallbackQuery):
         InlineKeyboardButton("📝 Управление контентом", callback_data="admin_content_menu"),
         InlineKeyboardButton("💾 Управление бекапами", callback_data="admin_backup_menu"),
         InlineKeyboardButton("⭐ Модерация отзывов", callback_data="admin_reviews_menu"),
+        InlineKeyboardButton("📋 Заказы", callback_data="admin_orders_menu"),
+        InlineKeyboardButton("🔎 Найти заказ", callback_data="admin_order_lookup"),
         InlineKeyboardButton("📊 Общая статистика", callback_data="admin_main_stats"),
         InlineKeyboardButton("❌ Закрыть", callback_data="admin_close")
     )
@@ -134,9 +156,10 @@ async def admin_reviews_menu(call: types.CallbackQuery):
 async def admin_main_stats(call: types.CallbackQuery):
     """Общая статистика системы"""
     from reviews import PENDING_REVIEWS
-    from data import TICKETS_DB, REFERRALS_DB, BONUSES_DB
+    from data import TICKETS_DB, get_referral_stats
     
     content_stats = content_manager.get_stats()
+    referral_stats = get_referral_stats()
     
     keyboard = InlineKeyboardMarkup()
     keyboard.add(InlineKeyboardButton("🔙 Главное меню", callback_data="admin_main_menu"))
@@ -151,12 +174,22 @@ async def admin_main_stats(call: types.CallbackQuery):
 • Всего заявок: {len(TICKETS_DB)}
 
 <b>👥 Пользователи:</b>
-• Всего рефералов: {sum(len(refs) for refs in REFERRALS_DB.values())}
-• Начислено бонусов: {sum(BONUSES_DB.values())} ₽
+• Всего рефералов: {referral_stats['total_referrals']}
+• Начислено бонусов: {referral_stats['bonus_total']} ₽
 
 <b>⭐ Отзывы:</b>
 • На модерации: {len(PENDING_REVIEWS)}"""
     
+    if USE_GSHEET:
+        sheets_stats = sheets_connection.get_stats()
+        text += f"""
+
+<b>📗 Google Sheets:</b>
+• Запросов к таблице: {sheets_stats['calls']}
+• Сэкономлено открытий таблицы: {sheets_stats['saved_calls']}
+• Переподключений: {sheets_stats['reconnects']}
+• В очереди на запись: {sheets_queue.pending()}"""
+    
     await call.message.edit_text(text, reply_markup=keyboard, parse_mode="HTML")
 
 
@@ -199,6 +232,7 @@ async def portfolio_menu(call: types.CallbackQuery):
     
     keyboard.add(
         InlineKeyboardButton("➕ Добавить кейс", callback_data="add_case_title"),
+        InlineKeyboardButton("🕘 История", callback_data="content_history_portfolio"),
         InlineKeyboardButton("🔙 Назад", callback_data="admin_back")
     )
     
@@ -215,8 +249,7 @@ async def edit_case_callback(call: types.CallbackQuery, state: FSMContext):
     """Редактирование кейса"""
     case_id = call.data.replace("edit_case_", "")
     
-    portfolio = content_manager.get_portfolio()
-    case = next((c for c in portfolio if c["id"] == case_id), None)
+    case = content_manager.get_portfolio_case(case_id)
     
     if not case:
         await call.answer("❌ Кейс не найден")
@@ -312,8 +345,7 @@ async def delete_case_confirm_callback(call: types.CallbackQuery, state: FSMCont
     data = await state.get_data()
     case_id = data.get("current_case_id")
     
-    portfolio = content_manager.get_portfolio()
-    case = next((c for c in portfolio if c["id"] == case_id), None)
+    case = content_manager.get_portfolio_case(case_id)
     
     keyboard = InlineKeyboardMarkup()
     keyboard.add(
@@ -358,6 +390,7 @@ async def faq_menu(call: types.CallbackQuery):
     
     keyboard.add(
         InlineKeyboardButton("➕ Добавить вопрос", callback_data="add_faq_question"),
+        InlineKeyboardButton("🕘 История", callback_data="content_history_faq"),
         InlineKeyboardButton("🔙 Назад", callback_data="admin_back")
     )
     
@@ -374,8 +407,7 @@ async def edit_faq_callback(call: types.CallbackQuery, state: FSMContext):
     """Редактирование FAQ"""
     faq_id = call.data.replace("edit_faq_", "")
     
-    faq = content_manager.get_faq()
-    item = next((f for f in faq if f["id"] == faq_id), None)
+    item = content_manager.get_faq_item(faq_id)
     
     if not item:
         await call.answer("❌ Вопрос не найден")
@@ -481,8 +513,7 @@ async def delete_faq_confirm_callback(call: types.CallbackQuery, state: FSMConte
     data = await state.get_data()
     faq_id = data.get("current_faq_id")
     
-    faq = content_manager.get_faq()
-    item = next((f for f in faq if f["id"] == faq_id), None)
+    item = content_manager.get_faq_item(faq_id)
     
     keyboard = InlineKeyboardMarkup()
     keyboard.add(
@@ -519,6 +550,7 @@ async def contacts_menu(call: types.CallbackQuery):
         InlineKeyboardButton("✏️ Email", callback_data="edit_contact_email"),
         InlineKeyboardButton("✏️ Телефон", callback_data="edit_contact_phone"),
         InlineKeyboardButton("✏️ WhatsApp", callback_data="edit_contact_whatsapp"),
+        InlineKeyboardButton("🕘 История", callback_data="content_history_contacts"),
         InlineKeyboardButton("🔙 Назад", callback_data="admin_back")
     )
     
@@ -595,6 +627,7 @@ async def about_menu(call: types.CallbackQuery):
     keyboard = InlineKeyboardMarkup()
     keyboard.add(
         InlineKeyboardButton("✏️ Редактировать текст", callback_data="edit_about_text"),
+        InlineKeyboardButton("🕘 История", callback_data="content_history_about"),
         InlineKeyboardButton("🔙 Назад", callback_data="admin_back")
     )
     
@@ -631,6 +664,232 @@ async def process_edit_about_text(message: types.Message, state: FSMContext):
     await state.reset_state()
 
 
+# ==================== ИСТОРИЯ КОНТЕНТА ====================
+
+# Раздел контента -> (заголовок, callback меню раздела)
+CONTENT_SECTIONS = {
+    "portfolio": ("📦 Портфолио", "admin_portfolio_menu"),
+    "faq": ("❓ FAQ", "admin_faq_menu"),
+    "contacts": ("📞 Контакты", "admin_contacts_menu"),
+    "about": ("👤 О себе", "admin_about_menu"),
+}
+
+
+async def content_history_menu(call: types.CallbackQuery):
+    """История версий раздела контента с кнопками отката"""
+    if call.from_user.id != ADMIN_USER_ID:
+        await call.answer("❌ Доступ запрещён")
+        return
+    name = call.data[len("content_history_"):]
+    if name not in CONTENT_SECTIONS:
+        await call.answer("❌ Неизвестный раздел")
+        return
+    await _show_content_history(call.message, name)
+    await call.answer()
+
+
+async def _show_content_history(message: types.Message, name: str):
+    title, back = CONTENT_SECTIONS[name]
+    history = content_manager.get_history(name, ADMIN_HISTORY_LIMIT)
+    
+    keyboard = InlineKeyboardMarkup(row_width=1)
+    lines = []
+    for i, entry in enumerate(history):
+        when = datetime.fromisoformat(entry["ts"]).strftime("%d.%m %H:%M")
+        count = f", {entry['count']} шт." if entry.get("count") is not None else ""
+        lines.append(f"<b>v{entry['version']}</b> • {when} • {entry['note']}{count}" + (" — <i>текущая</i>" if i == 0 else ""))
+        if i > 0:
+            keyboard.add(InlineKeyboardButton(
+                f"↩️ Вернуть v{entry['version']} ({when})",
+                callback_data=f"content_rollback_{name}_{entry['version']}"
+            ))
+    keyboard.add(InlineKeyboardButton("🔙 Назад", callback_data=back))
+    
+    text = f"🕘 <b>ИСТОРИЯ: {title}</b>\n\n"
+    text += "\n".join(lines) if lines else "Изменений пока не было."
+    if len(history) > 1:
+        text += "\n\nОткат не удаляет версии — он сохраняется как новая версия."
+    await message.edit_text(text, reply_markup=keyboard, parse_mode="HTML")
+
+
+async def content_rollback_callback(call: types.CallbackQuery):
+    """Откат раздела контента к выбранной версии"""
+    if call.from_user.id != ADMIN_USER_ID:
+        await call.answer("❌ Доступ запрещён")
+        return
+    # content_rollback_{раздел}_{версия}
+    _, _, name, version = call.data.split("_", 3)
+    if name not in CONTENT_SECTIONS or not content_manager.rollback(name, int(version)):
+        await call.answer("❌ Не удалось вернуть версию", show_alert=True)
+        return
+    # Записываем сразу, чтобы откат появился в истории
+    await asyncio.get_running_loop().run_in_executor(None, content_manager.flush)
+    await call.answer(f"✅ Возвращена версия {version}")
+    await _show_content_history(call.message, name)
+
+
+# ==================== ЗАКАЗЫ ====================
+
+def format_ticket(ticket: dict) -> str:
+    """Карточка заказа для администратора"""
+    data = ticket.get("data", {})
+    return f"""📦 <b>Заказ <code>{ticket['order_id']}</code></b>
+
+<b>Статус:</b> {ticket['status']}{' (🗄 в архиве)' if is_ticket_archived(ticket['order_id']) else ''}
+<b>Создан:</b> {ticket['timestamp']}
+<b>User ID:</b> <code>{ticket['user_id']}</code>
+<b>ФИО:</b> {data.get('fio', '-')}
+<b>Контакты:</b> {data.get('contact', '-')}
+<b>Идея:</b> {data.get('idea', '-')}
+<b>Бюджет:</b> {data.get('budget', '-')}
+<b>Сроки:</b> {data.get('deadline', '-')}"""
+
+
+def get_ticket_keyboard(order_id: str) -> InlineKeyboardMarkup:
+    """Кнопки смены статуса заказа (архивные заказы не меняются)"""
+    keyboard = InlineKeyboardMarkup(row_width=2)
+    if not is_ticket_archived(order_id):
+        keyboard.add(*[
+            InlineKeyboardButton(f"➡️ {status}", callback_data=f"order_status_{i}_{order_id}")
+            for i, status in enumerate(TICKET_STATUSES)
+        ])
+    keyboard.add(InlineKeyboardButton("🔙 Главное меню", callback_data="admin_main_menu"))
+    return keyboard
+
+
+# Периоды списка заказов: ключ в callback_data -> (подпись, длительность)
+ORDER_PERIODS = {
+    "24h": ("за 24 часа", timedelta(days=1)),
+    "7d": ("за 7 дней", timedelta(days=7)),
+    "all": ("за всё время", None),
+}
+
+
+async def admin_orders_menu(call: types.CallbackQuery):
+    """Раздел «Заказы»: количество по статусам и переход к спискам"""
+    if call.from_user.id != ADMIN_USER_ID:
+        await call.answer("❌ Доступ запрещён")
+        return
+    
+    period = call.data.replace("admin_orders_menu", "").lstrip("_") or "24h"
+    if period not in ORDER_PERIODS:
+        period = "24h"
+    title, delta = ORDER_PERIODS[period]
+    counts = count_tickets_by_status(datetime.now() - delta if delta else None)
+    
+    keyboard = InlineKeyboardMarkup(row_width=2)
+    keyboard.add(*[
+        InlineKeyboardButton(f"{status} ({counts.get(status, 0)})", callback_data=f"admin_orders_{i}_{period}")
+        for i, status in enumerate(TICKET_STATUSES)
+    ])
+    keyboard.add(*[
+        InlineKeyboardButton(("• " if key == period else "") + label, callback_data=f"admin_orders_menu_{key}")
+        for key, (label, _) in ORDER_PERIODS.items()
+    ])
+    keyboard.add(InlineKeyboardButton("🔙 Главное меню", callback_data="admin_main_menu"))
+    
+    text = f"""📋 <b>ЗАКАЗЫ {title.upper()}</b>
+
+Всего: {sum(counts.values())}
+Выбери статус, чтобы увидеть последние заказы:"""
+    
+    await call.message.edit_text(text, reply_markup=keyboard, parse_mode="HTML")
+
+
+async def admin_orders_list(call: types.CallbackQuery):
+    """Последние заказы с выбранным статусом за период"""
+    if call.from_user.id != ADMIN_USER_ID:
+        await call.answer("❌ Доступ запрещён")
+        return
+    
+    status_index, period = call.data.replace("admin_orders_", "").split("_", 1)
+    status = TICKET_STATUSES[int(status_index)]
+    title, delta = ORDER_PERIODS.get(period, ORDER_PERIODS["all"])
+    tickets = query_tickets(status, since=datetime.now() - delta if delta else None, limit=ADMIN_ORDERS_LIMIT)
+    
+    keyboard = InlineKeyboardMarkup()
+    for ticket in tickets:
+        created = datetime.fromtimestamp(ticket.ts).strftime('%d.%m %H:%M')
+        keyboard.add(InlineKeyboardButton(
+            f"{created} · {ticket.order_id} · {ticket.data.get('fio', '-')}",
+            callback_data=f"order_open_{ticket.order_id}"
+        ))
+    keyboard.add(InlineKeyboardButton("🔙 Заказы", callback_data=f"admin_orders_menu_{period}"))
+    
+    if tickets:
+        text = f"📋 <b>Заказы «{status}» {title}</b>\n\nПоследние {len(tickets)}, сначала новые:"
+    else:
+        text = f"📋 Заказов «{status}» {title} нет"
+    await call.message.edit_text(text, reply_markup=keyboard, parse_mode="HTML")
+
+
+async def order_open_callback(call: types.CallbackQuery):
+    """Открыть карточку заказа из списка"""
+    if call.from_user.id != ADMIN_USER_ID:
+        await call.answer("❌ Доступ запрещён")
+        return
+    
+    order_id = call.data.replace("order_open_", "", 1)
+    ticket = get_ticket(order_id)
+    if not ticket:
+        await call.answer("❌ Заказ не найден")
+        return
+    await call.message.edit_text(format_ticket(ticket), reply_markup=get_ticket_keyboard(order_id), parse_mode="HTML")
+
+
+async def order_lookup_callback(call: types.CallbackQuery, state: FSMContext):
+    """Поиск заказа по номеру"""
+    if call.from_user.id != ADMIN_USER_ID:
+        await call.answer("❌ Доступ запрещён")
+        return
+    
+    await state.set_state(AdminOrders.lookup)
+    await call.message.edit_text("🔎 Отправь номер заказа:", reply_markup=None)
+
+
+async def process_order_lookup(message: types.Message, state: FSMContext):
+    """Показать найденный заказ"""
+    order_id = message.text.strip()
+    ticket = get_ticket(order_id)
+    
+    if ticket:
+        await message.answer(format_ticket(ticket), reply_markup=get_ticket_keyboard(order_id), parse_mode="HTML")
+    else:
+        keyboard = InlineKeyboardMarkup()
+        keyboard.add(InlineKeyboardButton("🔎 Искать ещё", callback_data="admin_order_lookup"))
+        await message.reply(f"❌ Заказ {order_id} не найден", reply_markup=keyboard)
+    
+    await state.reset_state()
+
+
+async def order_status_callback(call: types.CallbackQuery):
+    """Изменить статус заказа"""
+    if call.from_user.id != ADMIN_USER_ID:
+        await call.answer("❌ Доступ запрещён")
+        return
+    
+    status_index, order_id = call.data.replace("order_status_", "").split("_", 1)
+    status = TICKET_STATUSES[int(status_index)]
+    
+    if not set_ticket_status(order_id, status):
+        await call.answer("❌ Заказ не найден")
+        return
+    
+    ticket = get_ticket(order_id)
+    await call.message.edit_text(format_ticket(ticket), reply_markup=get_ticket_keyboard(order_id), parse_mode="HTML")
+    await call.answer(f"✅ Статус: {status}")
+    
+    # Уведомляем клиента
+    try:
+        await call.bot.send_message(
+            ticket["user_id"],
+            f"📦 Статус вашего заказа <code>{order_id}</code> изменён: <b>{status}</b>",
+            parse_mode="HTML"
+        )
+    except Exception as e:
+        logger.warning(f"Не удалось уведомить клиента о смене статуса: {e}")
+
+
 # ==================== СТАТИСТИКА ====================
 
 async def admin_stats(call: types.CallbackQuery):
@@ -722,6 +981,18 @@ def register_admin_handlers(dp: Dispatcher):
     dp.register_callback_query_handler(edit_about_text_callback, text="edit_about_text", state="*")
     dp.register_message_handler(process_edit_about_text, state=AdminAbout.edit_text)
     
+    # История контента
+    dp.register_callback_query_handler(content_history_menu, lambda c: c.data.startswith("content_history_"), state="*")
+    dp.register_callback_query_handler(content_rollback_callback, lambda c: c.data.startswith("content_rollback_"), state="*")
+    
+    # Заказы
+    dp.register_callback_query_handler(admin_orders_menu, lambda c: c.data.startswith("admin_orders_menu"), state="*")
+    dp.register_callback_query_handler(admin_orders_list, lambda c: c.data.startswith("admin_orders_") and c.data[13:14].isdigit(), state="*")
+    dp.register_callback_query_handler(order_open_callback, lambda c: c.data.startswith("order_open_"), state="*")
+    dp.register_callback_query_handler(order_lookup_callback, text="admin_order_lookup", state="*")
+    dp.register_message_handler(process_order_lookup, state=AdminOrders.lookup)
+    dp.register_callback_query_handler(order_status_callback, lambda c: c.data.startswith("order_status_"), state="*")
+    
     # Статистика
     dp.register_callback_query_handler(admin_stats, text="admin_stats", state="*")
     
@@ -0,0 +1,161 @@
+"""
+Модуль архива заказов
+Старые и завершённые заказы переносятся из таблицы tickets в неизменяемые
+сегменты: файл из сжатых zlib блоков (JSON-строки заказов, отсортированы
+по номеру) и разреженного индекса — первый номер заказа каждого блока.
+Сегменты читаются через mmap, в память попадает только нужный блок.
+
+Формат сегмента seg_NNNNNN.bin:
+    MAGIC | блок 1 | ... | блок N | индекс (JSON) | длина индекса (8 байт) | MAGIC
+"""
+
+import os
+import json
+import mmap
+import zlib
+import bisect
+import struct
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"CBMSEG1\n"
+_TRAILER = struct.Struct("<Q")
+
+
+class SegmentArchive:
+    """Набор неизменяемых сегментов архива в одной директории"""
+
+    def __init__(self, directory: str, block_size: int = 128, level: int = 6):
+        """
+        Инициализация архива
+
+        Args:
+            directory: Директория сегментов
+            block_size: Заказов в одном сжатом блоке (шаг разреженного индекса)
+            level: Уровень сжатия zlib
+        """
+        self.directory = directory
+        self.block_size = block_size
+        self.level = level
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self._lock = threading.Lock()
+        # Открытые сегменты: имя -> (mmap, первые номера блоков, [(смещение, длина)])
+        self._segments: Dict[str, Tuple[mmap.mmap, List[str], List[Tuple[int, int]]]] = {}
+
+    def segment_names(self) -> List[str]:
+        return sorted(name for name in os.listdir(self.directory)
+                      if name.startswith("seg_") and name.endswith(".bin"))
+
+    def _next_name(self) -> str:
+        names = self.segment_names()
+        number = int(names[-1][4:10]) + 1 if names else 1
+        return f"seg_{number:06d}.bin"
+
+    def write(self, tickets: List[dict]) -> str:
+        """
+        Записать заказы в новый сегмент (атомарно: временный файл + os.replace)
+
+        Args:
+            tickets: Заказы в виде словарей с полем order_id
+
+        Returns:
+            Имя сегмента
+        """
+        tickets = sorted(tickets, key=lambda t: str(t["order_id"]))
+        with self._lock:
+            name = self._next_name()
+            path = os.path.join(self.directory, name)
+            tmp_path = path + ".tmp"
+            index = []
+            with open(tmp_path, 'wb') as f:
+                f.write(MAGIC)
+                for start in range(0, len(tickets), self.block_size):
+                    block = tickets[start:start + self.block_size]
+                    raw = "".join(json.dumps(t, ensure_ascii=False) + "\n" for t in block).encode("utf-8")
+                    data = zlib.compress(raw, self.level)
+                    index.append([str(block[0]["order_id"]), f.tell(), len(data)])
+                    f.write(data)
+                footer = json.dumps({"blocks": index, "count": len(tickets)}, ensure_ascii=False).encode("utf-8")
+                f.write(footer)
+                f.write(_TRAILER.pack(len(footer)))
+                f.write(MAGIC)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        logger.info(f"Архив: сегмент {name}, заказов {len(tickets)}, блоков {len(index)}")
+        return name
+
+    def _open(self, name: str):
+        """Открыть сегмент через mmap и прочитать его индекс (один раз)"""
+        segment = self._segments.get(name)
+        if segment is not None:
+            return segment
+        with open(os.path.join(self.directory, name), 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if mm[:len(MAGIC)] != MAGIC or mm[-len(MAGIC):] != MAGIC:
+            mm.close()
+            raise ValueError(f"Повреждён сегмент архива: {name}")
+        end = len(mm) - len(MAGIC) - _TRAILER.size
+        (footer_len,) = _TRAILER.unpack(mm[end:end + _TRAILER.size])
+        footer = json.loads(mm[end - footer_len:end])
+        keys = [block[0] for block in footer["blocks"]]
+        spans = [(block[1], block[2]) for block in footer["blocks"]]
+        segment = self._segments[name] = (mm, keys, spans)
+        return segment
+
+    def _read_block(self, name: str, block: int) -> List[dict]:
+        mm, _, spans = self._open(name)
+        offset, length = spans[block]
+        raw = zlib.decompress(mm[offset:offset + length])
+        return [json.loads(line) for line in raw.decode("utf-8").splitlines()]
+
+    def get(self, name: str, order_id: str) -> Optional[dict]:
+        """Найти заказ в сегменте: бинарный поиск по индексу + один блок"""
+        order_id = str(order_id)
+        with self._lock:
+            _, keys, _ = self._open(name)
+            block = bisect.bisect_right(keys, order_id) - 1
+            if block < 0:
+                return None
+            for ticket in self._read_block(name, block):
+                if str(ticket["order_id"]) == order_id:
+                    return ticket
+        return None
+
+    def get_many(self, locations: List[Tuple[str, str]]) -> Dict[str, dict]:
+        """Прочитать несколько заказов [(сегмент, order_id)], каждый блок распаковывается один раз"""
+        wanted: Dict[Tuple[str, int], set] = {}
+        with self._lock:
+            for name, order_id in locations:
+                _, keys, _ = self._open(name)
+                block = bisect.bisect_right(keys, str(order_id)) - 1
+                if block >= 0:
+                    wanted.setdefault((name, block), set()).add(str(order_id))
+            result = {}
+            for (name, block), order_ids in wanted.items():
+                for ticket in self._read_block(name, block):
+                    if str(ticket["order_id"]) in order_ids:
+                        result[str(ticket["order_id"])] = ticket
+        return result
+
+    def iter_all(self):
+        """Все заказы архива (для бекапа)"""
+        for name in self.segment_names():
+            with self._lock:
+                _, keys, _ = self._open(name)
+                blocks = len(keys)
+            for block in range(blocks):
+                with self._lock:
+                    tickets = self._read_block(name, block)
+                yield from tickets
+
+    def close(self):
+        with self._lock:
+            for mm, _, _ in self._segments.values():
+                mm.close()
+            self._segments.clear()
@@ -1,8 +1,23 @@
 """
 Модуль для создания и восстановления бекапов данных бота
+
+Сведения о бекапах (размер, SHA-256, дата, количество записей) хранятся
+в backups/manifest.json: список бекапов читается из одного файла, а не из
+каждого архива. Манифест обновляется при создании и удалении бекапа и
+собирается заново по архивам, только если его нет (можно просто удалить
+файл, чтобы пересобрать).
+
+Бекапы образуют цепочки: полный бекап и инкрементальные после него, в
+которых только записи, изменённые с предыдущего бекапа цепочки. Номер
+в цепочке, полный бекап и предыдущий бекап записаны в metadata.json.
+Восстановление из инкрементального бекапа — это полный бекап цепочки
+и все инкрементальные после него по выбранный включительно.
 """
+import io
 import os
 import json
+import hashlib
+import threading
 import zipfile
 from datetime import datetime
 from typing import Optional, List, Dict
@@ -22,6 +37,10 @@ class BackupManager:
             backup_dir: Директория для хранения бекапов
         """
         self.backup_dir = backup_dir
+        self.manifest_path = os.path.join(backup_dir, "manifest.json")
+        self._manifest_lock = threading.RLock()
+        # Текущая цепочка: {"base", "last", "index", "watermark"} (None — следующий бекап полный)
+        self._chain = None
         self._ensure_backup_dir()
     
     def _ensure_backup_dir(self):
@@ -30,74 +49,223 @@ class BackupManager:
             os.makedirs(self.backup_dir)
             logger.info(f"Создана директория для бекапов: {self.backup_dir}")
     
-    def create_backup(self, data_dict: Dict[str, any]) -> Optional[str]:
+    # ==================== МАНИФЕСТ ====================
+    
+    @staticmethod
+    def _checksum(filepath: str) -> str:
+        """SHA-256 файла бекапа"""
+        sha = hashlib.sha256()
+        with open(filepath, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                sha.update(chunk)
+        return sha.hexdigest()
+    
+    def _describe(self, filepath: str, metadata: Optional[dict]) -> Dict[str, any]:
+        """Запись манифеста об архиве"""
+        return {
+            "size": os.path.getsize(filepath),
+            "sha256": self._checksum(filepath),
+            "metadata": metadata,
+        }
+    
+    def _rebuild_manifest(self) -> Dict[str, dict]:
+        """Собрать манифест по архивам в директории бекапов"""
+        entries = {}
+        for filename in os.listdir(self.backup_dir):
+            if not (filename.endswith('.zip') and filename.startswith('backup_')):
+                continue
+            filepath = os.path.join(self.backup_dir, filename)
+            
+            # Читаем метаданные из архива
+            metadata = None
+            try:
+                with zipfile.ZipFile(filepath, 'r') as zipf:
+                    if 'metadata.json' in zipf.namelist():
+                        with zipf.open('metadata.json') as f:
+                            metadata = json.load(f)
+            except Exception as e:
+                logger.warning(f"Не удалось прочитать метаданные из {filename}: {e}")
+            
+            entries[filename] = self._describe(filepath, metadata)
+        
+        self._save_manifest(entries)
+        logger.info(f"Манифест бекапов собран заново: {len(entries)} архивов")
+        return entries
+    
+    def _load_manifest(self) -> Dict[str, dict]:
+        """Манифест {имя файла: сведения} (собирается заново, если файла нет)"""
+        with self._manifest_lock:
+            try:
+                with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                    return json.load(f)["backups"]
+            except FileNotFoundError:
+                return self._rebuild_manifest()
+            except (ValueError, KeyError) as e:
+                logger.warning(f"Манифест бекапов повреждён ({e}), собираю заново")
+                return self._rebuild_manifest()
+    
+    def _save_manifest(self, entries: Dict[str, dict]):
+        """Атомарно записать манифест"""
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"backups": entries}, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.manifest_path)
+    
+    def _update_manifest(self, filename: str, entry: Optional[dict]):
+        """Добавить (entry) или удалить (None) запись манифеста"""
+        with self._manifest_lock:
+            entries = self._load_manifest()
+            if entry is None:
+                if entries.pop(filename, None) is None:
+                    return
+            else:
+                entries[filename] = entry
+            self._save_manifest(entries)
+    
+    # ==================== БЕКАПЫ ====================
+    
+    @staticmethod
+    def _records_count(data_dict: Dict[str, any]) -> Dict[str, int]:
+        return {
+            "tickets": len(data_dict.get("tickets", {})),
+            "referrals": len(data_dict.get("referrals", {})),
+            "bonuses": len(data_dict.get("bonuses", {})),
+            "reviews": len(data_dict.get("reviews", []))
+        }
+    
+    def _write_archive(self, suffix: str, data_dict: Dict[str, any], metadata: dict) -> str:
+        """
+        Записать архив бекапа и добавить его в манифест
+        
+        JSON пишется прямо в поток архива, без временных файлов. Архив
+        собирается под временным именем и переименовывается целиком, поэтому
+        недописанный бекап никогда не попадёт в список.
+        
+        Returns:
+            Путь к архиву
+        """
+        # Формируем имя файла с текущей датой и временем
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        backup_filename = f"backup_{timestamp}{suffix}.zip"
+        n = 1
+        while os.path.exists(os.path.join(self.backup_dir, backup_filename)):
+            n += 1
+            backup_filename = f"backup_{timestamp}{suffix}_{n}.zip"
+        backup_path = os.path.join(self.backup_dir, backup_filename)
+        tmp_path = backup_path + ".tmp"
+        
+        # Подготавливаем данные для сериализации
+        serializable_data = {key: value for key, value in data_dict.items() if value is not None}
+        
+        try:
+            with zipfile.ZipFile(tmp_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
+                for arcname, obj in (("data.json", serializable_data), ("metadata.json", metadata)):
+                    with zipf.open(arcname, 'w', force_zip64=True) as raw, \
+                            io.TextIOWrapper(raw, encoding='utf-8') as f:
+                        json.dump(obj, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, backup_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self._update_manifest(backup_filename, self._describe(backup_path, metadata))
+        return backup_path
+    
+    def create_backup(self, data_dict: Dict[str, any], watermark: dict = None) -> Optional[str]:
         """
-        Создает бекап данных в формате ZIP
+        Создает полный бекап данных в формате ZIP и начинает с него новую цепочку
+        
+        Метод блокирующий — в боте он вызывается в пуле потоков.
         
         Args:
             data_dict: Словарь с данными для бекапа
                 Ключи: "tickets", "referrals", "bonuses", "reviews"
+            watermark: Отметка состояния данных, от которой считать следующий
+                инкрементальный бекап (хранится до него, в архив не пишется)
         
         Returns:
             Путь к созданному бекапу или None в случае ошибки
         """
+        metadata = {
+            "created_at": datetime.now().isoformat(),
+            "backup_version": "1.0",
+            "type": "full",
+            "records_count": self._records_count(data_dict)
+        }
+        
         try:
-            # Формируем имя файла с текущей датой и временем
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            backup_filename = f"backup_{timestamp}.zip"
-            backup_path = os.path.join(self.backup_dir, backup_filename)
-            
-            # Создаем временный JSON файл с данными
-            temp_json = os.path.join(self.backup_dir, "temp_data.json")
-            
-            # Подготавливаем данные для сериализации
-            serializable_data = {}
-            for key, value in data_dict.items():
-                if value is not None:
-                    serializable_data[key] = value
-            
-            # Сохраняем в JSON
-            with open(temp_json, 'w', encoding='utf-8') as f:
-                json.dump(serializable_data, f, ensure_ascii=False, indent=2)
-            
-            # Создаем ZIP архив
-            with zipfile.ZipFile(backup_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                zipf.write(temp_json, arcname="data.json")
-                
-                # Добавляем метаданные
-                metadata = {
-                    "created_at": datetime.now().isoformat(),
-                    "backup_version": "1.0",
-                    "records_count": {
-                        "tickets": len(data_dict.get("tickets", {})),
-                        "referrals": len(data_dict.get("referrals", {})),
-                        "bonuses": len(data_dict.get("bonuses", {})),
-                        "reviews": len(data_dict.get("reviews", []))
-                    }
-                }
-                
-                metadata_json = os.path.join(self.backup_dir, "temp_metadata.json")
-                with open(metadata_json, 'w', encoding='utf-8') as f:
-                    json.dump(metadata, f, ensure_ascii=False, indent=2)
-                
-                zipf.write(metadata_json, arcname="metadata.json")
-                
-                # Удаляем временные файлы
-                os.remove(metadata_json)
-            
-            # Удаляем временный JSON
-            os.remove(temp_json)
-            
-            logger.info(f"Создан бекап: {backup_filename}")
-            return backup_path
-            
+            backup_path = self._write_archive("", data_dict, metadata)
         except Exception as e:
             logger.error(f"Ошибка при создании бекапа: {e}")
+            self._chain = None
+            return None
+        
+        backup_filename = os.path.basename(backup_path)
+        self._chain = {"base": backup_filename, "last": backup_filename, "index": 0, "watermark": watermark}
+        logger.info(f"Создан бекап: {backup_filename}")
+        return backup_path
+    
+    def create_incremental_backup(self, changes: Dict[str, any], watermark: dict = None) -> Optional[str]:
+        """
+        Создает инкрементальный бекап: изменения после предыдущего бекапа цепочки
+        
+        Args:
+            changes: Изменённые записи (заказы — новые версии, deleted_orders —
+                номера убранных заказов, referrals — полные списки изменившихся
+                пригласивших, bonus_ledger — новые операции, reviews — только
+                если отзывы менялись)
+            watermark: Отметка для следующего инкрементального бекапа
+        
+        Returns:
+            Путь к созданному бекапу или None (нет цепочки или ошибка)
+        """
+        chain = self._chain
+        if chain is None:
+            logger.error("Нет полного бекапа, от которого строить инкрементальный")
+            return None
+        
+        metadata = {
+            "created_at": datetime.now().isoformat(),
+            "backup_version": "1.0",
+            "type": "incremental",
+            "base": chain["base"],
+            "parent": chain["last"],
+            "index": chain["index"] + 1,
+            "records_count": self._records_count(changes)
+        }
+        
+        try:
+            backup_path = self._write_archive("_inc", changes, metadata)
+        except Exception as e:
+            # Изменения уже забраны у источников — следующий бекап должен быть полным
+            logger.error(f"Ошибка при создании инкрементального бекапа: {e}")
+            self._chain = None
             return None
+        
+        backup_filename = os.path.basename(backup_path)
+        self._chain = {"base": chain["base"], "last": backup_filename,
+                       "index": metadata["index"], "watermark": watermark}
+        logger.info(f"Создан инкрементальный бекап: {backup_filename}")
+        return backup_path
+    
+    @property
+    def chain_watermark(self) -> Optional[dict]:
+        """Отметка последнего бекапа цепочки (None — цепочки нет, нужен полный бекап)"""
+        return self._chain["watermark"] if self._chain else None
+    
+    @property
+    def chain_length(self) -> int:
+        """Сколько инкрементальных бекапов в текущей цепочке"""
+        return self._chain["index"] if self._chain else 0
+    
+    def reset_chain(self):
+        """Следующий бекап будет полным (например, после восстановления данных)"""
+        self._chain = None
     
     def list_backups(self) -> List[Dict[str, any]]:
         """
-        Возвращает список всех доступных бекапов
+        Возвращает список всех доступных бекапов (из манифеста)
         
         Returns:
             Список словарей с информацией о бекапах
@@ -105,32 +273,14 @@ class BackupManager:
         backups = []
         
         try:
-            for filename in os.listdir(self.backup_dir):
-                if filename.endswith('.zip') and filename.startswith('backup_'):
-                    filepath = os.path.join(self.backup_dir, filename)
-                    
-                    # Получаем размер файла
-                    size_bytes = os.path.getsize(filepath)
-                    size_kb = round(size_bytes / 1024, 2)
-                    
-                    # Читаем метаданные из архива
-                    metadata = None
-                    try:
-                        with zipfile.ZipFile(filepath, 'r') as zipf:
-                            if 'metadata.json' in zipf.namelist():
-                                with zipf.open('metadata.json') as f:
-                                    metadata = json.load(f)
-                    except Exception as e:
-                        logger.warning(f"Не удалось прочитать метаданные из {filename}: {e}")
-                    
-                    backup_info = {
-                        "filename": filename,
-                        "filepath": filepath,
-                        "size_kb": size_kb,
-                        "metadata": metadata
-                    }
-                    
-                    backups.append(backup_info)
+            for filename, entry in self._load_manifest().items():
+                backups.append({
+                    "filename": filename,
+                    "filepath": os.path.join(self.backup_dir, filename),
+                    "size_kb": round(entry["size"] / 1024, 2),
+                    "sha256": entry.get("sha256"),
+                    "metadata": entry.get("metadata")
+                })
             
             # Сортируем по имени файла (по дате создания)
             backups.sort(key=lambda x: x['filename'], reverse=True)
@@ -140,10 +290,47 @@ class BackupManager:
         
         return backups
     
+    def _read_data(self, backup_path: str, entry: Optional[dict]) -> dict:
+        """Прочитать data.json из архива (с проверкой контрольной суммы по манифесту)"""
+        if entry and entry.get("sha256") and entry["sha256"] != self._checksum(backup_path):
+            raise ValueError(f"Контрольная сумма бекапа не совпадает: {backup_path}")
+        with zipfile.ZipFile(backup_path, 'r') as zipf:
+            with zipf.open('data.json') as f:
+                return json.load(f)
+    
+    @staticmethod
+    def _apply_changes(data: dict, changes: dict):
+        """Наложить инкрементальный бекап на собранные данные"""
+        tickets = data.setdefault("tickets", {})
+        changed = {order_id for user_tickets in changes.get("tickets", {}).values() for order_id in user_tickets}
+        removed = changed | set(changes.get("deleted_orders", []))
+        if removed:
+            for user_id in list(tickets):
+                user_tickets = tickets[user_id]
+                for order_id in [o for o in user_tickets if o in removed]:
+                    del user_tickets[order_id]
+                if not user_tickets:
+                    del tickets[user_id]
+        for user_id, user_tickets in changes.get("tickets", {}).items():
+            tickets.setdefault(user_id, {}).update(user_tickets)
+        
+        if changes.get("archived_tickets"):
+            archived = {t["order_id"]: t for t in data.get("archived_tickets", [])}
+            archived.update((t["order_id"], t) for t in changes["archived_tickets"])
+            data["archived_tickets"] = list(archived.values())
+        
+        data.setdefault("referrals", {}).update(changes.get("referrals", {}))
+        data.setdefault("bonus_ledger", []).extend(changes.get("bonus_ledger", []))
+        if "reviews" in changes:
+            data["reviews"] = changes["reviews"]
+    
     def restore_backup(self, backup_path: str) -> Optional[Dict[str, any]]:
         """
         Восстанавливает данные из бекапа
         
+        Для инкрементального бекапа данные собираются из полного бекапа
+        цепочки и всех инкрементальных после него по указанный.
+        
         Args:
             backup_path: Путь к файлу бекапа
         
@@ -155,13 +342,38 @@ class BackupManager:
                 logger.error(f"Файл бекапа не найден: {backup_path}")
                 return None
             
-            with zipfile.ZipFile(backup_path, 'r') as zipf:
-                # Читаем данные
-                with zipf.open('data.json') as f:
-                    data = json.load(f)
-                
+            manifest = self._load_manifest()
+            entry = manifest.get(os.path.basename(backup_path))
+            metadata = (entry or {}).get("metadata") or {}
+            
+            if metadata.get("type") != "incremental":
+                data = self._read_data(backup_path, entry)
                 logger.info(f"Бекап восстановлен из {backup_path}")
                 return data
+            
+            # Цепочка: полный бекап (номер 0) и инкрементальные 1..index
+            links = {0: metadata["base"]}
+            for filename, item in manifest.items():
+                meta = item.get("metadata") or {}
+                if meta.get("type") == "incremental" and meta.get("base") == metadata["base"] \
+                        and meta["index"] <= metadata["index"]:
+                    links[meta["index"]] = filename
+            missing = [i for i in range(metadata["index"] + 1) if i not in links or links[i] not in manifest]
+            if missing:
+                logger.error(f"Цепочка бекапа {backup_path} неполная, нет звеньев: {missing}")
+                return None
+            
+            data = None
+            for index in range(metadata["index"] + 1):
+                path = os.path.join(self.backup_dir, links[index])
+                part = self._read_data(path, manifest[links[index]])
+                if data is None:
+                    data = part
+                else:
+                    self._apply_changes(data, part)
+            
+            logger.info(f"Бекап восстановлен из {backup_path} (цепочка из {metadata['index'] + 1} архивов)")
+            return data
                 
         except Exception as e:
             logger.error(f"Ошибка при восстановлении бекапа: {e}")
@@ -180,9 +392,12 @@ class BackupManager:
         try:
             if os.path.exists(backup_path):
                 os.remove(backup_path)
+                self._update_manifest(os.path.basename(backup_path), None)
                 logger.info(f"Бекап удален: {backup_path}")
                 return True
             else:
+                # Файл удалили вручную — убираем и запись манифеста
+                self._update_manifest(os.path.basename(backup_path), None)
                 logger.warning(f"Файл бекапа не найден: {backup_path}")
                 return False
         except Exception as e:
@@ -191,16 +406,25 @@ class BackupManager:
     
     def cleanup_old_backups(self, keep_count: int = 10):
         """
-        Удаляет старые бекапы, оставляя только последние N
+        Удаляет старые бекапы, оставляя только последние N полных
+        
+        Инкрементальные бекапы удаляются вместе со своим полным бекапом,
+        поэтому оставшиеся цепочки всегда можно восстановить.
         
         Args:
-            keep_count: Количество последних бекапов для сохранения
+            keep_count: Количество последних полных бекапов для сохранения
         """
         try:
             backups = self.list_backups()
             
-            if len(backups) > keep_count:
-                backups_to_delete = backups[keep_count:]
+            def base_of(backup):
+                metadata = backup.get('metadata') or {}
+                return metadata.get('base') if metadata.get('type') == 'incremental' else backup['filename']
+            
+            full = [b['filename'] for b in backups if base_of(b) == b['filename']]
+            if len(full) > keep_count:
+                keep = set(full[:keep_count])
+                backups_to_delete = [b for b in backups if base_of(b) not in keep]
                 
                 for backup in backups_to_delete:
                     self.delete_backup(backup['filepath'])
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк хранилищ storage.py (memory / sqlite / jsonl)
+Замеряет вставку, поиск по ключу, выборку по диапазону времени и
+холодный старт (открытие хранилища с данными) на синтетических заказах и отзывах
+
+Запуск:
+    python bench_storage.py                          # 10 000 записей
+    python bench_storage.py --counts 10000 100000    # свои объёмы
+    python bench_storage.py --backends sqlite jsonl  # только часть хранилищ
+"""
+
+import time
+import random
+import shutil
+import argparse
+import tempfile
+from datetime import datetime
+
+from storage import BACKENDS
+from bench_tickets import make_payload
+
+BASE_TS = int(datetime(2026, 1, 1).timestamp())
+STEP = 60  # секунд между записями
+
+
+def make_order(i: int) -> dict:
+    """Заказ в том виде, в каком его сохраняет бот"""
+    return {
+        "order_id": f"{i:08x}",
+        "user_id": 100000000 + i % 5000,
+        "status": "новый" if i % 3 else "в работе",
+        "data": make_payload(i),
+    }
+
+
+def make_review(i: int) -> dict:
+    """Отзыв в том виде, в каком он хранится в REVIEWS"""
+    return {
+        "id": f"rev_{i}",
+        "author": f"Клиент {i}",
+        "rating": 5 - i % 3,
+        "text": f"Спасибо за бота №{i}! Всё работает быстро, поддержка отвечает в течение часа.",
+        "date": datetime.fromtimestamp(BASE_TS + i * STEP).isoformat(),
+    }
+
+
+DATASETS = {
+    "orders": (make_order, lambda r: r["order_id"]),
+    "reviews": (make_review, lambda r: r["id"]),
+}
+
+
+def timed(func) -> float:
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def bench(backend: str, dataset: str, count: int, lookups: int, ranges: int) -> dict:
+    """Замерить одно хранилище на одном наборе данных"""
+    make, key_of = DATASETS[dataset]
+    records = [make(i) for i in range(count)]
+    directory = tempfile.mkdtemp()
+    try:
+        store = BACKENDS[backend](dataset, directory)
+
+        def insert():
+            for i, record in enumerate(records):
+                store.put(key_of(record), record, BASE_TS + i * STEP)
+        insert_s = timed(insert)
+
+        keys = [key_of(random.choice(records)) for _ in range(lookups)]
+        lookup_s = timed(lambda: [store.get(key) for key in keys])
+
+        # Окно в сутки, последние 20 записей — как список заказов в админке
+        windows = [BASE_TS + random.randrange(count) * STEP for _ in range(ranges)]
+        range_s = timed(lambda: [store.range(ts, ts + 86400, limit=20, newest_first=True) for ts in windows])
+
+        cold_ms = None
+        if backend != "memory":
+            store.close()
+            start = time.perf_counter()
+            store = BACKENDS[backend](dataset, directory)
+            store.get(keys[0])
+            cold_ms = (time.perf_counter() - start) * 1000
+            assert len(store) == count
+        store.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    return {
+        "backend": backend,
+        "dataset": dataset,
+        "count": count,
+        "insert_us": insert_s / count * 1e6,
+        "lookup_us": lookup_s / lookups * 1e6,
+        "range_us": range_s / ranges * 1e6,
+        "cold_ms": cold_ms,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк хранилищ storage.py")
+    parser.add_argument("--counts", type=int, nargs="+", default=[10000])
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=list(BACKENDS))
+    parser.add_argument("--datasets", nargs="+", default=list(DATASETS), choices=list(DATASETS))
+    parser.add_argument("--lookups", type=int, default=20000)
+    parser.add_argument("--ranges", type=int, default=2000)
+    args = parser.parse_args()
+
+    print("=" * 78)
+    print("📊 Бенчмарк хранилищ: вставка, поиск, диапазон, холодный старт")
+    print("=" * 78)
+    print(f"{'Хранилище':<10}{'Данные':<9}{'Записей':>9}{'Вставка, мкс':>14}"
+          f"{'Поиск, мкс':>12}{'Диапазон, мкс':>15}{'Старт, мс':>11}")
+
+    for count in args.counts:
+        for dataset in args.datasets:
+            for backend in args.backends:
+                r = bench(backend, dataset, count, args.lookups, args.ranges)
+                cold = f"{r['cold_ms']:.1f}" if r["cold_ms"] is not None else "—"
+                print(f"{r['backend']:<10}{r['dataset']:<9}{r['count']:>9}{r['insert_us']:>14.1f}"
+                      f"{r['lookup_us']:>12.1f}{r['range_us']:>15.1f}{cold:>11}")
+
+
+if __name__ == "__main__":
+    main()
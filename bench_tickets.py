@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк памяти и скорости поиска заказов
+Сравнивает старую раскладку TICKETS_DB (словарь словарей с анкетой и
+ISO-временем) с компактной записью ticket.Ticket
+
+Запуск:
+    python bench_tickets.py                       # 100 000 и 1 000 000 заказов
+    python bench_tickets.py --counts 10000 50000  # свои объёмы
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import subprocess
+from datetime import datetime
+
+LAYOUTS = ("dict", "ticket")
+USERS_RATIO = 5  # в среднем заказов на пользователя
+
+
+def get_rss_kb() -> int:
+    """Текущий RSS процесса в КБ"""
+    try:
+        with open("/proc/self/status", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def make_payload(i: int) -> dict:
+    """Анкета заказа в том виде, в каком её сохраняет FSM"""
+    return {
+        "fio": f"Иванов Иван Иванович {i}",
+        "contact": f"+7 900 {i:07d}",
+        "idea": f"Бот для приёма заказов в магазине №{i}, с оплатой и уведомлениями",
+        "type_bot": "магазин",
+        "budget": f"{10000 + i % 50000} руб.",
+        "deadline": "2 недели",
+        "options": "оплата, админка",
+        "settings": "нет",
+        "file": None,
+        "hosting": "Мой сервер (аренда)",
+        "use_bonus": False,
+        "bonus_amount": 0,
+    }
+
+
+def build(layout: str, count: int):
+    """Построить хранилище из count заказов, вернуть (хранилище, ключи для поиска)"""
+    from ticket import Ticket
+
+    users = max(count // USERS_RATIO, 1)
+    base_ts = int(datetime(2026, 1, 1).timestamp())
+    keys = []
+    if layout == "dict":
+        db = {}
+        for i in range(count):
+            user_id = 100000000 + i % users
+            order_id = f"{i:08x}"
+            db.setdefault(user_id, {})[order_id] = {
+                "order_id": order_id,
+                "user_id": user_id,
+                "timestamp": datetime.fromtimestamp(base_ts + i).isoformat(),
+                "status": "новый" if i % 3 else "в работе",
+                "data": make_payload(i),
+            }
+            keys.append((user_id, order_id))
+    else:
+        db = {}
+        for i in range(count):
+            user_id = 100000000 + i % users
+            order_id = f"{i:08x}"
+            # Так запись приходит из SQLite: анкета ещё не разобрана
+            payload = json.dumps(make_payload(i), ensure_ascii=False).encode("utf-8")
+            db[order_id] = Ticket(order_id, user_id, "новый" if i % 3 else "в работе", base_ts + i, payload)
+            keys.append((user_id, order_id))
+    return db, keys
+
+
+def measure(layout: str, count: int, lookups: int) -> dict:
+    """Замер в текущем процессе (вызывается в дочернем процессе)"""
+    rss_before = get_rss_kb()
+    db, keys = build(layout, count)
+    rss_after = get_rss_kb()
+
+    sample = [random.choice(keys) for _ in range(lookups)]
+    start = time.perf_counter()
+    if layout == "dict":
+        for user_id, order_id in sample:
+            db[user_id][order_id]["status"]
+    else:
+        for user_id, order_id in sample:
+            db[order_id].status
+    elapsed = time.perf_counter() - start
+
+    return {
+        "layout": layout,
+        "count": count,
+        "rss_mb": round((rss_after - rss_before) / 1024, 1),
+        "bytes_per_ticket": round((rss_after - rss_before) * 1024 / count),
+        "lookup_ns": round(elapsed / lookups * 1e9),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк раскладки заказов в памяти")
+    parser.add_argument("--counts", type=int, nargs="+", default=[100000, 1000000])
+    parser.add_argument("--lookups", type=int, default=200000)
+    parser.add_argument("--child", nargs=2, metavar=("LAYOUT", "COUNT"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        result = measure(args.child[0], int(args.child[1]), args.lookups)
+        print(json.dumps(result))
+        return
+
+    print("=" * 64)
+    print("📊 Бенчмарк заказов: словарь словарей vs ticket.Ticket")
+    print("=" * 64)
+    print(f"{'Раскладка':<10}{'Заказов':>12}{'RSS, МБ':>12}{'Байт/заказ':>14}{'Поиск, нс':>14}")
+
+    for count in args.counts:
+        for layout in LAYOUTS:
+            # Каждый замер — в отдельном процессе, чтобы RSS не смешивался
+            output = subprocess.check_output(
+                [sys.executable, os.path.abspath(__file__), "--child", layout, str(count),
+                 "--lookups", str(args.lookups)],
+                cwd=os.path.dirname(os.path.abspath(__file__)),
+            )
+            r = json.loads(output.decode().strip().splitlines()[-1])
+            print(f"{r['layout']:<10}{r['count']:>12}{r['rss_mb']:>12}{r['bytes_per_ticket']:>14}{r['lookup_ns']:>14}")
+
+
+if __name__ == "__main__":
+    main()
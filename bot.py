@@ -8,6 +8,7 @@ import os
 from datetime import datetime, timedelta
 from aiogram import Bot, Dispatcher, types
 from aiogram.utils import executor
+from aiogram.utils.exceptions import MessageNotModified
 from aiogram.contrib.fsm_storage.memory import MemoryStorage
 from aiogram.dispatcher import FSMContext
 from aiogram.dispatcher.filters.state import State, StatesGroup
@@ -18,12 +19,22 @@ from menu import main_menu
 from states import OrderForm, SupportChat, AdminReply
 from faq import FAQ_LIST
 from portfolio import PORTFOLIO
-from reviews import REVIEWS, PENDING_REVIEWS, get_rating_stars
+from reviews import (REVIEWS, PENDING_REVIEWS, get_rating_stars, add_pending_review,
+                     take_pending_review, publish_review, replace_reviews, get_reviews_version,
+                     new_review_id)
 from calc import calculate_price
-from data import save_ticket, get_ticket_status, TICKETS_DB, REFERRALS_DB, BONUSES_DB
+from data import (save_ticket, get_ticket_status, get_ticket_page, get_archived_page, get_ticket,
+                  archive_tickets, BONUSES_DB,
+                  add_referral, add_bonus, spend_bonus, get_bonus_history, user_lock,
+                  get_referral_count, export_memory_state, export_memory_changes, export_stored_changes,
+                  restore_state, sync_journal, snapshot_state)
+from sheets import USE_GSHEET, sheets_queue, sheets_sync
 from backup import BackupManager
 from content_manager import content_manager
-from admin_panel import register_admin_handlers
+from render_cache import render_cache
+from media import media_cache, MEDIA_GROUP_LIMIT
+from faq_search import search_faq
+from admin_panel import register_admin_handlers, format_ticket, get_ticket_keyboard
 
 # Значения по умолчанию для параметров бекапа (если не определены в config.py)
 try:
@@ -46,6 +57,36 @@ try:
 except NameError:
     BACKUP_KEEP_COUNT = 10
 
+try:
+    BACKUP_INCREMENTAL_HOURS
+except NameError:
+    BACKUP_INCREMENTAL_HOURS = 1  # 0 — без инкрементальных бекапов
+
+try:
+    BONUS_PER_REFERRAL
+except NameError:
+    BONUS_PER_REFERRAL = 100  # руб. за каждого приглашённого
+
+try:
+    ORDERS_PAGE_SIZE
+except NameError:
+    ORDERS_PAGE_SIZE = 5  # заказов на странице «📦 Статус заказа»
+
+try:
+    BONUS_HISTORY_LIMIT
+except NameError:
+    BONUS_HISTORY_LIMIT = 30  # операций в /bonus_history
+
+try:
+    ARCHIVE_INTERVAL_HOURS
+except NameError:
+    ARCHIVE_INTERVAL_HOURS = 24  # как часто переносить старые заказы в архив
+
+try:
+    JOURNAL_FSYNC_INTERVAL
+except NameError:
+    JOURNAL_FSYNC_INTERVAL = 1  # секунд
+
 # Настройка логирования (красивый формат)
 LOG_FORMAT = "%(asctime)s | %(levelname)s | %(name)s | %(message)s"
 logging.basicConfig(level=logging.INFO, format=LOG_FORMAT, datefmt="%Y-%m-%d %H:%M:%S")
@@ -74,22 +115,26 @@ REVIEWS_TEXT = "⭐ Отзывы"
 BONUS_TEXT = "🎁 Бонусы и рефералы"
 
 
+# Клавиатуры без данных собираются один раз — get_*_keyboard возвращают общий экземпляр
+_BACK_KEYBOARD = ReplyKeyboardMarkup(resize_keyboard=True)
+_BACK_KEYBOARD.add(KeyboardButton(BACK_TEXT), KeyboardButton(MENU_TEXT))
+
+_MAIN_INLINE_KEYBOARD = InlineKeyboardMarkup(row_width=2)
+_MAIN_INLINE_KEYBOARD.add(
+    InlineKeyboardButton("📝 Заказать", callback_data="menu_order"),
+    InlineKeyboardButton("💼 Портфолио", callback_data="menu_portfolio"),
+    InlineKeyboardButton("❓ FAQ", callback_data="menu_faq"),
+    InlineKeyboardButton("🧮 Калькулятор", callback_data="menu_calc"),
+    InlineKeyboardButton("📞 Связаться", callback_data="menu_contact"),
+)
+
+
 def get_back_keyboard() -> ReplyKeyboardMarkup:
-    kb = ReplyKeyboardMarkup(resize_keyboard=True)
-    kb.add(KeyboardButton(BACK_TEXT), KeyboardButton(MENU_TEXT))
-    return kb
+    return _BACK_KEYBOARD
 
 
 def get_main_inline_keyboard() -> InlineKeyboardMarkup:
-    kb = InlineKeyboardMarkup(row_width=2)
-    kb.add(
-        InlineKeyboardButton("📝 Заказать", callback_data="menu_order"),
-        InlineKeyboardButton("💼 Портфолио", callback_data="menu_portfolio"),
-        InlineKeyboardButton("❓ FAQ", callback_data="menu_faq"),
-        InlineKeyboardButton("🧮 Калькулятор", callback_data="menu_calc"),
-        InlineKeyboardButton("📞 Связаться", callback_data="menu_contact"),
-    )
-    return kb
+    return _MAIN_INLINE_KEYBOARD
 
 
 def get_bot_intro_text() -> str:
@@ -137,8 +182,11 @@ async def send_welcome(message: types.Message):
         try:
             ref_id = int(args[3:])
             if ref_id != user_id:
-                REFERRALS_DB.setdefault(ref_id, []).append(user_id)
-                BONUSES_DB[ref_id] = BONUSES_DB.get(ref_id, 0) + 100  # 100 руб. бонус
+                # Бонус начисляется только за первое приглашение пользователя;
+                # повторное начисление исключает ключ идемпотентности
+                if add_referral(ref_id, user_id):
+                    add_bonus(ref_id, BONUS_PER_REFERRAL, f"Приглашение {user_id}",
+                              key=f"referral:{user_id}")
         except ValueError:
             pass
     
@@ -185,26 +233,127 @@ async def handle_inline_menu(callback_query: types.CallbackQuery):
 
 @dp.message_handler(lambda m: m.text == PORTFOLIO_TEXT)
 async def handle_portfolio(message: types.Message):
-    """Показ портфолио с кнопками для просмотра кейсов"""
+    """Показ портфолио: одно сообщение-карусель, кейсы листаются на месте"""
     portfolio = content_manager.get_portfolio()
     if not portfolio:
         await message.answer("❌ Портфолио пусто", reply_markup=get_back_keyboard())
         return
     
-    for case in portfolio:
+    text, kb = _render_portfolio_card(portfolio[0]["id"])
+    await message.answer(text, parse_mode="HTML", reply_markup=kb)
+
+
+@dp.callback_query_handler(lambda c: c.data and c.data.startswith("portfolio_"))
+async def portfolio_carousel_callback(callback_query: types.CallbackQuery):
+    """Листание карусели портфолио: сообщение редактируется на месте"""
+    # portfolio_{show|details}_{id кейса}
+    _, action, case_id = callback_query.data.split("_", 2)
+    if content_manager.get_portfolio_position(case_id) is None:
+        # Кейс удалён, пока сообщение висело в чате — показываем первый
+        portfolio = content_manager.get_portfolio()
+        if not portfolio:
+            await callback_query.message.edit_text("❌ Портфолио пусто")
+            await callback_query.answer()
+            return
+        action, case_id = "show", portfolio[0]["id"]
+    
+    if action == "details":
+        text, kb = _render_portfolio_details(case_id)
+    else:
+        text, kb = _render_portfolio_card(case_id)
+    try:
+        await callback_query.message.edit_text(text, parse_mode="HTML", reply_markup=kb)
+    except MessageNotModified:
+        pass
+    await callback_query.answer()
+    
+    if action == "details":
+        await _send_case_media(callback_query.message.chat.id, case_id)
+
+
+async def _send_case_media(chat_id: int, case_id: str):
+    """Отправить картинки и видео кейса: уже загруженные — по file_id, несколько — одной медиагруппой"""
+    loop = asyncio.get_event_loop()
+    items = []
+    for kind, path in content_manager.get_portfolio_media(case_id):
+        # Хэш большого видео считается в пуле потоков, чтобы не блокировать бота
+        digest = await loop.run_in_executor(None, media_cache.digest, path)
+        if digest is None:
+            logging.warning(f"Файл медиа кейса {case_id} не найден: {path}")
+            continue
+        file_id = media_cache.get_file_id(digest)
+        items.append((kind, digest, file_id or types.InputFile(path)))
+    
+    for start in range(0, len(items), MEDIA_GROUP_LIMIT):
+        chunk = items[start:start + MEDIA_GROUP_LIMIT]
+        try:
+            if len(chunk) == 1:
+                kind, _, media = chunk[0]
+                send = bot.send_photo if kind == "photo" else bot.send_video
+                messages = [await send(chat_id, media)]
+            else:
+                messages = await bot.send_media_group(chat_id, [
+                    types.InputMediaPhoto(media) if kind == "photo" else types.InputMediaVideo(media)
+                    for kind, _, media in chunk
+                ])
+        except Exception as e:
+            logging.error(f"Не удалось отправить медиа кейса {case_id}: {e}")
+            # Сохранённый file_id мог устареть — в следующий раз файл загрузится заново
+            for _, digest, media in chunk:
+                if isinstance(media, str):
+                    media_cache.forget(digest)
+            return
+        
+        for (kind, digest, _), sent in zip(chunk, messages):
+            if sent.photo:
+                media_cache.remember(digest, sent.photo[-1].file_id, kind)
+            elif sent.video:
+                media_cache.remember(digest, sent.video.file_id, kind)
+
+
+def _render_portfolio_card(case_id: str):
+    """Карточка кейса K из N с кнопками листания (кэшируется до изменения портфолио)"""
+    version = content_manager.get_version(content_manager.portfolio_file)
+    
+    def build():
+        portfolio = content_manager.get_portfolio()
+        position = content_manager.get_portfolio_position(case_id)
+        case = portfolio[position]
+        text = f"<b>{case['title']}</b>\n{case['desc']}\n\n<i>Кейс {position + 1} из {len(portfolio)}</i>"
+        kb = InlineKeyboardMarkup()
+        if len(portfolio) > 1:
+            prev_id = portfolio[position - 1]["id"]
+            next_id = portfolio[(position + 1) % len(portfolio)]["id"]
+            kb.row(
+                InlineKeyboardButton("⬅️", callback_data=f"portfolio_show_{prev_id}"),
+                InlineKeyboardButton("➡️", callback_data=f"portfolio_show_{next_id}"),
+            )
+        kb.add(InlineKeyboardButton("🔍 Подробнее", callback_data=f"portfolio_details_{case_id}"))
+        return text, kb
+    
+    return render_cache.get(f"portfolio_card_{case_id}", version, build)
+
+
+def _render_portfolio_details(case_id: str):
+    """Подробности кейса с возвратом к карточке"""
+    version = content_manager.get_version(content_manager.portfolio_file)
+    
+    def build():
+        case = content_manager.get_portfolio_case(case_id)
         kb = InlineKeyboardMarkup().add(
-            InlineKeyboardButton("Посмотреть кейс", callback_data=f"case_{case['id']}")
+            InlineKeyboardButton("⬅️ К кейсам", callback_data=f"portfolio_show_{case_id}")
         )
-        text = f"<b>{case['title']}</b>\n{case['desc']}"
-        await message.answer(text, parse_mode="HTML", reply_markup=kb)
-    await message.answer("Выберите кейс или вернитесь в меню.", reply_markup=get_back_keyboard())
+        return f"<b>{case['title']}</b>\n{case['details']}", kb
+    
+    return render_cache.get(f"portfolio_details_{case_id}", version, build)
+
 
 @dp.callback_query_handler(lambda c: c.data and c.data.startswith("case_"))
 async def show_case_details(callback_query: types.CallbackQuery):
-    """Показ подробностей кейса"""
-    case_id = callback_query.data.split('_')[1]
-    portfolio = content_manager.get_portfolio()
-    case = next((c for c in portfolio if c['id'] == case_id), None)
+    """Показ подробностей кейса (кнопки сообщений, отправленных до карусели)"""
+    # callback_data = "case_" + id кейса (сам id тоже вида "case_1")
+    case_id = callback_query.data[len("case_"):]
+    case = content_manager.get_portfolio_case(case_id)
     if case:
         await callback_query.message.answer(
             f"<b>{case['title']}</b>\n{case['details']}", 
@@ -217,14 +366,18 @@ async def show_case_details(callback_query: types.CallbackQuery):
 async def handle_faq(message: types.Message):
     """Показ часто задаваемых вопросов"""
     faq = content_manager.get_faq()
+    text = render_cache.get("faq", content_manager.get_version(content_manager.faq_file),
+                            lambda: _render_faq(faq))
+    await message.answer(text, parse_mode="HTML", reply_markup=get_back_keyboard())
+
+
+def _render_faq(faq: list) -> str:
     if not faq:
-        await message.answer("❌ FAQ пусто", reply_markup=get_back_keyboard())
-        return
-    
-    text = "<b>FAQ — Часто задаваемые вопросы:</b>\n"
+        return "❌ FAQ пусто"
+    parts = ["<b>FAQ — Часто задаваемые вопросы:</b>\n"]
     for item in faq:
-        text += f"\n<b>Q:</b> {item['q']}\n<b>A:</b> {item['a']}\n"
-    await message.answer(text, parse_mode="HTML", reply_markup=get_back_keyboard())
+        parts.append(f"\n<b>Q:</b> {item['q']}\n<b>A:</b> {item['a']}\n")
+    return "".join(parts)
 
 
 @dp.message_handler(lambda m: m.text == SUPPORT_TEXT)
@@ -264,26 +417,17 @@ async def handle_support(message: types.Message):
 async def process_support_message(message: types.Message, state: FSMContext):
     """Обработка сообщения в чате поддержки"""
     user_id = message.from_user.id
-    username = message.from_user.username or "без username"
-    full_name = message.from_user.full_name or "Неизвестно"
     
-    # Формируем информацию об отправителе
-    user_info = (
-        f"💬 <b>Сообщение от пользователя</b>\n\n"
-        f"👤 {full_name}\n"
-        f"🆔 <code>{user_id}</code>\n"
-        f"📱 @{username}\n\n"
-    )
+    # Сначала ищем ответ в FAQ — в поддержку уходят только вопросы без ответа
+    if message.text and await _answer_from_faq(message, state):
+        return
+    
+    user_info = _support_user_info(message.from_user)
     
     # Отправляем админу в зависимости от типа контента
     try:
         if message.text:
-            await bot.send_message(
-                ADMIN_USER_ID,
-                user_info + f"📝 <b>Текст:</b>\n{message.text}\n\n"
-                f"<i>Ответить: /reply {user_id}</i>",
-                parse_mode="HTML"
-            )
+            await _forward_question(message.from_user, message.text)
         elif message.photo:
             await bot.send_photo(
                 ADMIN_USER_ID,
@@ -337,6 +481,84 @@ async def process_support_message(message: types.Message, state: FSMContext):
         )
 
 
+def _support_user_info(user: types.User) -> str:
+    """Шапка сообщения администратору: кто пишет"""
+    return (
+        f"💬 <b>Сообщение от пользователя</b>\n\n"
+        f"👤 {user.full_name or 'Неизвестно'}\n"
+        f"🆔 <code>{user.id}</code>\n"
+        f"📱 @{user.username or 'без username'}\n\n"
+    )
+
+
+async def _forward_question(user: types.User, text: str):
+    """Передать текстовый вопрос пользователя администратору"""
+    await bot.send_message(
+        ADMIN_USER_ID,
+        _support_user_info(user) + f"📝 <b>Текст:</b>\n{text}\n\n"
+        f"<i>Ответить: /reply {user.id}</i>",
+        parse_mode="HTML"
+    )
+
+
+_FAQ_ANSWERS_KEYBOARD = InlineKeyboardMarkup(row_width=1).add(
+    InlineKeyboardButton("✅ Это помогло", callback_data="faq_solved"),
+    InlineKeyboardButton("📨 Нет, передать вопрос разработчику", callback_data="faq_escalate"),
+)
+
+
+async def _answer_from_faq(message: types.Message, state: FSMContext) -> bool:
+    """Ответить из FAQ, если нашлись подходящие вопросы (вопрос запоминается для передачи админу)"""
+    answers = search_faq(message.text)
+    if not answers:
+        return False
+    await state.update_data(support_question=message.text)
+    text = "🔎 <b>Похоже, ответ уже есть:</b>\n"
+    for item in answers:
+        text += f"\n<b>Q:</b> {item['q']}\n<b>A:</b> {item['a']}\n"
+    await message.answer(text, parse_mode="HTML", reply_markup=_FAQ_ANSWERS_KEYBOARD)
+    return True
+
+
+@dp.callback_query_handler(lambda c: c.data in ("faq_solved", "faq_escalate"), state='*')
+async def faq_answer_callback(callback_query: types.CallbackQuery, state: FSMContext):
+    """Ответ из FAQ помог или вопрос всё-таки нужно передать разработчику"""
+    data = await state.get_data()
+    question = data.get("support_question")
+    await state.update_data(support_question=None)
+    await callback_query.message.edit_reply_markup()
+    
+    if callback_query.data == "faq_solved":
+        await callback_query.answer("Рад, что помогло!")
+        return
+    if question:
+        try:
+            await _forward_question(callback_query.from_user, question)
+        except Exception as e:
+            logging.error(f"Не удалось передать вопрос администратору: {e}")
+            await callback_query.answer("❌ Ошибка при отправке, попробуйте позже", show_alert=True)
+            return
+        await callback_query.message.answer("✅ Вопрос передан разработчику. Ответ придёт в этот чат.")
+    await callback_query.answer()
+
+
+async def handle_free_text(message: types.Message, state: FSMContext):
+    """Текст вне меню: ответ из FAQ, а если ответа нет — вопрос уходит разработчику"""
+    if is_admin(message.from_user.id) or message.text.startswith("/"):
+        return
+    if await _answer_from_faq(message, state):
+        return
+    try:
+        await _forward_question(message.from_user, message.text)
+    except Exception as e:
+        logging.error(f"Не удалось передать вопрос администратору: {e}")
+        return
+    await message.answer(
+        "В FAQ ответа не нашлось — передал вопрос разработчику, ответ придёт в этот чат.",
+        reply_markup=get_back_keyboard()
+    )
+
+
 @dp.message_handler(commands=['reply'])
 async def cmd_reply_start(message: types.Message, state: FSMContext):
     """Админ начинает ответ пользователю"""
@@ -458,7 +680,12 @@ async def handle_about(message: types.Message):
 async def handle_contact_dev(message: types.Message):
     """Контакты разработчика"""
     contacts = content_manager.get_contacts()
-    
+    text = render_cache.get("contacts", content_manager.get_version(content_manager.contacts_file),
+                            lambda: _render_contacts(contacts))
+    await message.answer(text, parse_mode="HTML", reply_markup=get_back_keyboard())
+
+
+def _render_contacts(contacts: dict) -> str:
     text = "📞 <b>Контакты</b>\n"
     if contacts.get('telegram'):
         text += f"Telegram: {contacts['telegram']}\n"
@@ -468,8 +695,7 @@ async def handle_contact_dev(message: types.Message):
         text += f"Телефон: {contacts['phone']}\n"
     if contacts.get('whatsapp'):
         text += f"WhatsApp: {contacts['whatsapp']}\n"
-    
-    await message.answer(text, parse_mode="HTML", reply_markup=get_back_keyboard())
+    return text
 
 
 @dp.message_handler(lambda m: m.text == BONUS_TEXT)
@@ -477,11 +703,11 @@ async def handle_bonuses(message: types.Message):
     """Показ реферальной ссылки и бонусов"""
     user_id = message.from_user.id
     ref_link = f"https://t.me/{(await bot.get_me()).username}?start=ref{user_id}"
-    invited = REFERRALS_DB.get(user_id, [])
+    invited = get_referral_count(user_id)
     bonus = BONUSES_DB.get(user_id, 0)
     text = (
         f"Ваша реферальная ссылка:\n{ref_link}\n"
-        f"Приглашено пользователей: {len(invited)}\n"
+        f"Приглашено пользователей: {invited}\n"
         f"Ваш бонус: {bonus} руб.\n"
         "\nПригласите друга — получите бонус за каждый оплаченный заказ!"
     )
@@ -495,32 +721,32 @@ async def handle_bonuses(message: types.Message):
 @dp.message_handler(lambda m: m.text == REVIEWS_TEXT)
 async def handle_reviews(message: types.Message):
     """Просмотр отзывов"""
+    text, kb = render_cache.get("reviews", get_reviews_version(), _render_reviews)
+    await message.answer(text, parse_mode="HTML", reply_markup=kb)
+
+
+def _render_reviews():
+    kb = InlineKeyboardMarkup().add(
+        InlineKeyboardButton("✍️ Оставить отзыв", callback_data="review_add")
+    )
     if not REVIEWS:
-        await message.answer(
+        return (
             "📋 Отзывы клиентов пока отсутствуют.\n\n"
-            "Будьте первым! Оставьте отзыв о нашей работе.",
-            reply_markup=InlineKeyboardMarkup().add(
-                InlineKeyboardButton("✍️ Оставить отзыв", callback_data="review_add")
-            )
-        )
-        return
+            "Будьте первым! Оставьте отзыв о нашей работе."
+        ), kb
     
-    # Показываем отзывы
-    text = "⭐ <b>Отзывы клиентов:</b>\n\n"
+    parts = ["⭐ <b>Отзывы клиентов:</b>\n\n"]
     for review in REVIEWS:
         stars = get_rating_stars(review.get("rating", 5))
         date = review.get("date", "")
-        text += f"{stars}\n"
-        text += f"<b>{review['author']}</b>"
+        parts.append(f"{stars}\n")
+        parts.append(f"<b>{review['author']}</b>")
         if date:
-            text += f" • {date}"
-        text += f"\n{review['text']}\n\n"
+            parts.append(f" • {date}")
+        parts.append(f"\n{review['text']}\n\n")
     
-    text += "Хотите оставить отзыв? Нажмите кнопку ниже."
-    kb = InlineKeyboardMarkup().add(
-        InlineKeyboardButton("✍️ Оставить отзыв", callback_data="review_add")
-    )
-    await message.answer(text, parse_mode="HTML", reply_markup=kb)
+    parts.append("Хотите оставить отзыв? Нажмите кнопку ниже.")
+    return "".join(parts), kb
 
 
 @dp.callback_query_handler(lambda c: c.data == "review_add")
@@ -542,8 +768,8 @@ async def save_review(message: types.Message, state: FSMContext):
     author = message.from_user.first_name or "Анонимный пользователь"
     
     # Добавляем отзыв в очередь модерации
-    review_id = f"rev_pending_{len(PENDING_REVIEWS) + 1}"
-    PENDING_REVIEWS.append({
+    review_id = new_review_id()
+    add_pending_review({
         "id": review_id,
         "author": author,
         "rating": 5,  # По умолчанию 5 звёзд
@@ -584,13 +810,90 @@ async def save_review(message: types.Message, state: FSMContext):
 
 @dp.message_handler(lambda m: m.text == STATUS_TEXT)
 async def handle_status(message: types.Message):
-    """Проверка статуса заказов по user_id"""
-    user_id = message.from_user.id
-    status = get_ticket_status(user_id)
-    kb = InlineKeyboardMarkup().add(
-        InlineKeyboardButton("🔎 Проверить по номеру", callback_data="status_by_id")
-    )
-    await message.answer(status, reply_markup=kb)
+    """История заказов пользователя (первая страница — последние заказы)"""
+    page = get_ticket_page(message.from_user.id, ORDERS_PAGE_SIZE)
+    await message.answer(_format_orders_page(page), reply_markup=_get_orders_page_keyboard(page))
+
+
+@dp.callback_query_handler(lambda c: c.data and c.data.startswith("orders_page_"))
+async def orders_page_callback(callback_query: types.CallbackQuery):
+    """Листание истории заказов: сообщение редактируется на месте"""
+    # orders_page_{newer|older}_{cursor}
+    _, _, direction, cursor = callback_query.data.split("_", 3)
+    page = get_ticket_page(callback_query.from_user.id, ORDERS_PAGE_SIZE, cursor, newer=direction == "newer")
+    try:
+        await callback_query.message.edit_text(
+            _format_orders_page(page), reply_markup=_get_orders_page_keyboard(page)
+        )
+    except MessageNotModified:
+        pass
+    await callback_query.answer()
+
+
+def _format_orders_page(page: dict) -> str:
+    """Текст страницы истории заказов"""
+    if not page["tickets"]:
+        return "У вас нет заказов"
+    lines = ["Ваши заказы:\n"]
+    for ticket in page["tickets"]:
+        created = datetime.fromtimestamp(ticket.ts).strftime('%d.%m.%Y %H:%M')
+        lines.append(f"• {ticket.order_id}: {ticket.status} ({created})")
+    return "\n".join(lines)
+
+
+def _get_orders_page_keyboard(page: dict) -> InlineKeyboardMarkup:
+    """Кнопки листания истории заказов и проверки по номеру"""
+    kb = InlineKeyboardMarkup()
+    nav = []
+    if page["newer"]:
+        nav.append(InlineKeyboardButton("⬅️ Новее", callback_data=f"orders_page_newer_{page['newer']}"))
+    if page["older"]:
+        nav.append(InlineKeyboardButton("Старше ➡️", callback_data=f"orders_page_older_{page['older']}"))
+    if nav:
+        kb.row(*nav)
+    if page["archived"]:
+        kb.add(InlineKeyboardButton(f"🗄 Архив заказов ({page['archived']})", callback_data="orders_archive_0"))
+    kb.add(InlineKeyboardButton("🔎 Проверить по номеру", callback_data="status_by_id"))
+    return kb
+
+
+@dp.callback_query_handler(lambda c: c.data and c.data.startswith("orders_archive_"))
+async def orders_archive_callback(callback_query: types.CallbackQuery):
+    """Листание архива заказов (старые и завершённые заказы)"""
+    user_id = callback_query.from_user.id
+    arg = callback_query.data.replace("orders_archive_", "")
+    if arg == "back":
+        page = get_ticket_page(user_id, ORDERS_PAGE_SIZE)
+        text, kb = _format_orders_page(page), _get_orders_page_keyboard(page)
+    else:
+        try:
+            offset = int(arg)
+        except ValueError:
+            await callback_query.answer("Неверная страница архива")
+            return
+        page = get_archived_page(user_id, ORDERS_PAGE_SIZE, offset)
+        text = "🗄 Архив заказов:\n\n" + "\n".join(
+            f"• {t.order_id}: {t.status} ({datetime.fromtimestamp(t.ts).strftime('%d.%m.%Y')})"
+            for t in page["tickets"]
+        )
+        kb = InlineKeyboardMarkup()
+        nav = []
+        if page["offset"] > 0:
+            nav.append(InlineKeyboardButton(
+                "⬅️ Новее", callback_data=f"orders_archive_{max(page['offset'] - ORDERS_PAGE_SIZE, 0)}"
+            ))
+        if page["offset"] + ORDERS_PAGE_SIZE < page["total"]:
+            nav.append(InlineKeyboardButton(
+                "Старше ➡️", callback_data=f"orders_archive_{page['offset'] + ORDERS_PAGE_SIZE}"
+            ))
+        if nav:
+            kb.row(*nav)
+        kb.add(InlineKeyboardButton("📦 Текущие заказы", callback_data="orders_archive_back"))
+    try:
+        await callback_query.message.edit_text(text, reply_markup=kb)
+    except MessageNotModified:
+        pass
+    await callback_query.answer()
 
 
 # ==============================================
@@ -602,27 +905,80 @@ def is_admin(user_id: int) -> bool:
     return user_id == ADMIN_USER_ID
 
 
-async def create_backup_now() -> str:
-    """Создает бекап всех данных"""
-    global last_backup_time
+# Один бекап за раз: повторный запрос ждёт окончания текущего
+_backup_lock = asyncio.Lock()
+
+
+def _write_backup(memory_state: dict, since: dict, reviews_version: int):
+    """Собрать и записать бекап (выполняется в пуле потоков)"""
+    try:
+        data_to_backup, watermark = export_stored_changes(since)
+    except Exception:
+        # Изменения рефералов уже забраны — следующий бекап должен быть полным
+        backup_manager.reset_chain()
+        raise
+    data_to_backup.update(memory_state)
+    watermark["reviews_version"] = reviews_version
+    if since is None:
+        backup_path = backup_manager.create_backup(data_to_backup, watermark)
+    else:
+        backup_path = backup_manager.create_incremental_backup(data_to_backup, watermark)
+    if backup_path:
+        # Очистка старых бекапов
+        backup_manager.cleanup_old_backups(BACKUP_KEEP_COUNT)
+    return backup_path
+
+
+async def create_backup_now(incremental: bool = False) -> str:
+    """
+    Создает бекап всех данных, не блокируя обработку сообщений
     
-    data_to_backup = {
-        "tickets": TICKETS_DB,
-        "referrals": REFERRALS_DB,
-        "bonuses": BONUSES_DB,
-        "reviews": REVIEWS
-    }
+    Args:
+        incremental: Записать только изменения после предыдущего бекапа
+            (если полного бекапа в этом запуске ещё не было — создаётся полный)
+    """
+    global last_backup_time
     
-    backup_path = backup_manager.create_backup(data_to_backup)
+    async with _backup_lock:
+        since = backup_manager.chain_watermark if incremental else None
+        reviews_version = get_reviews_version()
+        # Данные из памяти копируются здесь, в потоке бота, — это согласованный снимок.
+        # Чтение SQLite, сериализация и сжатие идут в пуле потоков.
+        if since is None:
+            memory_state = export_memory_state()
+            memory_state["reviews"] = list(REVIEWS)
+        else:
+            memory_state = export_memory_changes()
+            if reviews_version != since["reviews_version"]:
+                memory_state["reviews"] = list(REVIEWS)
+        loop = asyncio.get_event_loop()
+        backup_path = await loop.run_in_executor(None, _write_backup, memory_state, since, reviews_version)
+    
+    if backup_path and since is not None:
+        return f"✅ Инкрементальный бекап создан успешно:\n{backup_path}"
     if backup_path:
         last_backup_time = datetime.now()
-        # Очистка старых бекапов
-        backup_manager.cleanup_old_backups(BACKUP_KEEP_COUNT)
         return f"✅ Бекап создан успешно:\n{backup_path}"
     else:
         return "❌ Ошибка при создании бекапа"
 
 
+async def backup_and_notify(title: str = "💾 Бекап", notify: bool = True):
+    """Создать бекап в фоне и сообщить администратору результат"""
+    try:
+        result = await create_backup_now()
+    except Exception as e:
+        logging.error(f"Ошибка при создании бекапа: {e}")
+        result = "❌ Ошибка при создании бекапа"
+    logging.info(result)
+    if not notify:
+        return
+    try:
+        await bot.send_message(ADMIN_USER_ID, f"{title}:\n{result}")
+    except Exception as e:
+        logging.error(f"Не удалось отправить уведомление о бекапе: {e}")
+
+
 @dp.message_handler(commands=['admin'])
 async def cmd_admin(message: types.Message):
     """Открыть настройки администратора"""
@@ -638,6 +994,8 @@ async def cmd_admin(message: types.Message):
         InlineKeyboardButton("📝 Управление контентом", callback_data="admin_content_menu"),
         InlineKeyboardButton("💾 Управление бекапами", callback_data="admin_backup_menu"),
         InlineKeyboardButton("⭐ Модерация отзывов", callback_data="admin_reviews_menu"),
+        InlineKeyboardButton("📋 Заказы", callback_data="admin_orders_menu"),
+        InlineKeyboardButton("🔎 Найти заказ", callback_data="admin_order_lookup"),
         InlineKeyboardButton("📊 Общая статистика", callback_data="admin_main_stats"),
         InlineKeyboardButton("❌ Закрыть", callback_data="admin_close")
     )
@@ -649,6 +1007,62 @@ async def cmd_admin(message: types.Message):
     await msg.edit_text(text, reply_markup=keyboard, parse_mode="HTML")
 
 
+@dp.message_handler(commands=['order'])
+async def cmd_order(message: types.Message):
+    """Поиск заказа по номеру (только для админа)"""
+    if not is_admin(message.from_user.id):
+        await message.answer("⛔️ Эта команда доступна только администратору.")
+        return
+    
+    order_id = message.get_args().strip()
+    if not order_id:
+        await message.answer(
+            "🔎 <b>Поиск заказа</b>\n\n"
+            "Использование:\n"
+            "<code>/order НОМЕР_ЗАКАЗА</code>",
+            parse_mode="HTML"
+        )
+        return
+    
+    ticket = get_ticket(order_id)
+    if not ticket:
+        await message.answer(f"❌ Заказ {order_id} не найден")
+        return
+    
+    await message.answer(format_ticket(ticket), parse_mode="HTML", reply_markup=get_ticket_keyboard(order_id))
+
+
+@dp.message_handler(commands=['bonus_history'])
+async def cmd_bonus_history(message: types.Message):
+    """История операций с бонусами пользователя (только для админа)"""
+    if not is_admin(message.from_user.id):
+        await message.answer("⛔️ Эта команда доступна только администратору.")
+        return
+    
+    args = message.get_args().strip()
+    if not args.isdigit():
+        await message.answer(
+            "🎁 <b>История бонусов</b>\n\n"
+            "Использование:\n"
+            "<code>/bonus_history USER_ID</code>",
+            parse_mode="HTML"
+        )
+        return
+    
+    user_id = int(args)
+    history = get_bonus_history(user_id, limit=BONUS_HISTORY_LIMIT)
+    if not history:
+        await message.answer(f"У пользователя {user_id} нет операций с бонусами")
+        return
+    
+    text = f"🎁 <b>Бонусы пользователя {user_id}</b>\n"
+    text += f"Баланс: {BONUSES_DB.get(user_id, 0)} руб.\n\n"
+    for entry in history:
+        created = datetime.fromtimestamp(entry['created_at']).strftime('%d.%m.%Y %H:%M')
+        text += f"{created}  {entry['amount']:+d} руб. — {entry['reason']}\n"
+    await message.answer(text, parse_mode="HTML")
+
+
 @dp.message_handler(commands=['backup'])
 
 async def cmd_backup(message: types.Message):
@@ -657,8 +1071,8 @@ async def cmd_backup(message: types.Message):
         await message.answer("⛔️ Эта команда доступна только администратору.")
         return
     
-    result = await create_backup_now()
-    await message.answer(result)
+    asyncio.create_task(backup_and_notify())
+    await message.answer("⏳ Создаю бекап — пришлю сообщение, когда он будет готов.")
 
 
 @dp.message_handler(commands=['backup_list'])
@@ -684,6 +1098,9 @@ async def cmd_backup_list(message: types.Message):
         text += f"{i}. <code>{filename}</code>\n"
         text += f"   Размер: {size_kb} KB\n"
         
+        if metadata and metadata.get('type') == 'incremental':
+            text += f"   Инкрементальный, №{metadata.get('index')} после {metadata.get('base')}\n"
+        
         if metadata:
             created = metadata.get('created_at', 'неизвестно')
             records = metadata.get('records_count', {})
@@ -716,7 +1133,8 @@ async def cmd_backup_settings(message: types.Message):
         f"Включено: {'✅' if BACKUP_ENABLED else '❌'}\n"
         f"Интервал: {BACKUP_INTERVAL_DAYS} дней\n"
         f"Директория: {BACKUP_DIR}\n"
-        f"Хранить бекапов: {BACKUP_KEEP_COUNT} шт.\n"
+        f"Хранить бекапов: {BACKUP_KEEP_COUNT} шт. (полных, с их инкрементальными)\n"
+        f"Инкрементальные: {f'каждые {BACKUP_INCREMENTAL_HOURS} ч.' if BACKUP_INCREMENTAL_HOURS else '❌'}\n"
     )
     
     if last_backup_time:
@@ -760,8 +1178,6 @@ async def handle_restore_backup(callback_query: types.CallbackQuery):
 @dp.callback_query_handler(lambda c: c.data and c.data.startswith("confirm_restore_"))
 async def confirm_restore_backup(callback_query: types.CallbackQuery):
     """Подтверждение восстановления бекапа"""
-    global REFERRALS_DB, BONUSES_DB
-    
     if not is_admin(callback_query.from_user.id):
         await callback_query.answer("⛔️ Доступ запрещен", show_alert=True)
         return
@@ -772,20 +1188,12 @@ async def confirm_restore_backup(callback_query: types.CallbackQuery):
     restored_data = backup_manager.restore_backup(backup_path)
     
     if restored_data:
-        # Восстанавливаем данные
-        from data import TICKETS_DB
-        
-        TICKETS_DB.clear()
-        TICKETS_DB.update(restored_data.get('tickets', {}))
+        # Восстанавливаем данные (заказы, рефералы, бонусы + новый снимок журнала)
+        restore_state(restored_data)
+        # Журнал бонусов перезаписан — инкрементальные бекапы начинаются с нового полного
+        backup_manager.reset_chain()
         
-        REFERRALS_DB.clear()
-        REFERRALS_DB.update(restored_data.get('referrals', {}))
-        
-        BONUSES_DB.clear()
-        BONUSES_DB.update(restored_data.get('bonuses', {}))
-        
-        REVIEWS.clear()
-        REVIEWS.extend(restored_data.get('reviews', []))
+        replace_reviews(restored_data.get('reviews', []))
         
         await callback_query.message.answer(
             f"✅ Данные успешно восстановлены из бекапа:\n<code>{filename}</code>",
@@ -818,11 +1226,7 @@ async def approve_review(callback_query: types.CallbackQuery):
     review_id = callback_query.data.replace("approve_review_", "")
     
     # Найти отзыв в очереди модерации
-    review = None
-    for i, r in enumerate(PENDING_REVIEWS):
-        if r["id"] == review_id:
-            review = PENDING_REVIEWS.pop(i)
-            break
+    review = take_pending_review(review_id)
     
     if review:
         # Добавить в опубликованные отзывы
@@ -833,7 +1237,7 @@ async def approve_review(callback_query: types.CallbackQuery):
             "text": review["text"],
             "date": review.get("date", datetime.now().isoformat())
         }
-        REVIEWS.append(review_to_add)
+        publish_review(review_to_add)
         
         await callback_query.message.edit_text(
             f"✅ <b>Отзыв одобрен!</b>\n\n"
@@ -866,11 +1270,7 @@ async def reject_review(callback_query: types.CallbackQuery):
     review_id = callback_query.data.replace("reject_review_", "")
     
     # Найти и удалить отзыв из очереди модерации
-    review = None
-    for i, r in enumerate(PENDING_REVIEWS):
-        if r["id"] == review_id:
-            review = PENDING_REVIEWS.pop(i)
-            break
+    review = take_pending_review(review_id)
     
     if review:
         await callback_query.message.edit_text(
@@ -939,13 +1339,15 @@ async def admin_backup_create_callback(callback_query: types.CallbackQuery):
         await callback_query.answer("⛔️ Доступ запрещён", show_alert=True)
         return
     
-    await callback_query.message.edit_text("⏳ Создаю бекап...")
-    result = await create_backup_now()
+    asyncio.create_task(backup_and_notify())
     
     keyboard = InlineKeyboardMarkup()
     keyboard.add(InlineKeyboardButton("🔙 Назад", callback_data="admin_backup_menu"))
     
-    await callback_query.message.edit_text(result, reply_markup=keyboard)
+    await callback_query.message.edit_text(
+        "⏳ Создаю бекап — пришлю сообщение, когда он будет готов.",
+        reply_markup=keyboard
+    )
     await callback_query.answer()
 
 
@@ -995,12 +1397,14 @@ async def admin_backup_settings_callback(callback_query: types.CallbackQuery):
         return
     
     status = "✅ Включены" if BACKUP_ENABLED else "❌ Выключены"
+    incremental = f"каждые {BACKUP_INCREMENTAL_HOURS} ч." if BACKUP_INCREMENTAL_HOURS else "выключены"
     
     text = f"""⚙️ <b>НАСТРОЙКИ БЕКАПОВ</b>
 
 <b>Статус:</b> {status}
 <b>Интервал:</b> {BACKUP_INTERVAL_DAYS} дней
-<b>Хранить:</b> {BACKUP_KEEP_COUNT} последних бекапов
+<b>Хранить:</b> {BACKUP_KEEP_COUNT} последних полных бекапов
+<b>Инкрементальные:</b> {incremental}
 <b>Директория:</b> <code>{BACKUP_DIR}</code>
 
 <i>Для изменения настроек отредактируй config.py</i>"""
@@ -1099,7 +1503,7 @@ async def calc_hosting(message: types.Message, state: FSMContext):
     await state.update_data(hosting=message.text)
     data = await state.get_data()
     user_id = message.from_user.id
-    bonus = BONUSES.get(user_id, 0)
+    bonus = BONUSES_DB.get(user_id, 0)
     price_without_bonus = calculate_price(data['type_bot'], data['complexity'], data['hosting'])
     price_with_bonus = calculate_price(data['type_bot'], data['complexity'], data['hosting'], bonus)
     if bonus > 0:
@@ -1256,7 +1660,8 @@ async def process_hosting(message: types.Message, state: FSMContext):
         )
         await OrderForm.next()
     else:
-        await state.update_data(use_bonus=False, bonus_amount=0)
+        # Номер заказа выдаётся заранее: он же ключ идемпотентности при подтверждении
+        await state.update_data(use_bonus=False, bonus_amount=0, order_id=str(uuid.uuid4())[:8])
         data = await state.get_data()
         summary = _format_order_summary(data)
         kb = InlineKeyboardMarkup()
@@ -1280,6 +1685,7 @@ async def process_use_bonus(message: types.Message, state: FSMContext):
         await state.update_data(use_bonus=False, bonus_amount=0)
         discount_text = ""
     
+    await state.update_data(order_id=str(uuid.uuid4())[:8])
     data = await state.get_data()
     summary = _format_order_summary(data) + discount_text
     kb = InlineKeyboardMarkup()
@@ -1293,17 +1699,21 @@ async def process_use_bonus(message: types.Message, state: FSMContext):
 @dp.callback_query_handler(lambda c: c.data == "confirm_order", state=OrderForm.confirm)
 async def process_confirm_callback(callback_query: types.CallbackQuery, state: FSMContext):
     """Подтверждение заказа через кнопку"""
-    message = callback_query.message
-    data = await state.get_data()
-    order_id = str(uuid.uuid4())[:8]
     user_id = callback_query.from_user.id
+    async with user_lock(user_id):
+        # Повторное нажатие, пока обрабатывалось первое: заказ уже оформлен
+        if await state.get_state() != OrderForm.confirm.state:
+            await callback_query.answer()
+            return
+        await _confirm_order_callback(callback_query, state, user_id)
+
+
+async def _confirm_order_callback(callback_query: types.CallbackQuery, state: FSMContext, user_id: int):
+    data = await state.get_data()
+    order_id = data.pop('order_id', None) or str(uuid.uuid4())[:8]
     
     # Списываем бонусы если использовались
-    bonus_text = ""
-    if data.get('use_bonus', False):
-        bonus_amount = data.get('bonus_amount', 0)
-        BONUSES_DB[user_id] = BONUSES_DB.get(user_id, 0) - bonus_amount
-        bonus_text = f"Использовано бонусов: {bonus_amount} руб.\n"
+    bonus_text = _charge_order_bonus(user_id, order_id, data)
     
     # Формирование тикета для администратора
     ticket = (
@@ -1352,16 +1762,19 @@ async def process_confirm_callback(callback_query: types.CallbackQuery, state: F
 @dp.message_handler(lambda m: m.text.lower() == 'подтверждаю', state=OrderForm.confirm)
 async def process_confirm(message: types.Message, state: FSMContext):
     """Подтверждение заказа (старый способ, для совместимости)"""
-    data = await state.get_data()
-    order_id = str(uuid.uuid4())[:8]
     user_id = message.from_user.id
+    async with user_lock(user_id):
+        if await state.get_state() != OrderForm.confirm.state:
+            return
+        await _confirm_order_message(message, state, user_id)
+
+
+async def _confirm_order_message(message: types.Message, state: FSMContext, user_id: int):
+    data = await state.get_data()
+    order_id = data.pop('order_id', None) or str(uuid.uuid4())[:8]
     
     # Списываем бонусы если использовались
-    bonus_text = ""
-    if data.get('use_bonus', False):
-        bonus_amount = data.get('bonus_amount', 0)
-        BONUSES_DB[user_id] = BONUSES_DB.get(user_id, 0) - bonus_amount
-        bonus_text = f"Использовано бонусов: {bonus_amount} руб.\n"
+    bonus_text = _charge_order_bonus(user_id, order_id, data)
     
     # Формирование тикета для администратора
     ticket = (
@@ -1411,6 +1824,19 @@ async def process_confirm(message: types.Message, state: FSMContext):
 # ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ
 # ==============================================
 
+def _charge_order_bonus(user_id: int, order_id: str, data: dict) -> str:
+    """Списать бонусы за заказ (один раз на номер заказа), вернуть строку для тикета"""
+    if not data.get('use_bonus', False):
+        return ""
+    bonus_amount = data.get('bonus_amount', 0)
+    if not spend_bonus(user_id, bonus_amount, order_id):
+        # Баланс изменился, пока оформлялся заказ
+        data['use_bonus'] = False
+        data['bonus_amount'] = 0
+        return "Бонусы не списаны: недостаточно на балансе\n"
+    return f"Использовано бонусов: {bonus_amount} руб.\n"
+
+
 def _format_order_summary(data: dict) -> str:
     """Форматирование сводки заказа"""
     return (
@@ -1441,20 +1867,59 @@ async def periodic_backup():
             
             if BACKUP_ENABLED:
                 logging.info("Запуск автоматического бекапа...")
-                result = await create_backup_now()
-                logging.info(result)
-                
-                # Уведомляем администратора
-                try:
-                    await bot.send_message(ADMIN_USER_ID, f"🔄 Автоматический бекап:\n{result}")
-                except Exception as e:
-                    logging.error(f"Не удалось отправить уведомление о бекапе: {e}")
+                # Создаём бекап и уведомляем администратора
+                await backup_and_notify("🔄 Автоматический бекап")
                     
         except Exception as e:
             logging.error(f"Ошибка в periodic_backup: {e}")
             await asyncio.sleep(3600)  # В случае ошибки ждем 1 час
 
 
+async def periodic_incremental_backup():
+    """Инкрементальные бекапы между полными: только записи, изменённые с прошлого бекапа"""
+    while True:
+        await asyncio.sleep(BACKUP_INCREMENTAL_HOURS * 3600)
+        try:
+            result = await create_backup_now(incremental=True)
+            logging.info(result)
+            if result.startswith("❌"):
+                await bot.send_message(ADMIN_USER_ID, f"🔄 Инкрементальный бекап:\n{result}")
+        except Exception as e:
+            logging.error(f"Ошибка в periodic_incremental_backup: {e}")
+
+
+async def periodic_journal_sync():
+    """Периодический fsync журнала изменений и создание снимков"""
+    while True:
+        await asyncio.sleep(JOURNAL_FSYNC_INTERVAL)
+        try:
+            sync_journal()
+        except Exception as e:
+            logging.error(f"Ошибка в periodic_journal_sync: {e}")
+
+
+async def periodic_archive():
+    """Периодический перенос старых и завершённых заказов в архив"""
+    loop = asyncio.get_event_loop()
+    while True:
+        try:
+            await loop.run_in_executor(None, archive_tickets)
+        except Exception as e:
+            logging.error(f"Ошибка в periodic_archive: {e}")
+        await asyncio.sleep(ARCHIVE_INTERVAL_HOURS * 3600)
+
+
+async def notify_sheet_status(order_id: str, status: str):
+    """Уведомить клиента о статусе, изменённом администратором в Google Sheets"""
+    ticket = get_ticket(order_id)
+    if ticket:
+        await bot.send_message(
+            ticket["user_id"],
+            f"📦 Статус вашего заказа <code>{order_id}</code> изменён: <b>{status}</b>",
+            parse_mode="HTML"
+        )
+
+
 async def on_startup(dp):
     """Действия при запуске бота"""
     logging.info("🤖 Бот запущен!")
@@ -1471,19 +1936,52 @@ async def on_startup(dp):
     
     # Создаем начальный бекап при старте
     if BACKUP_ENABLED:
-        logging.info("Создание начального бекапа...")
-        result = await create_backup_now()
-        logging.info(result)
+        logging.info("Создание начального бекапа (в фоне)...")
+        asyncio.create_task(backup_and_notify(notify=False))
     
     # Запускаем фоновую задачу для периодических бекапов
     if BACKUP_ENABLED:
         asyncio.create_task(periodic_backup())
         logging.info(f"Автоматические бекапы включены (каждые {BACKUP_INTERVAL_DAYS} дней)")
+        if BACKUP_INCREMENTAL_HOURS:
+            asyncio.create_task(periodic_incremental_backup())
+            logging.info(f"Инкрементальные бекапы: каждые {BACKUP_INCREMENTAL_HOURS} ч.")
+    
+    # Следим за файлами content/ (ручные правки на сервере, update_server.sh)
+    asyncio.create_task(content_manager.watch())
+    
+    # Запускаем обслуживание журнала изменений (рефералы и бонусы)
+    asyncio.create_task(periodic_journal_sync())
+    
+    # Запускаем перенос старых заказов в архив
+    asyncio.create_task(periodic_archive())
+    
+    # Запускаем фоновую запись заказов в Google Sheets
+    if USE_GSHEET:
+        asyncio.create_task(sheets_queue.run())
+        logging.info(f"Очередь Google Sheets запущена (в очереди: {sheets_queue.pending()})")
+        asyncio.create_task(sheets_sync.run(on_change=notify_sheet_status))
+        logging.info(f"Синхронизация статусов с Google Sheets: каждые {sheets_sync.interval} сек")
     
     # Регистрируем обработчики админ-панели
     register_admin_handlers(dp)
+    # Свободный текст — последним, после всех обработчиков кнопок и команд
+    dp.register_message_handler(handle_free_text, content_types=['text'])
     logging.info("✅ Админ-панель зарегистрирована")
 
 
+async def on_shutdown(dp):
+    """Действия при остановке бота"""
+    # Сохраняем снимок данных, чтобы следующий запуск не переигрывал журнал
+    snapshot_state()
+    
+    # Дописываем отложенные правки контента
+    content_manager.flush()
+    
+    # Пытаемся дописать очередь Google Sheets (неотправленное останется на диске)
+    if USE_GSHEET:
+        await sheets_queue.flush()
+
+
 if __name__ == '__main__':
-    executor.start_polling(dp, skip_updates=True, on_startup=on_startup)
+    executor.start_polling(dp, skip_updates=True, on_startup=on_startup, on_shutdown=on_shutdown)
@@ -0,0 +1,143 @@
+"""
+Модуль истории контента
+Каждая сохранённая версия файла контента — снимок в хранилище блобов,
+адресуемых хэшем содержимого (SHA-256). Списки (портфолио, FAQ) хранятся
+поэлементно: снимок — это список хэшей элементов, поэтому неизменённые
+кейсы и вопросы хранятся один раз на всю историю, а правка одного
+вопроса добавляет один блоб и один снимок.
+
+Версии файла перечислены в журнале {имя}.log (строка JSON на версию),
+любая версия собирается из своего снимка — без проигрывания истории.
+
+Структура директории:
+    blobs/ab/abcdef....json   — блобы (элементы и снимки)
+    faq.log, portfolio.log... — журналы версий
+"""
+
+import os
+import json
+import hashlib
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ContentHistory:
+    """Версии файлов контента в хранилище блобов"""
+
+    def __init__(self, directory: str):
+        """
+        Args:
+            directory: Директория истории
+        """
+        self.directory = directory
+        self.blobs_dir = os.path.join(directory, "blobs")
+        if not os.path.exists(self.blobs_dir):
+            os.makedirs(self.blobs_dir)
+        self._lock = threading.Lock()
+        # Журналы версий в памяти: имя -> [запись]
+        self._logs: Dict[str, List[dict]] = {}
+
+    # ==================== БЛОБЫ ====================
+
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self.blobs_dir, digest[:2], digest + ".json")
+
+    def _put(self, obj) -> str:
+        """Сохранить объект (если такого ещё нет) и вернуть его хэш"""
+        raw = json.dumps(obj, ensure_ascii=False, sort_keys=True).encode("utf-8")
+        digest = hashlib.sha256(raw).hexdigest()
+        path = self._blob_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = path + ".tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(raw)
+            os.replace(tmp_path, path)
+        return digest
+
+    def _get(self, digest: str):
+        with open(self._blob_path(digest), 'rb') as f:
+            return json.loads(f.read())
+
+    # ==================== ЖУРНАЛ ВЕРСИЙ ====================
+
+    def _log(self, name: str) -> List[dict]:
+        log = self._logs.get(name)
+        if log is None:
+            log = []
+            path = os.path.join(self.directory, f"{name}.log")
+            if os.path.exists(path):
+                good_size = 0  # байт до конца последней целой строки
+                with open(path, 'rb') as f:
+                    for line in f:
+                        try:
+                            if not line.endswith(b"\n"):
+                                raise ValueError("строка без конца строки")
+                            log.append(json.loads(line))
+                        except ValueError:
+                            # Недописанная строка после сбоя
+                            logger.warning(f"Пропущена повреждённая строка в {path}")
+                            break
+                        good_size += len(line)
+                if good_size < os.path.getsize(path):
+                    # Обрезаем мусор, иначе record допишет новые версии к нему и они потеряются
+                    with open(path, 'r+b') as f:
+                        f.truncate(good_size)
+                        os.fsync(f.fileno())
+            self._logs[name] = log
+        return log
+
+    def record(self, name: str, data, note: str = "") -> Optional[int]:
+        """
+        Сохранить версию файла (если она отличается от последней)
+
+        Args:
+            name: Имя файла контента ("faq", "portfolio", ...)
+            data: Содержимое файла
+            note: Откуда изменение (админка, ручная правка, откат)
+
+        Returns:
+            Номер новой версии или None, если содержимое не изменилось
+        """
+        if isinstance(data, list):
+            snapshot = {"items": [self._put(item) for item in data]}
+        else:
+            snapshot = {"value": self._put(data)}
+        root = self._put(snapshot)
+
+        with self._lock:
+            log = self._log(name)
+            if log and log[-1]["root"] == root:
+                return None
+            entry = {
+                "version": log[-1]["version"] + 1 if log else 1,
+                "ts": datetime.now().isoformat(timespec="seconds"),
+                "note": note,
+                "root": root,
+                "count": len(data) if isinstance(data, list) else None,
+            }
+            with open(os.path.join(self.directory, f"{name}.log"), 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            log.append(entry)
+        return entry["version"]
+
+    def versions(self, name: str, limit: int = None) -> List[dict]:
+        """Версии файла, от новой к старой"""
+        with self._lock:
+            log = self._log(name)
+            return list(reversed(log if limit is None else log[-limit:]))
+
+    def load(self, name: str, version: int):
+        """Содержимое файла в указанной версии (None если версии нет)"""
+        with self._lock:
+            entry = next((e for e in reversed(self._log(name)) if e["version"] == version), None)
+        if entry is None:
+            return None
+        snapshot = self._get(entry["root"])
+        if "items" in snapshot:
+            return [self._get(digest) for digest in snapshot["items"]]
+        return self._get(snapshot["value"])
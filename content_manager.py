@@ -5,26 +5,114 @@
 
 import json
 import os
+import copy
+import time
+import asyncio
 import logging
+import threading
 from typing import List, Dict, Optional
 from datetime import datetime
 
+from media import media_type
+from content_history import ContentHistory
+
 logger = logging.getLogger(__name__)
 
+try:
+    from config import CONTENT_REVALIDATE_INTERVAL
+except ImportError:
+    CONTENT_REVALIDATE_INTERVAL = 2  # секунд между проверками mtime/размера файлов
+
+try:
+    from config import CONTENT_WRITE_DELAY
+except ImportError:
+    CONTENT_WRITE_DELAY = 0.5  # секунд: правки за это время записываются одной записью
+
+try:
+    from config import CONTENT_WATCH_INTERVAL
+except ImportError:
+    CONTENT_WATCH_INTERVAL = 2  # секунд между проверками файлов фоновым наблюдателем
+
+try:
+    from config import CONTENT_HISTORY_DIR
+except ImportError:
+    CONTENT_HISTORY_DIR = None  # по умолчанию content/.history
+
 
 class ContentManager:
-    """Менеджер контента - работа с JSON файлами"""
+    """Менеджер контента - работа с JSON файлами
+
+    Разобранный контент кэшируется в памяти. Файл перечитывается, только
+    если изменились его mtime или размер (например, после ручной правки),
+    причём stat выполняется не чаще раза в revalidate_interval секунд.
+    Изменения через админку сразу обновляют кэш.
+
+    Значения, которые возвращают get_*, общие для всех читателей —
+    их нельзя изменять на месте.
+    
+    Запись на диск атомарная (временный файл + os.replace) и отложенная:
+    при работающем event loop файл пишется в пуле потоков через write_delay
+    секунд после последней правки, поэтому серия правок — одна запись.
+    Без event loop (скрипты, тесты) запись выполняется сразу.
+    
+    В боте файлы проверяет фоновый наблюдатель (watch): изменённый файл
+    читается и проверяется в пуле потоков и подменяет данные в кэше
+    целиком, а запросы читают только кэш. Файл с ошибкой (битый JSON,
+    не та структура) отклоняется — остаётся последняя рабочая версия.
+    
+    Каждая записанная версия файла попадает в историю (ContentHistory),
+    откат к любой версии — rollback.
+    """
     
-    def __init__(self, content_dir: str = "content"):
+    def __init__(self, content_dir: str = "content", revalidate_interval: float = CONTENT_REVALIDATE_INTERVAL,
+                 write_delay: float = CONTENT_WRITE_DELAY, history_dir: str = CONTENT_HISTORY_DIR):
         """Инициализация менеджера контента"""
         self.content_dir = content_dir
+        self.revalidate_interval = revalidate_interval
+        self.write_delay = write_delay
         self._ensure_content_dir()
         
+        # Блокировки файлов: изменение (чтение-правка-сохранение) и запись на диск
+        self._edit_locks = {}
+        self._write_locks = {}
+        # Несохранённые правки: путь -> (номер правки, данные); отложенные записи: путь -> handle
+        self._dirty = {}
+        self._written = {}
+        self._timers = {}
+        self._generation = 0
+        
+        # Кэш: путь -> (mtime_ns, размер, данные, время последней проверки)
+        self._cache = {}
+        # Версия файла: растёт при каждой смене данных в кэше
+        self._versions = {}
+        # Индексы ID -> позиция для списков: путь -> (список, {id: позиция})
+        self._indexes = {}
+        
         # Пути к JSON файлам
         self.portfolio_file = os.path.join(content_dir, "portfolio.json")
         self.faq_file = os.path.join(content_dir, "faq.json")
         self.contacts_file = os.path.join(content_dir, "contacts.json")
         self.about_file = os.path.join(content_dir, "about.json")
+        # Последние выданные номера ID: {"portfolio": 7, "faq": 12}
+        self.ids_file = os.path.join(content_dir, "ids.json")
+        
+        # Файлы контента и значения по умолчанию (для наблюдателя)
+        self._defaults = {
+            self.portfolio_file: [],
+            self.faq_file: [],
+            self.contacts_file: self.DEFAULT_CONTACTS,
+            self.about_file: {},
+        }
+        # История версий: имя файла ("faq") -> путь
+        self.history = ContentHistory(history_dir or os.path.join(content_dir, ".history"))
+        self._paths = {os.path.splitext(os.path.basename(path))[0]: path for path in self._defaults}
+        # Пометка для истории к ещё не записанной правке: путь -> текст
+        self._notes = {}
+        
+        # Пока работает наблюдатель, запросы не делают stat файлов
+        self._watching = False
+        # Отклонённые версии файлов: путь -> (mtime_ns, размер) — чтобы не разбирать их повторно
+        self._rejected = {}
     
     def _ensure_content_dir(self):
         """Создает директорию контента если её нет"""
@@ -32,26 +120,325 @@ class ContentManager:
             os.makedirs(self.content_dir)
             logger.info(f"Создана директория контента: {self.content_dir}")
     
-    def _load_json(self, filepath: str, default: any) -> any:
-        """Загружает JSON файл или возвращает значение по умолчанию"""
+    def _stat(self, filepath: str):
         try:
-            if os.path.exists(filepath):
-                with open(filepath, 'r', encoding='utf-8') as f:
-                    return json.load(f)
+            st = os.stat(filepath)
+            return st.st_mtime_ns, st.st_size
+        except OSError:
+            return None, None
+    
+    def _read_json(self, filepath: str, default: any) -> any:
+        """
+        Читает и проверяет JSON файл (значение по умолчанию, если файла нет)
+        
+        Raises:
+            ValueError: Файл не разбирается или его структура не подходит
+        """
+        try:
+            with open(filepath, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return default
+        except OSError as e:
+            raise ValueError(str(e))
+        error = self._validate(filepath, data)
+        if error:
+            raise ValueError(error)
+        return data
+    
+    def _validate(self, filepath: str, data: any) -> Optional[str]:
+        """Проверить структуру файла контента (None если всё в порядке, иначе описание ошибки)"""
+        if filepath in (self.portfolio_file, self.faq_file):
+            required = ("id", "title", "desc", "details") if filepath == self.portfolio_file else ("id", "q", "a")
+            if not isinstance(data, list):
+                return "ожидается список"
+            for i, item in enumerate(data, 1):
+                if not isinstance(item, dict) or any(key not in item for key in required):
+                    return f"элемент {i}: нужны поля {', '.join(required)}"
+            ids = [item["id"] for item in data]
+            if len(set(ids)) != len(ids):
+                return "повторяющиеся id"
+        elif filepath in (self.contacts_file, self.about_file):
+            if not isinstance(data, dict):
+                return "ожидается объект"
+            if not isinstance(data.get("text", ""), str):
+                return "поле text должно быть строкой"
+        return None
+    
+    def _reload(self, filepath: str, default: any, mtime, size) -> bool:
+        """Перечитать изменившийся файл и подменить данные в кэше (False — файл отклонён)"""
+        try:
+            data = self._read_json(filepath, default)
+        except ValueError as e:
+            self._rejected[filepath] = (mtime, size)
+            if filepath in self._cache:
+                logger.error(f"Файл {filepath} отклонён ({e}), остаётся предыдущая версия")
+            else:
+                logger.error(f"Файл {filepath} отклонён ({e}), используется значение по умолчанию")
+                self._set_cache(filepath, default, mtime, size)
+            return False
+        with self._edit_lock(filepath):
+            if filepath in self._dirty:
+                # Пока читали, появилась правка из админки — она новее
+                return False
+            self._rejected.pop(filepath, None)
+            self._set_cache(filepath, data, mtime, size)
+        self._record_history(filepath, data, "изменён на сервере")
+        return True
+    
+    def _record_history(self, filepath: str, data: any, note: str):
+        """Добавить версию файла в историю (ошибка истории не мешает работе с контентом)"""
+        name = os.path.splitext(os.path.basename(filepath))[0]
+        if name not in self._paths or not os.path.exists(filepath):
+            return
+        try:
+            if not self.history.versions(name, 1):
+                note = "исходная версия"
+            self.history.record(name, data, note)
         except Exception as e:
-            logger.error(f"Ошибка при загрузке {filepath}: {e}")
-        return default
+            logger.error(f"Не удалось сохранить версию {filepath} в историю: {e}")
+    
+    def _set_cache(self, filepath: str, data: any, mtime, size):
+        self._cache[filepath] = (mtime, size, data, time.monotonic())
+        self._versions[filepath] = self._versions.get(filepath, 0) + 1
+    
+    def _load_json(self, filepath: str, default: any) -> any:
+        """Загружает JSON файл (из кэша, если файл не менялся) или возвращает значение по умолчанию"""
+        entry = self._cache.get(filepath)
+        now = time.monotonic()
+        if entry is not None and (self._watching or now - entry[3] < self.revalidate_interval
+                                  or filepath in self._dirty):
+            # Пока правка не записана, в кэше данные новее, чем на диске
+            return entry[2]
+        
+        mtime, size = self._stat(filepath)
+        if entry is not None and ((entry[0], entry[1]) == (mtime, size)
+                                  or self._rejected.get(filepath) == (mtime, size)):
+            self._cache[filepath] = (entry[0], entry[1], entry[2], now)
+            return entry[2]
+        
+        self._reload(filepath, default, mtime, size)
+        return self._cache[filepath][2]
     
-    def _save_json(self, filepath: str, data: any) -> bool:
-        """Сохраняет данные в JSON файл"""
+    def _load_for_update(self, filepath: str, default: any) -> any:
+        """Копия данных для изменения (кэш не меняется до успешного сохранения)"""
+        return copy.deepcopy(self._load_json(filepath, default))
+    
+    def _edit_lock(self, filepath: str) -> threading.RLock:
+        """Блокировка изменения файла: правки одного файла не теряют друг друга"""
+        return self._edit_locks.setdefault(filepath, threading.RLock())
+    
+    def _save_json(self, filepath: str, data: any, note: str = "админка") -> bool:
+        """Сохраняет данные: сразу в кэш, на диск — атомарно и с задержкой (см. write_delay)"""
+        with self._edit_lock(filepath):
+            self._generation += 1
+            self._dirty[filepath] = (self._generation, data)
+            self._notes[filepath] = note
+            self._set_cache(filepath, data, None, None)
+        
         try:
-            with open(filepath, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return self._write_file(filepath)
+        
+        # Откладываем запись: новые правки в течение write_delay переносят таймер
+        timer = self._timers.pop(filepath, None)
+        if timer is not None:
+            timer.cancel()
+        self._timers[filepath] = loop.call_later(
+            self.write_delay, lambda: loop.run_in_executor(None, self._write_file, filepath)
+        )
+        return True
+    
+    def _write_file(self, filepath: str) -> bool:
+        """Записать последнюю правку файла на диск (временный файл + os.replace)"""
+        with self._write_locks.setdefault(filepath, threading.Lock()):
+            with self._edit_lock(filepath):
+                pending = self._dirty.get(filepath)
+            if pending is None or pending[0] <= self._written.get(filepath, 0):
+                return True
+            generation, data = pending
+            
+            tmp_path = filepath + ".tmp"
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(data, f, ensure_ascii=False, indent=2)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, filepath)
+            except Exception as e:
+                logger.error(f"Ошибка при сохранении {filepath}: {e}")
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+                return False
             logger.info(f"Сохранено: {filepath}")
+            self._record_history(filepath, data, self._notes.get(filepath, ""))
+            
+            self._written[filepath] = generation
+            mtime, size = self._stat(filepath)
+            with self._edit_lock(filepath):
+                if self._dirty.get(filepath, (None,))[0] == generation:
+                    del self._dirty[filepath]
+                    entry = self._cache.get(filepath)
+                    if entry is not None:
+                        self._cache[filepath] = (mtime, size, entry[2], time.monotonic())
             return True
-        except Exception as e:
-            logger.error(f"Ошибка при сохранении {filepath}: {e}")
+    
+    def flush(self) -> bool:
+        """Сразу записать все отложенные правки (при остановке бота и перед бекапом)
+        
+        Отложенные записи не отменяются: записанная правка повторно не пишется,
+        поэтому flush можно вызывать и из пула потоков.
+        """
+        return all([self._write_file(filepath) for filepath in list(self._dirty)])
+    
+    def invalidate(self, filepath: str = None):
+        """Сбросить кэш файла (или всех файлов) — следующее чтение пойдёт с диска"""
+        if filepath is None:
+            for path in list(self._cache):
+                self.invalidate(path)
+            return
+        if filepath in self._dirty:
+            # Несохранённая правка новее файла — сначала записать её
+            self._write_file(filepath)
+        if self._cache.pop(filepath, None) is not None:
+            self._versions[filepath] = self._versions.get(filepath, 0) + 1
+    
+    def get_version(self, filepath: str = None) -> int:
+        """Версия содержимого файла (или сумма по всем файлам) — для кэшей поверх контента"""
+        if filepath is None:
+            return sum(self._versions.values())
+        return self._versions.get(filepath, 0)
+    
+    def poll(self) -> List[str]:
+        """Проверить файлы контента и перечитать изменившиеся (вызывается наблюдателем в пуле потоков)
+        
+        Returns:
+            Файлы, данные которых заменены (первая загрузка файла не считается)
+        """
+        changed = []
+        for filepath, default in self._defaults.items():
+            if filepath in self._dirty:
+                continue
+            mtime, size = self._stat(filepath)
+            entry = self._cache.get(filepath)
+            if entry is not None and (entry[0], entry[1]) == (mtime, size):
+                continue
+            if self._rejected.get(filepath) == (mtime, size):
+                continue
+            if self._reload(filepath, default, mtime, size) and entry is not None:
+                changed.append(filepath)
+        return changed
+    
+    async def watch(self, interval: float = CONTENT_WATCH_INTERVAL):
+        """Фоновая задача: следить за файлами контента (правки на сервере, update_server.sh)"""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.poll)
+        self._watching = True
+        try:
+            while True:
+                await asyncio.sleep(interval)
+                try:
+                    changed = await loop.run_in_executor(None, self.poll)
+                except Exception as e:
+                    logger.error(f"Ошибка проверки файлов контента: {e}")
+                    continue
+                for filepath in changed:
+                    logger.info(f"Контент перечитан: {filepath}")
+        finally:
+            self._watching = False
+    
+    # ==================== ИСТОРИЯ ====================
+    
+    def get_history(self, name: str, limit: int = None) -> List[Dict]:
+        """
+        Версии файла контента, от новой к старой
+        
+        Args:
+            name: "portfolio", "faq", "contacts" или "about"
+            limit: Сколько последних версий вернуть
+        """
+        return self.history.versions(name, limit) if name in self._paths else []
+    
+    def rollback(self, name: str, version: int) -> bool:
+        """Вернуть файл контента к версии из истории (откат тоже становится новой версией)"""
+        filepath = self._paths.get(name)
+        if filepath is None:
+            return False
+        data = self.history.load(name, version)
+        if data is None or self._validate(filepath, data):
+            logger.warning(f"Откат {name} к версии {version} невозможен")
             return False
+        logger.info(f"Откат {name} к версии {version}")
+        return self._save_json(filepath, data, note=f"откат к версии {version}")
+    
+    # ==================== СПИСКИ С ID ====================
+    
+    def _get_index(self, filepath: str):
+        """Список и индекс ID -> позиция (индекс пересобирается только при изменении файла)"""
+        items = self._load_json(filepath, [])
+        cached = self._indexes.get(filepath)
+        if cached is None or cached[0] is not items:
+            cached = self._indexes[filepath] = (items, {item["id"]: i for i, item in enumerate(items)})
+        return cached
+    
+    def _get_item(self, filepath: str, item_id: str) -> Optional[Dict]:
+        items, index = self._get_index(filepath)
+        position = index.get(item_id)
+        return None if position is None else items[position]
+    
+    def _allocate_id(self, filepath: str, prefix: str) -> str:
+        """
+        Новый ID элемента списка: номера только растут и не выдаются повторно,
+        даже после удаления элементов (последний номер хранится в ids.json)
+        """
+        name = os.path.splitext(os.path.basename(filepath))[0]
+        items, index = self._get_index(filepath)
+        counters = self._load_json(self.ids_file, {})
+        number = counters.get(name)
+        if number is None:
+            # Первый запуск: продолжаем нумерацию существующих элементов
+            number = max((int(item_id[len(prefix):]) for item_id in index
+                          if item_id.startswith(prefix) and item_id[len(prefix):].isdigit()), default=0)
+        number += 1
+        while f"{prefix}{number}" in index:
+            # ID, добавленный вручную в файл
+            number += 1
+        self._save_json(self.ids_file, {**counters, name: number}, note="")
+        return f"{prefix}{number}"
+    
+    def _add_item(self, filepath: str, prefix: str, item: Dict) -> bool:
+        with self._edit_lock(filepath):
+            item = {"id": self._allocate_id(filepath, prefix), **item}
+            items, _ = self._get_index(filepath)
+            return self._save_json(filepath, items + [item])
+    
+    def _update_item(self, filepath: str, item_id: str, changes: Dict) -> bool:
+        """
+        Изменить элемент по ID. Позиция ищется по индексу за O(1), но сохранение
+        копирует список (и заново строит индекс) — как и удаление, это O(n)
+        """
+        with self._edit_lock(filepath):
+            items, index = self._get_index(filepath)
+            position = index.get(item_id)
+            if position is None:
+                logger.warning(f"{item_id} не найден в {filepath}")
+                return False
+            updated = list(items)
+            updated[position] = {**items[position], **changes, "updated_date": datetime.now().isoformat()}
+            return self._save_json(filepath, updated)
+    
+    def _delete_item(self, filepath: str, item_id: str) -> bool:
+        """Удалить элемент по ID (новый список без него — O(n))"""
+        with self._edit_lock(filepath):
+            items, index = self._get_index(filepath)
+            position = index.get(item_id)
+            if position is None:
+                logger.warning(f"{item_id} не найден в {filepath}")
+                return False
+            return self._save_json(filepath, items[:position] + items[position + 1:])
     
     # ==================== ПОРТФОЛИО ====================
     
@@ -59,47 +446,44 @@ class ContentManager:
         """Получить все кейсы портфолио"""
         return self._load_json(self.portfolio_file, [])
     
+    def get_portfolio_case(self, case_id: str) -> Optional[Dict]:
+        """Найти кейс по ID"""
+        return self._get_item(self.portfolio_file, case_id)
+    
+    def get_portfolio_position(self, case_id: str) -> Optional[int]:
+        """Позиция кейса в портфолио (для листания карусели) или None"""
+        return self._get_index(self.portfolio_file)[1].get(case_id)
+    
+    def get_portfolio_media(self, case_id: str) -> List[tuple]:
+        """Медиафайлы кейса: [("photo" | "video", путь)], несуществующие файлы пропускаются"""
+        case = self.get_portfolio_case(case_id)
+        result = []
+        for name in (case or {}).get("media", []):
+            path = os.path.join(self.content_dir, name)
+            kind = media_type(path)
+            if kind is None or not os.path.isfile(path):
+                logger.warning(f"Кейс {case_id}: медиафайл {name} не найден или не поддерживается")
+                continue
+            result.append((kind, path))
+        return result
+    
     def add_portfolio_case(self, title: str, desc: str, details: str) -> bool:
         """Добавить новый кейс в портфолио"""
-        portfolio = self.get_portfolio()
-        
-        # Генерируем ID
-        case_id = f"case_{len(portfolio) + 1}"
-        
-        new_case = {
-            "id": case_id,
+        return self._add_item(self.portfolio_file, "case_", {
             "title": title,
             "desc": desc,
             "details": details,
             "added_date": datetime.now().isoformat()
-        }
-        
-        portfolio.append(new_case)
-        return self._save_json(self.portfolio_file, portfolio)
+        })
     
     def update_portfolio_case(self, case_id: str, title: str = None, desc: str = None, details: str = None) -> bool:
         """Редактировать существующий кейс"""
-        portfolio = self.get_portfolio()
-        
-        for case in portfolio:
-            if case["id"] == case_id:
-                if title:
-                    case["title"] = title
-                if desc:
-                    case["desc"] = desc
-                if details:
-                    case["details"] = details
-                case["updated_date"] = datetime.now().isoformat()
-                return self._save_json(self.portfolio_file, portfolio)
-        
-        logger.warning(f"Кейс {case_id} не найден")
-        return False
+        changes = {key: value for key, value in (("title", title), ("desc", desc), ("details", details)) if value}
+        return self._update_item(self.portfolio_file, case_id, changes)
     
     def delete_portfolio_case(self, case_id: str) -> bool:
         """Удалить кейс из портфолио"""
-        portfolio = self.get_portfolio()
-        portfolio = [c for c in portfolio if c["id"] != case_id]
-        return self._save_json(self.portfolio_file, portfolio)
+        return self._delete_item(self.portfolio_file, case_id)
     
     # ==================== FAQ ====================
     
@@ -107,61 +491,47 @@ class ContentManager:
         """Получить все Q&A"""
         return self._load_json(self.faq_file, [])
     
+    def get_faq_item(self, faq_id: str) -> Optional[Dict]:
+        """Найти вопрос по ID"""
+        return self._get_item(self.faq_file, faq_id)
+    
     def add_faq(self, question: str, answer: str) -> bool:
         """Добавить новый вопрос/ответ"""
-        faq = self.get_faq()
-        
-        faq_id = f"faq_{len(faq) + 1}"
-        
-        new_faq = {
-            "id": faq_id,
+        return self._add_item(self.faq_file, "faq_", {
             "q": question,
             "a": answer,
             "added_date": datetime.now().isoformat()
-        }
-        
-        faq.append(new_faq)
-        return self._save_json(self.faq_file, faq)
+        })
     
     def update_faq(self, faq_id: str, question: str = None, answer: str = None) -> bool:
         """Редактировать вопрос/ответ"""
-        faq = self.get_faq()
-        
-        for item in faq:
-            if item["id"] == faq_id:
-                if question:
-                    item["q"] = question
-                if answer:
-                    item["a"] = answer
-                item["updated_date"] = datetime.now().isoformat()
-                return self._save_json(self.faq_file, faq)
-        
-        logger.warning(f"FAQ {faq_id} не найден")
-        return False
+        changes = {key: value for key, value in (("q", question), ("a", answer)) if value}
+        return self._update_item(self.faq_file, faq_id, changes)
     
     def delete_faq(self, faq_id: str) -> bool:
         """Удалить вопрос/ответ"""
-        faq = self.get_faq()
-        faq = [f for f in faq if f["id"] != faq_id]
-        return self._save_json(self.faq_file, faq)
+        return self._delete_item(self.faq_file, faq_id)
     
     # ==================== КОНТАКТЫ ====================
     
+    DEFAULT_CONTACTS = {
+        "telegram": "@ваш_ник",
+        "email": "email@example.com",
+        "phone": "+7 (XXX) XXX-XX-XX",
+        "whatsapp": ""
+    }
+    
     def get_contacts(self) -> Dict:
         """Получить контакты"""
-        return self._load_json(self.contacts_file, {
-            "telegram": "@ваш_ник",
-            "email": "email@example.com",
-            "phone": "+7 (XXX) XXX-XX-XX",
-            "whatsapp": ""
-        })
+        return self._load_json(self.contacts_file, self.DEFAULT_CONTACTS)
     
     def update_contacts(self, **kwargs) -> bool:
         """Обновить контакты"""
-        contacts = self.get_contacts()
-        contacts.update(kwargs)
-        contacts["updated_date"] = datetime.now().isoformat()
-        return self._save_json(self.contacts_file, contacts)
+        with self._edit_lock(self.contacts_file):
+            contacts = self._load_for_update(self.contacts_file, self.DEFAULT_CONTACTS)
+            contacts.update(kwargs)
+            contacts["updated_date"] = datetime.now().isoformat()
+            return self._save_json(self.contacts_file, contacts)
     
     # ==================== О СЕБЕ ====================
     
@@ -202,3 +572,4 @@ class ContentManager:
 
 # Глобальный экземпляр
 content_manager = ContentManager()
+
@@ -1,93 +1,1053 @@
 # data.py
-# Работа с хранилищем заказов (Google Sheets опционально, иначе in-memory)
+# Работа с хранилищем заказов (SQLite на диске, Google Sheets опционально)
 
 import os
+import json
+import asyncio
+import sqlite3
 import logging
-from datetime import datetime
+import weakref
+import threading
+from datetime import datetime, timedelta
+from collections.abc import MutableMapping
 
-# In-memory хранилище если Google Sheets недоступен
-TICKETS_DB = {}  # {user_id: {order_id: {...}, ...}}
-REFERRALS_DB = {}  # {user_id: [referred_user_ids]}
-BONUSES_DB = {}  # {user_id: bonus_amount}
+from sheets import USE_GSHEET, sheets_queue, sheets_sync
+from journal import Journal
+from archive import SegmentArchive
+from ticket import Ticket, to_epoch as _to_epoch
 
 try:
-    from oauth2client.service_account import ServiceAccountCredentials
-    import gspread
-    
-    CREDS_FILE = "google-credentials.json"
-    SCOPE = ["https://spreadsheets.google.com/auth/spreadsheets"]
-    USE_GSHEET = os.path.exists(CREDS_FILE)
-    
-    if USE_GSHEET:
+    from config import TICKETS_DB_FILE
+except ImportError:
+    TICKETS_DB_FILE = os.path.join("db", "tickets.db")
+
+try:
+    from config import JOURNAL_DIR
+except ImportError:
+    JOURNAL_DIR = "db"
+
+try:
+    from config import JOURNAL_SNAPSHOT_EVERY
+except ImportError:
+    JOURNAL_SNAPSHOT_EVERY = 1000  # записей журнала между снимками
+
+try:
+    from config import ARCHIVE_DIR
+except ImportError:
+    ARCHIVE_DIR = os.path.join("db", "archive")
+
+try:
+    from config import ARCHIVE_AFTER_DAYS
+except ImportError:
+    ARCHIVE_AFTER_DAYS = 180  # любые заказы старше N дней уходят в архив
+
+try:
+    from config import ARCHIVE_FINAL_AFTER_DAYS
+except ImportError:
+    ARCHIVE_FINAL_AFTER_DAYS = 30  # выполненные и отменённые — старше N дней
+
+ARCHIVE_FINAL_STATUSES = ("выполнен", "отменён")
+ARCHIVE_BATCH = 10000  # заказов в одном сегменте
+
+# Сколько последних заказов показывать в текстовом ответе о статусе
+RECENT_TICKETS_LIMIT = 10
+
+# Возможные статусы заказа
+TICKET_STATUSES = ["новый", "в работе", "выполнен", "отменён"]
+
+REFERRALS_DB = {}  # {user_id: {referred_user_ids}}
+REFERRER_OF = {}  # {user_id: referrer_id} — кто пригласил пользователя (первое приглашение)
+BONUSES_DB = {}  # {user_id: bonus_amount} — баланс, материализованный из журнала бонусов (BonusLedger)
+
+
+class TicketStore:
+    """Хранилище заказов в SQLite (режим WAL)
+
+    Заказы лежат на диске и читаются по индексам, поэтому в памяти
+    процесса не держится вся история заказов.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS tickets (
+            order_id  TEXT PRIMARY KEY,
+            user_id   INTEGER NOT NULL,
+            status    TEXT NOT NULL,
+            timestamp INTEGER NOT NULL,
+            data      BLOB NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_tickets_user ON tickets(user_id, timestamp);
+        CREATE INDEX IF NOT EXISTS idx_tickets_status_ts ON tickets(status, timestamp);
+        CREATE INDEX IF NOT EXISTS idx_tickets_timestamp ON tickets(timestamp);
+        DROP INDEX IF EXISTS idx_tickets_status;
+
+        -- Заказы в архиве: в каком сегменте искать (сами заказы — в archive.py)
+        CREATE TABLE IF NOT EXISTS archived_orders (
+            order_id  TEXT PRIMARY KEY,
+            user_id   INTEGER NOT NULL,
+            timestamp INTEGER NOT NULL,
+            segment   TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_archived_user ON archived_orders(user_id, timestamp);
+
+        -- Номер последнего изменения каждого заказа (для инкрементальных бекапов).
+        -- Ведётся триггерами, поэтому учитываются все пути записи, включая архивацию.
+        CREATE TABLE IF NOT EXISTS ticket_changes (
+            order_id TEXT PRIMARY KEY,
+            seq      INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_ticket_changes_seq ON ticket_changes(seq);
+        CREATE TRIGGER IF NOT EXISTS trg_tickets_insert AFTER INSERT ON tickets BEGIN
+            INSERT OR REPLACE INTO ticket_changes
+            VALUES (NEW.order_id, (SELECT COALESCE(MAX(seq), 0) + 1 FROM ticket_changes));
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_tickets_update AFTER UPDATE ON tickets BEGIN
+            INSERT OR REPLACE INTO ticket_changes
+            VALUES (NEW.order_id, (SELECT COALESCE(MAX(seq), 0) + 1 FROM ticket_changes));
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_tickets_delete AFTER DELETE ON tickets BEGIN
+            INSERT OR REPLACE INTO ticket_changes
+            VALUES (OLD.order_id, (SELECT COALESCE(MAX(seq), 0) + 1 FROM ticket_changes));
+        END;
+    """
+
+    def __init__(self, path: str = TICKETS_DB_FILE):
+        """
+        Инициализация хранилища
+
+        Args:
+            path: Путь к файлу базы данных SQLite
+        """
+        self.path = path
+        dirname = os.path.dirname(path)
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname)
+
+        # Соединение используется из разных потоков, поэтому доступ под блокировкой
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(self.SCHEMA)
+
+    @staticmethod
+    def _row_to_ticket(row) -> Ticket:
+        """Преобразовать строку таблицы в запись заказа (анкета не разбирается)"""
+        return Ticket(*row)
+
+    @staticmethod
+    def _ticket_params(user_id, order_id, ticket) -> tuple:
+        if isinstance(ticket, Ticket):
+            return (str(order_id), int(user_id), ticket.status, ticket.ts, ticket.payload)
+        return (
+            str(order_id),
+            int(user_id),
+            ticket.get("status", "новый"),
+            _to_epoch(ticket.get("timestamp")),
+            json.dumps(ticket.get("data", {}), ensure_ascii=False).encode("utf-8")
+        )
+
+    def save(self, user_id, order_id, ticket):
+        """Сохранить (или перезаписать) заказ"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO tickets VALUES (?, ?, ?, ?, ?)",
+                self._ticket_params(user_id, order_id, ticket)
+            )
+
+    def save_many(self, tickets_by_user: dict):
+        """Сохранить заказы нескольких пользователей одной транзакцией"""
+        params = [
+            self._ticket_params(user_id, order_id, ticket)
+            for user_id, tickets in tickets_by_user.items()
+            for order_id, ticket in tickets.items()
+        ]
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO tickets VALUES (?, ?, ?, ?, ?)", params)
+
+    def get(self, order_id) -> Ticket:
+        """Получить заказ по номеру (или None)"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT order_id, user_id, status, timestamp, data FROM tickets WHERE order_id = ?",
+                (str(order_id),)
+            ).fetchone()
+        return self._row_to_ticket(row) if row else None
+
+    def get_user_tickets(self, user_id) -> dict:
+        """Получить заказы пользователя {order_id: ticket} в порядке создания"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT order_id, user_id, status, timestamp, data FROM tickets "
+                "WHERE user_id = ? ORDER BY timestamp, rowid",
+                (int(user_id),)
+            ).fetchall()
+        return {row[0]: self._row_to_ticket(row) for row in rows}
+
+    def get_user_page(self, user_id, limit: int, cursor: tuple = None, newer: bool = False):
+        """
+        Страница заказов пользователя от новых к старым (keyset-пагинация по индексу
+        idx_tickets_user: стоимость не зависит от номера страницы)
+
+        Args:
+            user_id: ID пользователя
+            limit: Заказов на странице
+            cursor: (timestamp, rowid) заказа, от которого листать; None — первая страница
+            newer: Листать к более новым заказам (иначе к более старым)
+
+        Returns:
+            (список пар (курсор, Ticket) от новых к старым, есть ли ещё заказы в этом направлении)
+        """
+        query = "SELECT timestamp, rowid, order_id, user_id, status, timestamp, data FROM tickets WHERE user_id = ?"
+        params = [int(user_id)]
+        if cursor is not None:
+            query += " AND (timestamp, rowid) > (?, ?)" if newer else " AND (timestamp, rowid) < (?, ?)"
+            params.extend(cursor)
+        order = "ASC" if newer else "DESC"
+        query += f" ORDER BY timestamp {order}, rowid {order} LIMIT ?"
+        params.append(limit + 1)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if newer:
+            rows.reverse()
+        return [((row[0], row[1]), self._row_to_ticket(row[2:])) for row in rows], has_more
+
+    def query(self, status: str = None, since: int = None, until: int = None, user_id=None,
+              newest_first: bool = True, limit: int = 50) -> list:
+        """
+        Выборка заказов по фильтрам с сортировкой по времени создания
+
+        Фильтр по статусу и времени идёт по индексу idx_tickets_status_ts,
+        только по времени — по idx_tickets_timestamp, по пользователю —
+        по idx_tickets_user, поэтому стоимость пропорциональна размеру ответа.
+
+        Args:
+            status: Статус заказа
+            since: Не раньше (unix-время, включительно)
+            until: Раньше чем (unix-время, не включительно)
+            user_id: ID пользователя
+            newest_first: Сначала новые
+            limit: Максимум заказов в ответе
+        """
+        conditions, params = [], []
+        if status is not None:
+            conditions.append("status = ?")
+            params.append(status)
+        if user_id is not None:
+            conditions.append("user_id = ?")
+            params.append(int(user_id))
+        if since is not None:
+            conditions.append("timestamp >= ?")
+            params.append(int(since))
+        if until is not None:
+            conditions.append("timestamp < ?")
+            params.append(int(until))
+
+        query = "SELECT order_id, user_id, status, timestamp, data FROM tickets"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        order = "DESC" if newest_first else "ASC"
+        query += f" ORDER BY timestamp {order}, rowid {order} LIMIT ?"
+        params.append(int(limit))
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [self._row_to_ticket(row) for row in rows]
+
+    def count_by_status(self, since: int = None) -> dict:
+        """Количество заказов по статусам {status: count} (по индексу, без чтения анкет)"""
+        query = "SELECT status, COUNT(*) FROM tickets"
+        params = []
+        if since is not None:
+            query += " WHERE timestamp >= ?"
+            params.append(int(since))
+        query += " GROUP BY status"
+        with self._lock:
+            return dict(self._conn.execute(query, params).fetchall())
+
+    def set_status(self, order_id, status: str) -> bool:
+        """Изменить статус заказа (True если заказ найден)"""
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "UPDATE tickets SET status = ? WHERE order_id = ?", (status, str(order_id))
+            )
+        return cursor.rowcount > 0
+
+    def has_user(self, user_id) -> bool:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM tickets WHERE user_id = ? LIMIT 1", (int(user_id),)
+            ).fetchone()
+        return row is not None
+
+    def user_ids(self) -> list:
+        with self._lock:
+            rows = self._conn.execute("SELECT DISTINCT user_id FROM tickets ORDER BY user_id").fetchall()
+        return [row[0] for row in rows]
+
+    def count_users(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(DISTINCT user_id) FROM tickets").fetchone()[0]
+
+    def count(self) -> int:
+        """Общее количество заказов"""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM tickets").fetchone()[0]
+
+    def delete_user(self, user_id):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM tickets WHERE user_id = ?", (int(user_id),))
+
+    def archive_candidates(self, before: int, final_before: int, final_statuses, limit: int) -> list:
+        """Заказы для архива: созданные до before или в финальном статусе до final_before"""
+        marks = ",".join("?" * len(final_statuses))
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT order_id, user_id, status, timestamp, data FROM tickets WHERE timestamp < ? "
+                f"UNION SELECT order_id, user_id, status, timestamp, data FROM tickets "
+                f"WHERE status IN ({marks}) AND timestamp < ? LIMIT ?",
+                (before, *final_statuses, final_before, limit)
+            ).fetchall()
+        return [self._row_to_ticket(row) for row in rows]
+
+    def move_to_archive(self, tickets: list, segment: str):
+        """Отметить заказы как архивные и убрать их из tickets (одной транзакцией)"""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO archived_orders VALUES (?, ?, ?, ?)",
+                [(t.order_id, t.user_id, t.ts, segment) for t in tickets]
+            )
+            self._conn.executemany("DELETE FROM tickets WHERE order_id = ?", [(t.order_id,) for t in tickets])
+
+    def register_archived(self, entries: list):
+        """Добавить записи архива [(order_id, user_id, timestamp, segment)]"""
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO archived_orders VALUES (?, ?, ?, ?)", entries)
+
+    def archived_segment(self, order_id):
+        """Сегмент архива, в котором лежит заказ (или None)"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT segment FROM archived_orders WHERE order_id = ?", (str(order_id),)
+            ).fetchone()
+        return row[0] if row else None
+
+    def archived_for_user(self, user_id, limit: int, offset: int = 0) -> list:
+        """Архивные заказы пользователя [(order_id, segment)] от новых к старым"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT order_id, segment FROM archived_orders WHERE user_id = ? "
+                "ORDER BY timestamp DESC, order_id DESC LIMIT ? OFFSET ?",
+                (int(user_id), limit, offset)
+            ).fetchall()
+
+    def count_archived(self, user_id=None) -> int:
+        with self._lock:
+            if user_id is None:
+                return self._conn.execute("SELECT COUNT(*) FROM archived_orders").fetchone()[0]
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM archived_orders WHERE user_id = ?", (int(user_id),)
+            ).fetchone()[0]
+
+    def forget_archived(self, order_ids):
+        """Убрать записи архива для заказов, которые снова в tickets"""
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM archived_orders WHERE order_id = ?", [(str(o),) for o in order_ids])
+
+    def archived_ids(self) -> set:
+        with self._lock:
+            return {row[0] for row in self._conn.execute("SELECT order_id FROM archived_orders")}
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM tickets")
+
+    def change_seq(self) -> int:
+        """Номер последнего изменения заказов"""
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(MAX(seq), 0) FROM ticket_changes").fetchone()[0]
+
+    def changes_since(self, seq: int):
+        """
+        Заказы, изменённые после изменения номер seq
+
+        Returns:
+            (номер последнего изменения, {user_id: {order_id: ticket}}, [номера заказов, убранных из tickets])
+        """
+        changed, gone = {}, []
+        with self._lock:
+            last = self.change_seq()
+            rows = self._conn.execute(
+                "SELECT c.order_id, t.user_id, t.status, t.timestamp, t.data FROM ticket_changes c "
+                "LEFT JOIN tickets t ON t.order_id = c.order_id WHERE c.seq > ? ORDER BY c.seq",
+                (seq,)
+            ).fetchall()
+        for row in rows:
+            if row[1] is None:
+                gone.append(row[0])
+            else:
+                changed.setdefault(row[1], {})[row[0]] = self._row_to_ticket(row).to_dict()
+        return last, changed, gone
+
+    def export(self) -> dict:
+        """Выгрузить все заказы в виде {user_id: {order_id: ticket}}"""
+        result = {}
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT order_id, user_id, status, timestamp, data FROM tickets ORDER BY user_id, timestamp, rowid"
+            ).fetchall()
+        for row in rows:
+            result.setdefault(row[1], {})[row[0]] = self._row_to_ticket(row).to_dict()
+        return result
+
+
+class TicketsView(MutableMapping):
+    """Словарный интерфейс {user_id: {order_id: ticket}} поверх TicketStore
+
+    Сохраняет совместимость со старым кодом (бекапы, восстановление, статистика).
+    Возвращаемые словари заказов — копии: изменения нужно сохранять через save_ticket.
+    """
+
+    def __init__(self, store: TicketStore):
+        self._store = store
+
+    def __getitem__(self, user_id):
+        tickets = self._store.get_user_tickets(user_id)
+        if not tickets:
+            raise KeyError(user_id)
+        return tickets
+
+    def __setitem__(self, user_id, tickets):
+        self._store.delete_user(user_id)
+        self._store.save_many({user_id: tickets})
+
+    def __delitem__(self, user_id):
+        if not self._store.has_user(user_id):
+            raise KeyError(user_id)
+        self._store.delete_user(user_id)
+
+    def __contains__(self, user_id):
         try:
-            creds = ServiceAccountCredentials.from_json_keyfile_name(CREDS_FILE, SCOPE)
-            client = gspread.authorize(creds)
-            USE_GSHEET = True
-        except:
-            USE_GSHEET = False
-except:
-    USE_GSHEET = False
-
-def get_gsheet():
-    """Получить Google Sheet (если доступен)"""
-    if not USE_GSHEET:
-        return None
-    try:
-        sheet = client.open("BotOrders").sheet1
-        return sheet
-    except Exception as e:
-        logging.error(f"Ошибка подключения к Google Sheets: {e}")
-        return None
+            return self._store.has_user(user_id)
+        except (TypeError, ValueError):
+            return False
+
+    def __iter__(self):
+        return iter(self._store.user_ids())
+
+    def __len__(self):
+        return self._store.count_users()
+
+    def clear(self):
+        self._store.clear()
+
+    def update(self, other=(), **kwargs):
+        tickets_by_user = dict(other, **kwargs)
+        for user_id in tickets_by_user:
+            self._store.delete_user(user_id)
+        self._store.save_many(tickets_by_user)
+
+
+ticket_store = TicketStore()
+ticket_archive = SegmentArchive(ARCHIVE_DIR)
+TICKETS_DB = TicketsView(ticket_store)  # {user_id: {order_id: {...}, ...}}
+
 
 def save_ticket(user_id, order_id, data):
     """Сохранить заказ"""
-    ticket = {
-        "order_id": order_id,
-        "user_id": user_id,
-        "timestamp": datetime.now().isoformat(),
-        "status": "новый",
-        "data": data
-    }
-    
-    # Сохранить в памяти
-    if user_id not in TICKETS_DB:
-        TICKETS_DB[user_id] = {}
-    TICKETS_DB[user_id][order_id] = ticket
-    
-    # Попытаться сохранить в Google Sheets
+    ticket = Ticket(order_id, user_id, "новый", int(datetime.now().timestamp()), data)
+
+    # Сохранить в SQLite
+    ticket_store.save(user_id, order_id, ticket)
+
+    # Поставить строку в очередь записи в Google Sheets
     if USE_GSHEET:
-        try:
-            sheet = get_gsheet()
-            if sheet:
-                sheet.append_row([
-                    order_id,
-                    user_id,
-                    data.get('fio', ''),
-                    data.get('contact', ''),
-                    "новый",
-                    datetime.now().isoformat()
-                ])
-        except Exception as e:
-            logging.warning(f"Не удалось сохранить в Google Sheets: {e}")
+        sheets_queue.put([
+            order_id,
+            user_id,
+            data.get('fio', ''),
+            data.get('contact', ''),
+            "новый",
+            ticket["timestamp"],
+            ticket["timestamp"]
+        ])
 
 def get_ticket_status(user_id, order_id=None):
     """Получить статус заказов пользователя"""
-    # Ищем в памяти
-    if user_id in TICKETS_DB:
-        if order_id:
-            ticket = TICKETS_DB[user_id].get(order_id, {})
-            if ticket:
-                return f"Статус: {ticket.get('status', 'неизвестно')}\nВремя: {ticket.get('timestamp', '')}"
-        # Вернуть все заказы пользователя
-        tickets = TICKETS_DB[user_id]
-        if tickets:
-            result = "Ваши заказы:\n"
-            for tid, tdata in tickets.items():
-                result += f"• {tid}: {tdata.get('status', 'неизвестно')}\n"
-            return result
-    
+    if order_id:
+        ticket = get_ticket(order_id)
+        if ticket and ticket["user_id"] == user_id:
+            return f"Статус: {ticket.get('status', 'неизвестно')}\nВремя: {ticket.get('timestamp', '')}"
+
+    # Вернуть последние заказы пользователя (вся история листается постранично)
+    items, has_more = ticket_store.get_user_page(user_id, RECENT_TICKETS_LIMIT)
+    if items:
+        result = "Ваши последние заказы:\n" if has_more else "Ваши заказы:\n"
+        for _, ticket in items:
+            result += f"• {ticket.order_id}: {ticket.status}\n"
+        return result
+
     return "У вас нет заказов"
 
+def get_ticket_page(user_id, per_page: int, cursor: str = None, newer: bool = False) -> dict:
+    """
+    Страница истории заказов пользователя
+
+    Args:
+        user_id: ID пользователя
+        per_page: Заказов на странице
+        cursor: Курсор из предыдущей страницы ("timestamp:rowid"), None — последние заказы
+        newer: Листать к более новым заказам
+
+    Returns:
+        {"tickets": [Ticket, ...], "newer": курсор или None, "older": курсор или None,
+         "archived": сколько заказов пользователя в архиве}
+    """
+    position = None
+    if cursor:
+        try:
+            ts, rowid = cursor.split(":")
+            position = (int(ts), int(rowid))
+        except ValueError:
+            position = None
+    items, has_more = ticket_store.get_user_page(user_id, per_page, position, newer)
+    if position is not None and not items:
+        # Заказы по курсору пропали (восстановление бекапа) — показать последние
+        position = None
+        items, has_more = ticket_store.get_user_page(user_id, per_page)
+
+    def _encode(item):
+        return f"{item[0][0]}:{item[0][1]}"
+
+    if position is None:
+        newer_cursor = None
+        older_cursor = _encode(items[-1]) if has_more else None
+    elif newer:
+        newer_cursor = _encode(items[0]) if has_more else None
+        older_cursor = _encode(items[-1])
+    else:
+        newer_cursor = _encode(items[0])
+        older_cursor = _encode(items[-1]) if has_more else None
+    return {
+        "tickets": [ticket for _, ticket in items],
+        "newer": newer_cursor,
+        "older": older_cursor,
+        "archived": ticket_store.count_archived(user_id),
+    }
+
+def get_ticket(order_id):
+    """Найти заказ по номеру (поиск по первичному ключу, без перебора пользователей)"""
+    ticket = ticket_store.get(order_id)
+    if ticket is None:
+        ticket = get_archived_ticket(order_id)
+    return ticket
+
+def _ticket_from_archive(entry: dict) -> Ticket:
+    return Ticket(entry["order_id"], entry["user_id"], entry["status"], _to_epoch(entry["timestamp"]), entry["data"])
+
+def get_archived_ticket(order_id):
+    """Найти заказ в архиве (сегмент читается через mmap, распаковывается один блок)"""
+    segment = ticket_store.archived_segment(order_id)
+    if segment is None:
+        return None
+    entry = ticket_archive.get(segment, order_id)
+    return _ticket_from_archive(entry) if entry else None
+
+def is_ticket_archived(order_id) -> bool:
+    return ticket_store.archived_segment(order_id) is not None
+
+def get_archived_page(user_id, per_page: int, offset: int = 0) -> dict:
+    """
+    Страница архивных заказов пользователя (от новых к старым)
+
+    Returns:
+        {"tickets": [Ticket, ...], "offset": offset, "total": всего в архиве}
+    """
+    locations = ticket_store.archived_for_user(user_id, per_page, offset)
+    found = ticket_archive.get_many([(segment, order_id) for order_id, segment in locations])
+    tickets = [_ticket_from_archive(found[order_id]) for order_id, _ in locations if order_id in found]
+    return {"tickets": tickets, "offset": offset, "total": ticket_store.count_archived(user_id)}
+
+def archive_tickets(now: datetime = None) -> int:
+    """
+    Перенести старые и завершённые заказы в архив
+
+    Сначала сегмент записывается на диск, затем одной транзакцией заказы
+    отмечаются архивными и удаляются из tickets.
+
+    Returns:
+        Количество перенесённых заказов
+    """
+    now = now or datetime.now()
+    before = int((now - timedelta(days=ARCHIVE_AFTER_DAYS)).timestamp())
+    final_before = int((now - timedelta(days=ARCHIVE_FINAL_AFTER_DAYS)).timestamp())
+    moved = 0
+    while True:
+        tickets = ticket_store.archive_candidates(before, final_before, ARCHIVE_FINAL_STATUSES, ARCHIVE_BATCH)
+        if not tickets:
+            break
+        segment = ticket_archive.write([t.to_dict() for t in tickets])
+        ticket_store.move_to_archive(tickets, segment)
+        moved += len(tickets)
+    if moved:
+        logging.info(f"В архив перенесено заказов: {moved}")
+    return moved
+
+def set_ticket_status(order_id, status):
+    """Изменить статус заказа (и отправить изменение в Google Sheets)"""
+    if not ticket_store.set_status(order_id, status):
+        return False
+    if USE_GSHEET:
+        sheets_sync.enqueue_status(order_id, status)
+    return True
+
+def _get_status_for_sync(order_id):
+    ticket = ticket_store.get(order_id)
+    return ticket.status if ticket else None
+
+# Статусы, изменённые в таблице, записываются напрямую (без отправки обратно)
+sheets_sync.bind(_get_status_for_sync, ticket_store.set_status, TICKET_STATUSES)
+
+def query_tickets(status=None, since=None, until=None, user_id=None, newest_first=True, limit=50) -> list:
+    """
+    Найти заказы по статусу, времени создания и пользователю
+
+    since/until принимают datetime, ISO-строку или unix-время.
+    Пример: query_tickets("новый", since=datetime.now() - timedelta(days=1))
+    """
+    return ticket_store.query(
+        status,
+        _to_epoch(since) if since is not None else None,
+        _to_epoch(until) if until is not None else None,
+        user_id, newest_first, limit
+    )
+
+def count_tickets_by_status(since=None) -> dict:
+    """Количество заказов по статусам (since — datetime, ISO-строка или unix-время)"""
+    return ticket_store.count_by_status(_to_epoch(since) if since is not None else None)
+
 def get_all_tickets():
     """Получить все заказы"""
-    return TICKETS_DB
+    return ticket_store.export()
+
+
+# ==================== РЕФЕРАЛЫ И БОНУСЫ ====================
+# Изменения рефералов пишутся в журнал (journal.py), операции с бонусами —
+# в таблицу bonus_ledger (BonusLedger), заказы — в таблицу tickets.
+
+_journal = Journal(JOURNAL_DIR)
+
+# Счётчики поддерживаются при каждом изменении, чтобы статистика не перебирала данные
+_counters = {"referrals": 0, "bonus_total": 0}
+
+# Пригласившие, у которых появились рефералы после последнего бекапа
+_changed_referrers = set()
+
+
+def _user_key(key):
+    """Ключи-идентификаторы из JSON приходят строками — вернуть им тип int"""
+    try:
+        return int(key)
+    except (TypeError, ValueError):
+        return key
+
+
+def _attach_referral(ref_id, user_id) -> bool:
+    """Привязать пользователя к пригласившему (только первое приглашение)"""
+    if user_id == ref_id or user_id in REFERRER_OF:
+        return False
+    REFERRER_OF[user_id] = ref_id
+    REFERRALS_DB.setdefault(ref_id, set()).add(user_id)
+    _counters["referrals"] += 1
+    return True
+
+
+def add_referral(ref_id, user_id) -> bool:
+    """
+    Записать приглашённого пользователя (атрибуция по первому касанию)
+
+    Returns:
+        True если пользователь привязан впервые (за него положен бонус)
+    """
+    if not _attach_referral(ref_id, user_id):
+        return False
+    _journal.append("set", "referrers", user_id, ref_id)
+    _changed_referrers.add(ref_id)
+    return True
+
+
+def get_referral_count(ref_id) -> int:
+    """Сколько пользователей пригласил ref_id"""
+    return len(REFERRALS_DB.get(ref_id, ()))
+
+
+def get_referral_stats() -> dict:
+    """Общее число рефералов и сумма бонусов на балансах"""
+    return {"total_referrals": _counters["referrals"], "bonus_total": _counters["bonus_total"]}
+
+
+class InsufficientBonusError(ValueError):
+    """На балансе недостаточно бонусов для списания"""
+
+
+class BonusLedger:
+    """Журнал операций с бонусами в SQLite (только добавление записей)
+
+    Каждое начисление и списание — отдельная строка с причиной и ключом
+    идемпотентности (например, "order:<номер заказа>"): повторная операция
+    с тем же ключом не применяется. Баланс пользователя — сумма его записей,
+    он материализуется в BONUSES_DB, поэтому чтение баланса — O(1).
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS bonus_ledger (
+            id         INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id    INTEGER NOT NULL,
+            amount     INTEGER NOT NULL,
+            reason     TEXT NOT NULL,
+            idem_key   TEXT UNIQUE,
+            created_at INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_bonus_ledger_user ON bonus_ledger(user_id, id);
+    """
+
+    def __init__(self, path: str = TICKETS_DB_FILE):
+        """
+        Инициализация журнала бонусов
+
+        Args:
+            path: Путь к файлу базы данных SQLite (общий с заказами)
+        """
+        self.path = path
+        dirname = os.path.dirname(path)
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname)
+
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(self.SCHEMA)
+
+    def post(self, user_id, amount: int, reason: str, key: str = None, allow_negative: bool = False):
+        """
+        Записать операцию с бонусами одной транзакцией
+
+        Args:
+            user_id: ID пользователя
+            amount: Сумма (отрицательная — списание)
+            reason: Причина операции (для аудита)
+            key: Ключ идемпотентности, повтор с тем же ключом игнорируется
+            allow_negative: Разрешить уход баланса в минус
+
+        Returns:
+            (применена ли операция, баланс после операции)
+
+        Raises:
+            InsufficientBonusError: Если списание больше баланса
+        """
+        with self._lock, self._conn:
+            if key is not None and self._conn.execute(
+                "SELECT 1 FROM bonus_ledger WHERE idem_key = ?", (key,)
+            ).fetchone():
+                return False, self.balance(user_id)
+            balance = self.balance(user_id)
+            if amount < 0 and balance + amount < 0 and not allow_negative:
+                raise InsufficientBonusError(f"Баланс {balance}, списание {-amount}")
+            self._conn.execute(
+                "INSERT INTO bonus_ledger (user_id, amount, reason, idem_key, created_at) VALUES (?, ?, ?, ?, ?)",
+                (int(user_id), int(amount), reason, key, int(datetime.now().timestamp()))
+            )
+        return True, balance + amount
+
+    def balance(self, user_id) -> int:
+        """Баланс пользователя по журналу"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COALESCE(SUM(amount), 0) FROM bonus_ledger WHERE user_id = ?", (int(user_id),)
+            ).fetchone()[0]
+
+    def balances(self) -> dict:
+        """Балансы всех пользователей {user_id: amount}"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT user_id, SUM(amount) FROM bonus_ledger GROUP BY user_id"
+            ).fetchall()
+        return dict(rows)
+
+    def history(self, user_id=None, limit: int = None, after_id: int = None) -> list:
+        """История операций (всех или одного пользователя, после записи after_id), новые в конце"""
+        query = "SELECT id, user_id, amount, reason, idem_key, created_at FROM bonus_ledger"
+        conditions, params = [], []
+        if user_id is not None:
+            conditions.append("user_id = ?")
+            params.append(int(user_id))
+        if after_id is not None:
+            conditions.append("id > ?")
+            params.append(int(after_id))
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY id DESC"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(int(limit))
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        rows.reverse()
+        fields = ("id", "user_id", "amount", "reason", "key", "created_at")
+        return [dict(zip(fields, row)) for row in rows]
+
+    def has_key(self, key: str) -> bool:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT 1 FROM bonus_ledger WHERE idem_key = ?", (key,)
+            ).fetchone() is not None
+
+    def replace_all(self, entries: list):
+        """Заменить всю историю операций (восстановление из бекапа)"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM bonus_ledger")
+            self._conn.executemany(
+                "INSERT INTO bonus_ledger (user_id, amount, reason, idem_key, created_at) VALUES (?, ?, ?, ?, ?)",
+                [(int(e["user_id"]), int(e["amount"]), e.get("reason", ""), e.get("key"),
+                  int(e.get("created_at") or datetime.now().timestamp())) for e in entries]
+            )
+
+
+bonus_ledger = BonusLedger()
+
+# Блокировки пользователей: операции с бонусами одного пользователя идут по очереди.
+# Словарь слабых ссылок: блокировка живёт, пока её держат или ждут (async with
+# хранит ссылку до выхода), затем запись удаляется сама — словарь не растёт
+# с каждым пользователем за время работы бота.
+_user_locks = weakref.WeakValueDictionary()
+
+
+def user_lock(user_id) -> asyncio.Lock:
+    """asyncio-блокировка для операций с бонусами и заказами пользователя"""
+    lock = _user_locks.get(user_id)
+    if lock is None:
+        lock = _user_locks[user_id] = asyncio.Lock()
+    return lock
+
+
+def _set_bonus(user_id, value):
+    _counters["bonus_total"] += value - BONUSES_DB.get(user_id, 0)
+    BONUSES_DB[user_id] = value
+
+
+def add_bonus(user_id, amount, reason: str = "", key: str = None, allow_negative: bool = False):
+    """
+    Начислить или списать бонусы через журнал бонусов
+
+    Returns:
+        Баланс пользователя после операции (повтор по тому же key ничего не меняет)
+
+    Raises:
+        InsufficientBonusError: Если списание больше баланса
+    """
+    applied, balance = bonus_ledger.post(user_id, amount, reason, key, allow_negative)
+    if applied:
+        _set_bonus(user_id, balance)
+    return balance
+
+
+def spend_bonus(user_id, amount, order_id) -> bool:
+    """
+    Списать бонусы за заказ (не более одного раза на заказ)
+
+    Returns:
+        True если списание выполнено сейчас или уже было выполнено для этого заказа,
+        False если бонусов на балансе не хватает
+    """
+    try:
+        add_bonus(user_id, -amount, f"Оплата заказа {order_id}", key=f"order:{order_id}")
+    except InsufficientBonusError:
+        return False
+    return True
+
+
+def get_bonus_history(user_id=None, limit: int = None) -> list:
+    """История операций с бонусами для аудита"""
+    return bonus_ledger.history(user_id, limit)
+
+
+def _materialize_bonuses():
+    """Пересчитать BONUSES_DB из журнала бонусов"""
+    BONUSES_DB.clear()
+    _counters["bonus_total"] = 0
+    for user_id, value in bonus_ledger.balances().items():
+        _set_bonus(user_id, value)
+
+
+def _migrate_legacy_bonuses(legacy: dict):
+    """Перенести балансы из старого журнала изменений в журнал бонусов (однократно)"""
+    for user_id, value in legacy.items():
+        key = f"migrate:{user_id}"
+        if not bonus_ledger.has_key(key):
+            bonus_ledger.post(user_id, value - bonus_ledger.balance(user_id),
+                              "Перенос баланса", key, allow_negative=True)
+
+
+def _apply_record(record: dict, legacy_bonuses: dict):
+    """Применить запись журнала к хранилищам"""
+    key = record["key"]
+    if record["store"] == "referrers" and record["op"] == "set":
+        _attach_referral(record["value"], key)
+    elif record["store"] == "referrals" and record["op"] == "append":
+        # Формат журнала до атрибуции по первому касанию
+        _attach_referral(key, record["value"])
+    elif record["store"] == "bonuses" and record["op"] == "set":
+        # Бонусы раньше журналировались здесь, теперь они в BonusLedger
+        legacy_bonuses[key] = record["value"]
+
+
+def _reset_referrals():
+    REFERRER_OF.clear()
+    REFERRALS_DB.clear()
+    _counters["referrals"] = 0
+
+
+def export_memory_state() -> dict:
+    """
+    Копия данных, которые живут в памяти (рефералы и бонусы)
+
+    Вызывается в потоке бота: копия снимается между обработчиками, поэтому
+    согласована. Дальше её можно сериализовать в другом потоке. Следующий
+    инкрементальный бекап отсчитывается от этой копии.
+    """
+    _changed_referrers.clear()
+    return {
+        "referrals": {ref_id: sorted(users) for ref_id, users in REFERRALS_DB.items()},
+        "bonuses": dict(BONUSES_DB),
+    }
+
+
+def export_memory_changes() -> dict:
+    """Рефералы, изменившиеся после прошлой выгрузки (для инкрементального бекапа, в потоке бота)"""
+    changed = {ref_id: sorted(REFERRALS_DB[ref_id]) for ref_id in _changed_referrers}
+    _changed_referrers.clear()
+    return {"referrals": changed}
+
+
+def export_stored_state() -> dict:
+    """Заказы (вместе с архивом) и журнал бонусов из SQLite — можно читать из любого потока"""
+    return {
+        "tickets": get_all_tickets(),
+        "bonus_ledger": bonus_ledger.history(),
+        "archived_tickets": list({t["order_id"]: t for t in ticket_archive.iter_all()}.values()),
+    }
+
+
+def export_stored_changes(since: dict = None):
+    """
+    Заказы и операции с бонусами для бекапа и отметка, от которой считать следующий
+
+    Args:
+        since: Отметка прошлого бекапа ({"ticket_seq", "ledger_id"}); None — выгрузить всё
+
+    Returns:
+        (данные, отметка). Инкрементальные данные содержат изменённые заказы,
+        номера заказов, убранных из tickets (deleted_orders), заказы, перенесённые
+        в архив, и новые операции с бонусами.
+    """
+    if since is None:
+        # Отметка берётся до выгрузки: изменения между ними попадут и в следующий бекап
+        seq = ticket_store.change_seq()
+        state = export_stored_state()
+    else:
+        seq, tickets, gone = ticket_store.changes_since(since["ticket_seq"])
+        archived = []
+        for order_id in gone:
+            segment = ticket_store.archived_segment(order_id)
+            entry = ticket_archive.get(segment, order_id) if segment else None
+            if entry:
+                archived.append(entry)
+        state = {
+            "tickets": tickets,
+            "deleted_orders": gone,
+            "archived_tickets": archived,
+            "bonus_ledger": bonus_ledger.history(after_id=since["ledger_id"]),
+        }
+    ledger = state["bonus_ledger"]
+    last_id = ledger[-1]["id"] if ledger else (since or {}).get("ledger_id", 0)
+    return state, {"ticket_seq": seq, "ledger_id": last_id}
+
+
+def export_state() -> dict:
+    """Сериализуемая копия заказов (вместе с архивом), рефералов и бонусов (для бекапа)"""
+    state = export_stored_state()
+    state.update(export_memory_state())
+    return state
+
+
+def snapshot_state():
+    """Сохранить снимок рефералов и обнулить журнал"""
+    _journal.snapshot({
+        "referrers": [[k, v] for k, v in REFERRER_OF.items()],
+    })
+
+
+def sync_journal():
+    """Периодическое обслуживание журнала: fsync и снимок по числу записей"""
+    _journal.sync()
+    if _journal.records_since_snapshot >= JOURNAL_SNAPSHOT_EVERY:
+        snapshot_state()
+
+
+def restore_state(restored: dict):
+    """Заменить заказы, рефералов и бонусы данными из бекапа"""
+    TICKETS_DB.clear()
+    TICKETS_DB.update(restored.get('tickets', {}))
+
+    # Архив не перезаписывается (сегменты неизменяемы): недостающие заказы
+    # дописываются новым сегментом, восстановленные в tickets — убираются из архива
+    hot_ids = {str(order_id) for tickets in restored.get('tickets', {}).values() for order_id in tickets}
+    ticket_store.forget_archived(hot_ids)
+    known = ticket_store.archived_ids() | hot_ids
+    missing = [t for t in restored.get('archived_tickets', []) if str(t["order_id"]) not in known]
+    if missing:
+        segment = ticket_archive.write(missing)
+        ticket_store.register_archived([
+            (str(t["order_id"]), int(t["user_id"]), _to_epoch(t["timestamp"]), segment) for t in missing
+        ])
+
+    _reset_referrals()
+    for ref_id, users in restored.get('referrals', {}).items():
+        for user_id in users:
+            _attach_referral(_user_key(ref_id), _user_key(user_id))
+
+    # Бекапы до журнала бонусов содержат только балансы
+    entries = restored.get('bonus_ledger')
+    if entries is None:
+        entries = [
+            {"user_id": _user_key(user_id), "amount": value, "reason": "Восстановление из бекапа"}
+            for user_id, value in restored.get('bonuses', {}).items() if value
+        ]
+    bonus_ledger.replace_all(entries)
+    _materialize_bonuses()
+
+    snapshot_state()
+
+
+def _load_state():
+    """Восстановить рефералов и бонусы: последний снимок + хвост журнала"""
+    stores, records = _journal.load()
+    for user_id, ref_id in stores.get("referrers", []):
+        _attach_referral(ref_id, user_id)
+    for ref_id, users in stores.get("referrals", []):
+        # Формат снимка до атрибуции по первому касанию
+        for user_id in users:
+            _attach_referral(ref_id, user_id)
+    legacy_bonuses = dict(stores.get("bonuses", []))
+    for record in records:
+        _apply_record(record, legacy_bonuses)
+    if records:
+        logging.info(f"Применено записей журнала: {len(records)}")
+
+    if legacy_bonuses:
+        _migrate_legacy_bonuses(legacy_bonuses)
+    _materialize_bonuses()
+
+
+_load_state()
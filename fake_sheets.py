@@ -0,0 +1,159 @@
+"""
+Локальная замена листа Google Sheets для работы и тестов без сети
+Поддерживает те методы gspread.Worksheet, которыми пользуется бот:
+append_rows, col_values, batch_get, batch_update, get_all_values.
+
+Включается в config.py:
+    SHEETS_FAKE_FILE = "db/fake_sheet.json"
+"""
+
+import os
+import re
+import json
+import threading
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+_A1_RE = re.compile(r"^(?:[^!]*!)?([A-Z]+)(\d*)(?::([A-Z]+)(\d*))?$")
+
+
+def column_letter(index: int) -> str:
+    """Номер столбца (с 1) -> буква (1 -> A, 27 -> AA)"""
+    letters = ""
+    while index:
+        index, rem = divmod(index - 1, 26)
+        letters = chr(ord("A") + rem) + letters
+    return letters
+
+
+def column_index(letters: str) -> int:
+    """Буква столбца -> номер (с 1)"""
+    index = 0
+    for ch in letters:
+        index = index * 26 + ord(ch) - ord("A") + 1
+    return index
+
+
+def parse_a1(a1: str) -> Tuple[int, Optional[int], int, Optional[int]]:
+    """
+    Разобрать диапазон A1 ("E5", "A5:G7", "G2:G", "'Лист1'!A5:G7")
+
+    Returns:
+        (первая строка, последняя строка или None, первый столбец, последний столбец)
+    """
+    match = _A1_RE.match(a1.replace("$", ""))
+    if not match:
+        raise ValueError(f"Неверный диапазон: {a1}")
+    c1, r1, c2, r2 = match.groups()
+    first_row = int(r1) if r1 else 1
+    if c2 is None:
+        return first_row, first_row if r1 else None, column_index(c1), column_index(c1)
+    return first_row, int(r2) if r2 else None, column_index(c1), column_index(c2)
+
+
+class FakeWorksheet:
+    """Лист таблицы в памяти (с сохранением в JSON-файл, если указан путь)"""
+
+    def __init__(self, path: str = None, updated_at_col: int = 7):
+        """
+        Args:
+            path: JSON-файл для хранения строк между запусками (None — только память)
+            updated_at_col: Столбец времени изменения, который заполняет user_edit
+                (в настоящей таблице это делает скрипт onEdit)
+        """
+        self.path = path
+        self.updated_at_col = updated_at_col
+        self.rows: List[List[str]] = []
+        self.calls = {}
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.rows = json.load(f)
+
+    def _count(self, method: str):
+        self.calls[method] = self.calls.get(method, 0) + 1
+
+    def _save(self):
+        if self.path:
+            dirname = os.path.dirname(self.path)
+            if dirname and not os.path.exists(dirname):
+                os.makedirs(dirname)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.rows, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+
+    def _set(self, row: int, col: int, value):
+        while len(self.rows) < row:
+            self.rows.append([])
+        cells = self.rows[row - 1]
+        while len(cells) < col:
+            cells.append("")
+        cells[col - 1] = "" if value is None else str(value)
+
+    def _get(self, row: int, col: int) -> str:
+        if row > len(self.rows) or col > len(self.rows[row - 1]):
+            return ""
+        return self.rows[row - 1][col - 1]
+
+    # ==================== API gspread.Worksheet ====================
+
+    def append_rows(self, values, value_input_option="RAW", **kwargs) -> dict:
+        with self._lock:
+            self._count("append_rows")
+            start = len(self.rows) + 1
+            for row in values:
+                self.rows.append(["" if v is None else str(v) for v in row])
+            self._save()
+            width = max((len(row) for row in values), default=1)
+            return {"updates": {"updatedRange": f"Sheet1!A{start}:{column_letter(width)}{len(self.rows)}"}}
+
+    def col_values(self, col: int, **kwargs) -> List[str]:
+        with self._lock:
+            self._count("col_values")
+            values = [self._get(r, col) for r in range(1, len(self.rows) + 1)]
+            while values and values[-1] == "":
+                values.pop()
+            return values
+
+    def batch_get(self, ranges, **kwargs) -> List[List[List[str]]]:
+        with self._lock:
+            self._count("batch_get")
+            result = []
+            for a1 in ranges:
+                r1, r2, c1, c2 = parse_a1(a1)
+                last = len(self.rows) if r2 is None else min(r2, len(self.rows))
+                block = [[self._get(r, c) for c in range(c1, c2 + 1)] for r in range(r1, last + 1)]
+                # Как в API: без пустых хвостов строк и столбцов
+                block = [row[:max((i + 1 for i, v in enumerate(row) if v != ""), default=0)] for row in block]
+                while block and not block[-1]:
+                    block.pop()
+                result.append(block)
+            return result
+
+    def batch_update(self, data, **kwargs) -> dict:
+        with self._lock:
+            self._count("batch_update")
+            cells = 0
+            for item in data:
+                r1, _, c1, _ = parse_a1(item["range"])
+                for dr, row in enumerate(item["values"]):
+                    for dc, value in enumerate(row):
+                        self._set(r1 + dr, c1 + dc, value)
+                        cells += 1
+            self._save()
+            return {"totalUpdatedCells": cells}
+
+    def get_all_values(self, **kwargs) -> List[List[str]]:
+        with self._lock:
+            self._count("get_all_values")
+            return [list(row) for row in self.rows]
+
+    # ==================== Имитация действий админа ====================
+
+    def user_edit(self, row: int, col: int, value, when: datetime = None):
+        """Изменить ячейку «руками» — вместе со столбцом времени изменения"""
+        with self._lock:
+            self._set(row, col, value)
+            self._set(row, self.updated_at_col, (when or datetime.now()).isoformat(timespec="seconds"))
+            self._save()
@@ -0,0 +1,264 @@
+"""
+Модуль поиска по FAQ
+Инвертированный индекс по вопросам и ответам content/faq.json:
+слова приводятся к основе (упрощённый стеммер Snowball для русского),
+результаты ранжируются по BM25, слова с опечатками сопоставляются
+с близкими словами словаря.
+
+Индекс обновляется по версии файла FAQ в ContentManager: при правке
+из админки переиндексируются только изменённые вопросы.
+"""
+
+import re
+import math
+import difflib
+import logging
+import threading
+from typing import Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+try:
+    from config import FAQ_SEARCH_LIMIT
+except ImportError:
+    FAQ_SEARCH_LIMIT = 3  # ответов на один вопрос
+
+try:
+    from config import FAQ_SEARCH_MIN_MATCH
+except ImportError:
+    FAQ_SEARCH_MIN_MATCH = 0.4  # доля (по весу) слов вопроса, которые должны найтись в ответе
+
+# Вес слов из вопроса FAQ относительно слов из ответа
+QUESTION_WEIGHT = 2
+# Вес слова, найденного по опечатке
+FUZZY_WEIGHT = 0.7
+# Параметры BM25
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_WORD_RE = re.compile(r"[a-zа-яё0-9]+")
+
+STOP_WORDS = frozenset("""
+а без бы в вам вас ваш вы да для до его ее если есть же за и из или им их к как
+ли мне мо мой мы на над не нет но ну о об он она они от по под при про с со так
+там то тоже только у уже что чтобы это я ли можно нужно ещё еще какой какая какие
+сколько где когда почему зачем кто чем мой моя мои
+""".split())
+
+# ==================== СТЕММЕР ====================
+
+_VOWELS = "аеиоуыэюя"
+
+_PERFECTIVE_GERUND = (("ившись", "ывшись", "ивши", "ывши", "ив", "ыв"),
+                      ("вшись", "вши", "в"))
+_REFLEXIVE = ("ся", "сь")
+_ADJECTIVE = ("ими", "ыми", "его", "ого", "ему", "ому", "ее", "ие", "ые", "ое", "ей", "ий",
+              "ый", "ой", "ем", "им", "ым", "ом", "их", "ых", "ую", "юю", "ая", "яя", "ою", "ею")
+_PARTICIPLE = (("ивш", "ывш", "ующ"), ("ем", "нн", "вш", "ющ", "щ"))
+_VERB = (("ейте", "уйте", "ила", "ыла", "ена", "ите", "или", "ыли", "ило", "ыло", "ено", "ует",
+          "уют", "ены", "ить", "ыть", "ишь", "ей", "уй", "ил", "ыл", "им", "ым", "ен", "ят",
+          "ит", "ыт", "ую", "у"),
+         ("ете", "йте", "ешь", "нно", "ла", "на", "ли", "ем", "ло", "но", "ет", "ют", "ны",
+          "ть", "й", "л", "н"))
+_NOUN = ("иями", "ями", "ами", "ией", "иям", "ием", "иях", "ев", "ов", "ие", "ье", "еи", "ии",
+         "ей", "ой", "ий", "ям", "ем", "ам", "ом", "ах", "ях", "ию", "ью", "ия", "ья", "а", "е",
+         "и", "й", "о", "у", "ы", "ь", "ю", "я")
+_SUPERLATIVE = ("ейше", "ейш")
+_DERIVATIONAL = ("ость", "ост")
+
+
+def _strip(word: str, endings) -> Tuple[str, bool]:
+    """Отрезать самое длинное подходящее окончание"""
+    for ending in sorted(endings, key=len, reverse=True):
+        if word.endswith(ending):
+            return word[:-len(ending)], True
+    return word, False
+
+
+def _strip_groups(word: str, groups) -> Tuple[str, bool]:
+    """То же для пары групп окончаний: окончания второй группы — только после «а»/«я»"""
+    first, second = groups
+    for ending in sorted(first + second, key=len, reverse=True):
+        if word.endswith(ending):
+            stem = word[:-len(ending)]
+            if ending in second and ending not in first and not stem.endswith(("а", "я")):
+                continue
+            return stem, True
+    return word, False
+
+
+def stem(word: str) -> str:
+    """Основа русского слова (упрощённый Snowball: окончания отрезаются в области RV)"""
+    word = word.lower().replace("ё", "е")
+    start = next((i + 1 for i, ch in enumerate(word) if ch in _VOWELS), len(word))
+    prefix, rv = word[:start], word[start:]
+
+    # Шаг 1: деепричастие, иначе возвратность + прилагательное/причастие/глагол/существительное
+    rv, done = _strip_groups(rv, _PERFECTIVE_GERUND)
+    if not done:
+        rv, _ = _strip(rv, _REFLEXIVE)
+        rv, done = _strip(rv, _ADJECTIVE)
+        if done:
+            rv, _ = _strip_groups(rv, _PARTICIPLE)
+        else:
+            rv, done = _strip_groups(rv, _VERB)
+            if not done:
+                rv, _ = _strip(rv, _NOUN)
+    # Шаг 2: «и» на конце
+    if rv.endswith("и"):
+        rv = rv[:-1]
+    # Шаг 3: словообразовательные суффиксы (упрощённо — только если основа остаётся длинной)
+    if len(rv) > 4:
+        rv, _ = _strip(rv, _DERIVATIONAL)
+    # Шаг 4: превосходная степень, «нн» -> «н», мягкий знак
+    rv, _ = _strip(rv, _SUPERLATIVE)
+    if rv.endswith("нн"):
+        rv = rv[:-1]
+    elif rv.endswith("ь"):
+        rv = rv[:-1]
+    return prefix + rv
+
+
+def tokenize(text: str) -> List[str]:
+    """Основы значимых слов текста"""
+    return [stem(word) for word in _WORD_RE.findall(text.lower().replace("ё", "е"))
+            if word not in STOP_WORDS]
+
+
+# ==================== ИНДЕКС ====================
+
+class FaqIndex:
+    """Инвертированный индекс FAQ: основа слова -> {id вопроса: вес}"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._postings: Dict[str, Dict[str, float]] = {}
+        self._doc_len: Dict[str, float] = {}
+        self._docs: Dict[str, dict] = {}
+        self._total_len = 0.0
+        self._source_version = None
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def _add(self, item: dict):
+        weights: Dict[str, float] = {}
+        for term in tokenize(item.get("q", "")):
+            weights[term] = weights.get(term, 0) + QUESTION_WEIGHT
+        for term in tokenize(item.get("a", "")):
+            weights[term] = weights.get(term, 0) + 1
+        doc_id = item["id"]
+        for term, weight in weights.items():
+            self._postings.setdefault(term, {})[doc_id] = weight
+        length = sum(weights.values())
+        self._doc_len[doc_id] = length
+        self._total_len += length
+        self._docs[doc_id] = item
+
+    def _remove(self, doc_id: str):
+        item = self._docs.pop(doc_id)
+        self._total_len -= self._doc_len.pop(doc_id)
+        for term in set(tokenize(item.get("q", "")) + tokenize(item.get("a", ""))):
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[term]
+
+    def sync(self, items: List[dict], version=None) -> int:
+        """
+        Привести индекс к списку FAQ: переиндексируются только новые и изменённые вопросы
+
+        Args:
+            items: Вопросы FAQ ({"id", "q", "a"})
+            version: Версия списка (повторный вызов с той же версией ничего не делает)
+
+        Returns:
+            Сколько вопросов переиндексировано или удалено
+        """
+        if version is not None and version == self._source_version:
+            return 0
+        with self._lock:
+            current = {item["id"]: item for item in items if "id" in item}
+            changed = set()
+            for doc_id in list(self._docs):
+                old = self._docs[doc_id]
+                new = current.get(doc_id)
+                if new is None or (new.get("q"), new.get("a")) != (old.get("q"), old.get("a")):
+                    self._remove(doc_id)
+                    changed.add(doc_id)
+                elif new is not old:
+                    self._docs[doc_id] = new
+            for doc_id, item in current.items():
+                if doc_id not in self._docs:
+                    self._add(item)
+                    changed.add(doc_id)
+            self._source_version = version
+        if changed:
+            logger.info(f"Индекс FAQ обновлён: {len(changed)} вопросов, всего {len(self._docs)}")
+        return len(changed)
+
+    def _expand(self, term: str) -> List[Tuple[str, float]]:
+        """Слово запроса -> [(слово словаря, вес)]: точное совпадение или близкие по написанию"""
+        if term in self._postings:
+            return [(term, 1.0)]
+        if len(term) < 4:
+            return []
+        return [(match, FUZZY_WEIGHT)
+                for match in difflib.get_close_matches(term, self._postings, n=2, cutoff=0.8)]
+
+    def search(self, query: str, limit: int = FAQ_SEARCH_LIMIT,
+               min_match: float = FAQ_SEARCH_MIN_MATCH) -> List[Tuple[dict, float]]:
+        """
+        Найти подходящие вопросы FAQ
+
+        Args:
+            query: Текст вопроса пользователя
+            limit: Сколько результатов вернуть
+            min_match: Минимальная доля (по idf) слов запроса, найденных в вопросе
+
+        Returns:
+            [(вопрос FAQ, оценка)] от лучшего к худшему
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        with self._lock:
+            n_docs = len(self._docs)
+            if not terms or not n_docs:
+                return []
+            avg_len = self._total_len / n_docs
+            scores: Dict[str, float] = {}
+            matched: Dict[str, float] = {}
+            total_idf = 0.0
+            for term in terms:
+                expansions = self._expand(term)
+                df = max((len(self._postings[t]) for t, _ in expansions), default=1)
+                # Вес слова запроса: незнакомые слова весят как самые редкие слова FAQ
+                term_idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+                total_idf += term_idf
+                seen = set()
+                for match, factor in expansions:
+                    postings = self._postings[match]
+                    idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                    for doc_id, tf in postings.items():
+                        norm = BM25_K1 * (1 - BM25_B + BM25_B * self._doc_len[doc_id] / avg_len)
+                        scores[doc_id] = scores.get(doc_id, 0) + factor * idf * tf * (BM25_K1 + 1) / (tf + norm)
+                        if doc_id not in seen:
+                            matched[doc_id] = matched.get(doc_id, 0) + factor * term_idf
+                            seen.add(doc_id)
+            ranked = sorted(
+                (doc_id for doc_id in scores if matched[doc_id] >= min_match * total_idf),
+                key=lambda doc_id: -scores[doc_id]
+            )
+            return [(self._docs[doc_id], scores[doc_id]) for doc_id in ranked[:limit]]
+
+
+# Глобальный индекс и поиск по актуальному FAQ из content_manager
+faq_index = FaqIndex()
+
+
+def search_faq(query: str, limit: int = FAQ_SEARCH_LIMIT) -> List[dict]:
+    """Ответы FAQ на вопрос пользователя (индекс обновляется, если FAQ изменился)"""
+    from content_manager import content_manager
+    faq = content_manager.get_faq()
+    faq_index.sync(faq, content_manager.get_version(content_manager.faq_file))
+    return [item for item, _ in faq_index.search(query, limit)]
@@ -0,0 +1,140 @@
+"""
+Модуль журнала изменений для данных бота
+Каждое изменение дописывается в конец файла журнала, периодически
+состояние сохраняется снимком, а журнал обнуляется
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from typing import Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class Journal:
+    """Append-only журнал изменений со снимками состояния
+
+    Запись в журнал — одна JSON-строка на изменение. fsync выполняется
+    пачками: после fsync_batch записей или не реже чем раз в fsync_interval
+    секунд (через sync()). Снимок записывается атомарно (временный файл +
+    os.replace), после чего журнал начинается заново.
+    """
+
+    def __init__(self, directory: str, fsync_batch: int = 100, fsync_interval: float = 1.0):
+        """
+        Инициализация журнала
+
+        Args:
+            directory: Директория для файлов журнала и снимка
+            fsync_batch: После скольких записей принудительно делать fsync
+            fsync_interval: Максимальное время между fsync (сек)
+        """
+        self.directory = directory
+        self.journal_path = os.path.join(directory, "journal.log")
+        self.snapshot_path = os.path.join(directory, "snapshot.json")
+        self.fsync_batch = fsync_batch
+        self.fsync_interval = fsync_interval
+
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self.records_since_snapshot = 0
+        self._file = None
+
+    def load(self) -> Tuple[Dict, List[dict]]:
+        """
+        Прочитать снимок и хвост журнала после него
+
+        Returns:
+            (состояние из снимка, список записей журнала для повторного применения)
+        """
+        stores = {}
+        snapshot_seq = 0
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+                snapshot = json.load(f)
+            stores = snapshot.get("stores", {})
+            snapshot_seq = snapshot.get("seq", 0)
+
+        records = []
+        if os.path.exists(self.journal_path):
+            good_size = 0  # байт до конца последней целой записи
+            with open(self.journal_path, 'rb') as f:
+                for line in f:
+                    try:
+                        if not line.endswith(b"\n"):
+                            raise ValueError("запись без конца строки")
+                        record = json.loads(line)
+                    except ValueError:
+                        # Недописанная последняя строка после сбоя
+                        logger.warning("Пропущена повреждённая запись журнала")
+                        break
+                    good_size += len(line)
+                    if record["seq"] > snapshot_seq:
+                        records.append(record)
+            if good_size < os.path.getsize(self.journal_path):
+                # Обрезаем мусор, иначе новые записи допишутся к нему и потеряются
+                with open(self.journal_path, 'r+b') as f:
+                    f.truncate(good_size)
+                    os.fsync(f.fileno())
+
+        self._seq = records[-1]["seq"] if records else snapshot_seq
+        self.records_since_snapshot = len(records)
+        self._file = open(self.journal_path, 'a', encoding='utf-8')
+        return stores, records
+
+    def append(self, op: str, store: str, key, value=None):
+        """Дописать изменение в журнал"""
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.journal_path, 'a', encoding='utf-8')
+            self._seq += 1
+            record = {"seq": self._seq, "op": op, "store": store, "key": key, "value": value}
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._file.flush()
+            self._unsynced += 1
+            self.records_since_snapshot += 1
+            if self._unsynced >= self.fsync_batch or time.monotonic() - self._last_sync >= self.fsync_interval:
+                self._sync_locked()
+
+    def _sync_locked(self):
+        if self._file is not None and self._unsynced:
+            os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def sync(self):
+        """Сбросить на диск записи, ожидающие fsync"""
+        with self._lock:
+            self._sync_locked()
+
+    def snapshot(self, stores: Dict):
+        """
+        Записать снимок состояния и обнулить журнал
+
+        Args:
+            stores: Сериализуемое состояние всех хранилищ
+        """
+        with self._lock:
+            tmp_path = self.snapshot_path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({"seq": self._seq, "created_at": time.time(), "stores": stores}, f, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.snapshot_path)
+
+            # Все записи вошли в снимок — журнал начинается заново
+            if self._file is not None:
+                self._file.close()
+            self._file = open(self.journal_path, 'w', encoding='utf-8')
+            self._unsynced = 0
+            self._last_sync = time.monotonic()
+            self.records_since_snapshot = 0
+        logger.info(f"Снимок данных сохранён (seq={self._seq})")
@@ -0,0 +1,88 @@
+"""
+Модуль медиафайлов портфолио
+Кейс портфолио может ссылаться на картинки и видео из content/media:
+
+    "media": ["media/shop_1.jpg", "media/shop_2.jpg", "media/demo.mp4"]
+
+Файл загружается в Telegram только при первом показе. После этого
+хранится его file_id (ключ — SHA-256 содержимого файла), и повторные
+показы отправляют file_id без загрузки. Переименованный или скопированный
+файл с тем же содержимым тоже не загружается заново.
+"""
+
+import os
+import hashlib
+import logging
+import threading
+from typing import Dict, Optional, Tuple
+
+from storage import StorageBackend, open_storage
+
+logger = logging.getLogger(__name__)
+
+PHOTO_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp"}
+VIDEO_EXTENSIONS = {".mp4", ".mov", ".m4v"}
+
+# Сколько файлов Telegram принимает в одной медиагруппе
+MEDIA_GROUP_LIMIT = 10
+
+
+def media_type(path: str) -> Optional[str]:
+    """Тип файла по расширению: "photo", "video" или None"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext in PHOTO_EXTENSIONS:
+        return "photo"
+    if ext in VIDEO_EXTENSIONS:
+        return "video"
+    return None
+
+
+class MediaCache:
+    """file_id загруженных файлов по хэшу содержимого"""
+
+    def __init__(self, store: StorageBackend = None):
+        """
+        Args:
+            store: Хранилище {хэш: {"file_id", "type"}} (по умолчанию из storage.py)
+        """
+        self._store = store if store is not None else open_storage("media_file_ids")
+        self._lock = threading.Lock()
+        # Хэши файлов: путь -> (mtime_ns, размер, хэш) — файл перечитывается только после изменения
+        self._digests: Dict[str, Tuple[int, int, str]] = {}
+
+    def digest(self, path: str) -> Optional[str]:
+        """SHA-256 содержимого файла (None если файла нет)"""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        entry = self._digests.get(path)
+        if entry is not None and (entry[0], entry[1]) == (st.st_mtime_ns, st.st_size):
+            return entry[2]
+
+        sha = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                sha.update(chunk)
+        digest = sha.hexdigest()
+        with self._lock:
+            self._digests[path] = (st.st_mtime_ns, st.st_size, digest)
+        return digest
+
+    def get_file_id(self, digest: str) -> Optional[str]:
+        """file_id ранее загруженного файла (или None)"""
+        record = self._store.get(digest)
+        return record["file_id"] if record else None
+
+    def remember(self, digest: str, file_id: str, kind: str):
+        """Запомнить file_id загруженного файла"""
+        if self.get_file_id(digest) != file_id:
+            self._store.put(digest, {"file_id": file_id, "type": kind})
+
+    def forget(self, digest: str):
+        """Забыть file_id (например, если Telegram его больше не принимает)"""
+        self._store.delete(digest)
+
+
+# Глобальный экземпляр
+media_cache = MediaCache()
@@ -0,0 +1,55 @@
+"""
+Кэш готовых ответов бота
+Для экранов, которые не зависят от пользователя (FAQ, контакты, отзывы...),
+текст сообщения и клавиатура собираются один раз и хранятся вместе с
+версией данных, из которых собраны. Пока версия не изменилась, повторный
+показ экрана — это только отправка готового ответа.
+"""
+
+import threading
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+
+class RenderCache:
+    """Готовые ответы по имени экрана, с версией исходных данных"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Имя экрана -> (версия данных, готовый ответ)
+        self._entries: Dict[str, Tuple[Hashable, Any]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, name: str, version: Hashable, build: Callable[[], Any]) -> Any:
+        """
+        Получить готовый ответ экрана (собрать заново, если данные изменились)
+
+        Args:
+            name: Имя экрана
+            version: Версия исходных данных (например, версия файла контента)
+            build: Функция сборки ответа, вызывается только при смене версии
+
+        Returns:
+            Ответ, собранный build (общий для всех — не изменять на месте)
+        """
+        entry = self._entries.get(name)
+        if entry is not None and entry[0] == version:
+            self.hits += 1
+            return entry[1]
+        value = build()
+        with self._lock:
+            self._entries[name] = (version, value)
+            self.misses += 1
+        return value
+
+    def invalidate(self, name: str = None):
+        """Сбросить ответ экрана (или все ответы)"""
+        with self._lock:
+            if name is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(name, None)
+
+
+# Глобальный экземпляр
+render_cache = RenderCache()
@@ -1,7 +1,14 @@
 # reviews.py
 # Модуль для отзывов клиентов с системой модерации
 # ℹ️ РЕДАКТИРУЙТЕ ЭТОТ ФАЙЛ чтобы добавить опубликованные отзывы
-# Отзывы хранятся в памяти боте в REVIEWS (опубликованные) и PENDING_REVIEWS (ожидающие одобрения)
+# Отзывы хранятся в REVIEWS (опубликованные) и PENDING_REVIEWS (ожидающие одобрения)
+# и сохраняются в хранилище из storage.py (STORAGE_BACKEND в config.py).
+# Отзывы из списка ниже добавляются в хранилище при запуске, если их там ещё нет.
+
+import uuid
+from datetime import datetime
+
+from storage import open_storage
 
 # Опубликованные отзывы - ОТРЕДАКТИРУЙТЕ с вашими реальными отзывами!
 REVIEWS = [
@@ -44,11 +51,80 @@ REVIEWS = [
 
 # Отзывы ожидающие модерации администратора (защита от спама и рекламы)
 PENDING_REVIEWS = [
-    # Структура: {"id": "rev_pending_001", "author": "Имя", "rating": 5, "text": "Текст", "user_id": 123456789, "date": "2026-02-01T10:30:00"}
+    # Структура: {"id": "rev_<uuid4>", "author": "Имя", "rating": 5, "text": "Текст", "user_id": 123456789, "date": "2026-02-01T10:30:00"}
     # Админ может одобрить (/review_approve) или отклонить (/review_reject)
 ]
 
 
+_published_store = open_storage("reviews")
+_pending_store = open_storage("pending_reviews")
+
+# Версия опубликованных отзывов: растёт при каждом изменении REVIEWS
+_version = {"reviews": 0}
+
+
+def _bump_version():
+    _version["reviews"] += 1
+
+
+def get_reviews_version() -> int:
+    """Версия опубликованных отзывов — для кэша готовых ответов"""
+    return _version["reviews"]
+
+
+def _review_ts(review: dict) -> int:
+    """Время отзыва (поле date) для сортировки в хранилище"""
+    try:
+        return int(datetime.fromisoformat(review.get("date", "")).timestamp())
+    except (TypeError, ValueError):
+        return int(datetime.now().timestamp())
+
+
+def _load_reviews():
+    """Загрузить отзывы из хранилища, добавив новые отзывы из этого файла"""
+    new_reviews = [review for review in REVIEWS if _published_store.get(review["id"]) is None]
+    _published_store.put_many((review["id"], review, _review_ts(review)) for review in new_reviews)
+    REVIEWS[:] = [review for _, review in _published_store.items()]
+    PENDING_REVIEWS[:] = [review for _, review in _pending_store.items()]
+    _bump_version()
+
+
+def new_review_id() -> str:
+    """Уникальный id отзыва: по нему отзыв хранится и после одобрения"""
+    return f"rev_{uuid.uuid4().hex}"
+
+
+def add_pending_review(review: dict):
+    """Поставить отзыв в очередь модерации"""
+    _pending_store.put(review["id"], review, _review_ts(review))
+    PENDING_REVIEWS.append(review)
+
+
+def take_pending_review(review_id: str):
+    """Забрать отзыв из очереди модерации (или None если его там нет)"""
+    for i, review in enumerate(PENDING_REVIEWS):
+        if review["id"] == review_id:
+            _pending_store.delete(review_id)
+            return PENDING_REVIEWS.pop(i)
+    return None
+
+
+def publish_review(review: dict):
+    """Опубликовать отзыв"""
+    _published_store.put(review["id"], review, _review_ts(review))
+    REVIEWS.append(review)
+    _bump_version()
+
+
+def replace_reviews(reviews: list):
+    """Заменить опубликованные отзывы (восстановление из бекапа)"""
+    _published_store.clear()
+    _published_store.put_many((review.get("id", f"rev_restored_{i}"), review, _review_ts(review))
+                              for i, review in enumerate(reviews, 1))
+    REVIEWS[:] = [review for _, review in _published_store.items()]
+    _bump_version()
+
+
 def get_rating_stars(rating: int) -> str:
     """Преобразовать рейтинг в звёзды"""
     if rating >= 5:
@@ -62,3 +138,5 @@ def get_rating_stars(rating: int) -> str:
     else:
         return "⭐"
 
+
+_load_reviews()
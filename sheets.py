@@ -0,0 +1,577 @@
+"""
+Модуль для работы с Google Sheets (таблица заказов BotOrders)
+Запись идёт через очередь: строки копятся на диске и отправляются пачками,
+поэтому обработчики бота не ждут ответа от Google. Статусы синхронизируются
+в обе стороны фоновой задачей SheetsSync.
+
+Столбцы листа: A номер заказа, B user_id, C ФИО, D контакты, E статус,
+F создан, G изменён (updated_at)
+"""
+
+import os
+import json
+import asyncio
+import sqlite3
+import logging
+import threading
+from datetime import datetime, timedelta
+from functools import partial
+from typing import Callable, Dict, List, Optional
+
+from fake_sheets import FakeWorksheet, parse_a1
+
+logger = logging.getLogger(__name__)
+
+try:
+    from config import SHEETS_QUEUE_FILE
+except ImportError:
+    SHEETS_QUEUE_FILE = os.path.join("db", "sheets_queue.db")
+
+try:
+    from config import SHEETS_BATCH_SIZE
+except ImportError:
+    SHEETS_BATCH_SIZE = 50
+
+try:
+    from config import SHEETS_FLUSH_INTERVAL
+except ImportError:
+    SHEETS_FLUSH_INTERVAL = 5  # секунд
+
+try:
+    from config import SHEETS_SYNC_INTERVAL
+except ImportError:
+    SHEETS_SYNC_INTERVAL = 60  # секунд между синхронизациями статусов
+
+try:
+    from config import SHEETS_FAKE_FILE
+except ImportError:
+    SHEETS_FAKE_FILE = None  # путь к JSON-файлу локального листа вместо Google Sheets
+
+try:
+    from config import GOOGLE_CREDENTIALS_FILE as CREDS_FILE
+except ImportError:
+    CREDS_FILE = "google-credentials.json"
+
+try:
+    from config import GOOGLE_SHEETS_NAME as SHEET_NAME
+except ImportError:
+    SHEET_NAME = "BotOrders"
+
+SCOPE = ["https://spreadsheets.google.com/auth/spreadsheets"]
+
+try:
+    from oauth2client.service_account import ServiceAccountCredentials
+    import gspread
+except ImportError:
+    gspread = None
+
+
+class SheetsConnection:
+    """Подключение к Google Sheets с кэшированием листа
+
+    Авторизация выполняется при первом обращении, а не при импорте.
+    Лист таблицы открывается один раз и переиспользуется; токен обновляется
+    заранее, до истечения срока. Переподключение выполняется только после
+    ошибки авторизации или сети.
+    """
+
+    def __init__(self, creds_file: str = CREDS_FILE, sheet_name: str = SHEET_NAME,
+                 open_worksheet: Callable = None, refresh_margin: int = 300):
+        """
+        Инициализация подключения
+
+        Args:
+            creds_file: Файл ключа сервисного аккаунта
+            sheet_name: Название таблицы
+            open_worksheet: Функция, открывающая лист (для локальной подмены таблицы)
+            refresh_margin: За сколько секунд до истечения обновлять токен
+        """
+        self.creds_file = creds_file
+        self.sheet_name = sheet_name
+        self.refresh_margin = refresh_margin
+        self._open_worksheet = open_worksheet
+        self._client = None
+        self._worksheet = None
+        self._lock = threading.RLock()
+        self.stats = {
+            "authorizations": 0,
+            "opens": 0,
+            "token_refreshes": 0,
+            "reconnects": 0,
+            "calls": 0,
+            "saved_calls": 0,
+        }
+
+    @property
+    def available(self) -> bool:
+        """Можно ли работать с таблицей"""
+        if self._open_worksheet is not None:
+            return True
+        return gspread is not None and os.path.exists(self.creds_file)
+
+    def _connect(self):
+        if self._open_worksheet is not None:
+            self._worksheet = self._open_worksheet()
+        else:
+            if self._client is None:
+                creds = ServiceAccountCredentials.from_json_keyfile_name(self.creds_file, SCOPE)
+                self._client = gspread.authorize(creds)
+                self.stats["authorizations"] += 1
+            self._worksheet = self._client.open(self.sheet_name).sheet1
+        self.stats["opens"] += 1
+
+    def _refresh_token_if_needed(self):
+        """Обновить токен доступа, если он скоро истечёт"""
+        auth = getattr(self._client, "auth", None)
+        if auth is None:
+            return
+        expiry = getattr(auth, "expiry", None) or getattr(auth, "token_expiry", None)
+        if expiry is None or expiry - datetime.utcnow() > timedelta(seconds=self.refresh_margin):
+            return
+
+        if hasattr(auth, "expiry"):
+            # google-auth (gspread >= 5)
+            from google.auth.transport.requests import Request
+            auth.refresh(Request())
+        else:
+            # oauth2client
+            import httplib2
+            auth.refresh(httplib2.Http())
+        self.stats["token_refreshes"] += 1
+
+    def get_worksheet(self):
+        """Получить лист таблицы (открывается только при первом обращении)"""
+        with self._lock:
+            if self._worksheet is None:
+                self._connect()
+            else:
+                self.stats["saved_calls"] += 1
+                self._refresh_token_if_needed()
+            return self._worksheet
+
+    def reset(self):
+        """Сбросить клиента и лист (следующий вызов переподключится)"""
+        with self._lock:
+            self._client = None
+            self._worksheet = None
+
+    @staticmethod
+    def _is_connection_error(error: Exception) -> bool:
+        """Ошибка авторизации или сети (после неё имеет смысл переподключиться)"""
+        if isinstance(error, OSError):
+            # requests.RequestException, socket.error, ssl-ошибки
+            return True
+        if type(error).__name__ in ("RefreshError", "AccessTokenRefreshError"):
+            return True
+        response = getattr(error, "response", None)
+        return getattr(response, "status_code", None) == 401
+
+    def call(self, method: str, *args, **kwargs):
+        """
+        Вызвать метод листа с одним переподключением при ошибке авторизации или сети
+
+        Args:
+            method: Имя метода gspread.Worksheet (append_rows, batch_update, ...)
+        """
+        self.stats["calls"] += 1
+        try:
+            return getattr(self.get_worksheet(), method)(*args, **kwargs)
+        except Exception as e:
+            if not self._is_connection_error(e):
+                raise
+            logger.warning(f"Переподключение к Google Sheets после ошибки: {e}")
+            self.reset()
+            self.stats["reconnects"] += 1
+            return getattr(self.get_worksheet(), method)(*args, **kwargs)
+
+    def get_stats(self) -> dict:
+        """Статистика подключения (saved_calls — сколько раз не пришлось открывать таблицу)"""
+        with self._lock:
+            return dict(self.stats)
+
+
+# Столбцы статуса и времени изменения
+STATUS_COLUMN = "E"
+UPDATED_AT_COLUMN = "G"
+
+# Глобальное подключение (локальный лист, если задан SHEETS_FAKE_FILE)
+sheets_connection = SheetsConnection(
+    open_worksheet=(lambda: FakeWorksheet(SHEETS_FAKE_FILE)) if SHEETS_FAKE_FILE else None
+)
+USE_GSHEET = sheets_connection.available
+
+
+def get_gsheet():
+    """Получить Google Sheet (если доступен)"""
+    if not sheets_connection.available:
+        return None
+    try:
+        return sheets_connection.get_worksheet()
+    except Exception as e:
+        logging.error(f"Ошибка подключения к Google Sheets: {e}")
+        return None
+
+
+class SheetsWriteQueue:
+    """Очередь отложенной записи строк в Google Sheets
+
+    Строки сохраняются в SQLite-файл и переживают перезапуск бота.
+    Фоновая задача отправляет их одним вызовом append_rows на пачку:
+    как только набралось batch_size строк или прошло flush_interval секунд.
+    При ошибке отправка повторяется с экспоненциальной задержкой.
+    """
+
+    def __init__(self, path: str = SHEETS_QUEUE_FILE,
+                 connection: SheetsConnection = sheets_connection,
+                 batch_size: int = SHEETS_BATCH_SIZE,
+                 flush_interval: float = SHEETS_FLUSH_INTERVAL,
+                 max_backoff: float = 300):
+        """
+        Инициализация очереди
+
+        Args:
+            path: Путь к файлу очереди
+            connection: Подключение к таблице
+            batch_size: Размер пачки, при котором запись запускается сразу
+            flush_interval: Максимальное время ожидания строки в очереди (сек)
+            max_backoff: Максимальная задержка между повторами (сек)
+        """
+        self.path = path
+        self.connection = connection
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_backoff = max_backoff
+        self._backoff = 1
+        self._wake = asyncio.Event()
+        # Вызывается после записи пачки: (строки, ответ append_rows)
+        self.on_appended = None
+
+        dirname = os.path.dirname(path)
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS outbox (id INTEGER PRIMARY KEY AUTOINCREMENT, row TEXT NOT NULL)"
+        )
+
+    def put(self, row: list):
+        """Поставить строку в очередь (не блокирует на сетевом запросе)"""
+        with self._lock, self._conn:
+            self._conn.execute("INSERT INTO outbox (row) VALUES (?)", (json.dumps(row, ensure_ascii=False),))
+        if self.pending() >= self.batch_size:
+            self._wake.set()
+
+    def pending(self) -> int:
+        """Количество строк, ожидающих отправки"""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    def _next_batch(self) -> List[tuple]:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT id, row FROM outbox ORDER BY id LIMIT ?", (self.batch_size,)
+            ).fetchall()
+
+    def _ack(self, last_id: int):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM outbox WHERE id <= ?", (last_id,))
+
+    async def flush(self) -> bool:
+        """
+        Отправить все накопленные строки
+
+        Returns:
+            True если очередь опустела, False если отправка не удалась
+        """
+        loop = asyncio.get_event_loop()
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                return True
+
+            if not self.connection.available:
+                return False
+
+            rows = [json.loads(row) for _, row in batch]
+            try:
+                response = await loop.run_in_executor(None, partial(self.connection.call, "append_rows", rows))
+            except Exception as e:
+                logger.warning(f"Не удалось записать {len(rows)} строк в Google Sheets: {e}")
+                return False
+
+            self._ack(batch[-1][0])
+            if self.on_appended is not None:
+                self.on_appended(rows, response)
+            logger.info(f"Записано в Google Sheets: {len(rows)} строк")
+
+    async def run(self):
+        """Фоновая задача: периодическая отправка очереди"""
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+            try:
+                if await self.flush():
+                    self._backoff = 1
+                    continue
+            except Exception as e:
+                logger.error(f"Ошибка в очереди Google Sheets: {e}")
+
+            # Повтор с экспоненциальной задержкой
+            await asyncio.sleep(self._backoff)
+            self._backoff = min(self._backoff * 2, self.max_backoff)
+
+
+# Глобальный экземпляр
+sheets_queue = SheetsWriteQueue()
+
+
+def _parse_time(value) -> Optional[datetime]:
+    try:
+        return datetime.fromisoformat(str(value).strip())
+    except ValueError:
+        return None
+
+
+class SheetsSync:
+    """Двусторонняя синхронизация статусов заказов с таблицей
+
+    Исходящие изменения статуса копятся в SQLite (по одному на заказ) и
+    отправляются одним batch_update в столбцы статуса и updated_at.
+    Входящие изменения читаются по столбцу updated_at: сначала читается
+    только этот столбец, затем — строки, изменённые после прошлой
+    синхронизации. Столбец updated_at в таблице заполняет скрипт onEdit
+    (см. README). При конфликте побеждает более позднее изменение.
+    """
+
+    def __init__(self, path: str = SHEETS_QUEUE_FILE,
+                 connection: SheetsConnection = sheets_connection,
+                 queue: SheetsWriteQueue = None,
+                 interval: float = SHEETS_SYNC_INTERVAL):
+        """
+        Инициализация синхронизации
+
+        Args:
+            path: Файл состояния (общий с очередью записи)
+            connection: Подключение к таблице
+            queue: Очередь записи — из её ответов запоминаются номера строк
+            interval: Период синхронизации (сек)
+        """
+        self.connection = connection
+        self.interval = interval
+        self._get_status = None
+        self._apply_status = None
+        self._allowed_statuses = None
+
+        dirname = os.path.dirname(path)
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS status_outbox (
+                order_id   TEXT PRIMARY KEY,
+                status     TEXT NOT NULL,
+                updated_at TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS sheet_rows (order_id TEXT PRIMARY KEY, row INTEGER NOT NULL);
+            CREATE TABLE IF NOT EXISTS sync_state (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+        """)
+        if queue is not None:
+            queue.on_appended = self.remember_rows
+
+    def bind(self, get_status: Callable, apply_status: Callable, allowed_statuses: List[str] = None):
+        """
+        Подключить локальное хранилище заказов
+
+        Args:
+            get_status: order_id -> текущий статус (или None если заказа нет)
+            apply_status: (order_id, status) -> применить статус из таблицы
+            allowed_statuses: Допустимые статусы (остальные значения из таблицы игнорируются)
+        """
+        self._get_status = get_status
+        self._apply_status = apply_status
+        self._allowed_statuses = allowed_statuses
+
+    # ==================== Состояние ====================
+
+    def _get_state(self, key: str, default=None):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM sync_state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def _set_state(self, key: str, value: str):
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO sync_state VALUES (?, ?)", (key, value))
+
+    def enqueue_status(self, order_id: str, status: str, updated_at: datetime = None):
+        """Запомнить локальное изменение статуса для отправки в таблицу"""
+        updated_at = (updated_at or datetime.now()).isoformat(timespec="seconds")
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO status_outbox VALUES (?, ?, ?)", (str(order_id), status, updated_at)
+            )
+
+    def pending(self) -> int:
+        """Количество изменений статуса, ожидающих отправки"""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM status_outbox").fetchone()[0]
+
+    def remember_rows(self, rows: List[list], response):
+        """Запомнить номера строк, добавленных append_rows (из updatedRange ответа)"""
+        try:
+            first_row = parse_a1(response["updates"]["updatedRange"])[0]
+        except (TypeError, KeyError, ValueError):
+            return
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO sheet_rows VALUES (?, ?)",
+                [(str(row[0]), first_row + i) for i, row in enumerate(rows)]
+            )
+
+    def _row_numbers(self, order_ids: List[str]) -> Dict[str, int]:
+        """
+        Номера строк заказов
+
+        Запомненные номера проверяются по столбцу A (после сортировки или
+        удаления строк в таблице они указывают на чужие заказы). Неизвестные
+        и сдвинувшиеся заказы ищутся заново по всему столбцу A.
+        """
+        with self._lock:
+            known = dict(self._conn.execute(
+                f"SELECT order_id, row FROM sheet_rows WHERE order_id IN ({','.join('?' * len(order_ids))})",
+                order_ids
+            ).fetchall())
+        if known:
+            cached = list(known.items())
+            cells = self.connection.call("batch_get", [f"A{row}" for _, row in cached])
+            for (order_id, _), block in zip(cached, cells):
+                if not block or not block[0] or str(block[0][0]) != order_id:
+                    del known[order_id]
+        if len(known) < len(order_ids):
+            column = self.connection.call("col_values", 1)
+            rows = {str(order_id): i for i, order_id in enumerate(column, 1) if order_id}
+            missing = [(order_id,) for order_id in order_ids if order_id not in rows]
+            with self._lock, self._conn:
+                self._conn.executemany("INSERT OR REPLACE INTO sheet_rows VALUES (?, ?)", rows.items())
+                # Заказа нет в таблице (строку удалили) — старый номер больше не годится
+                self._conn.executemany("DELETE FROM sheet_rows WHERE order_id = ?", missing)
+            known = {order_id: rows[order_id] for order_id in order_ids if order_id in rows}
+        return known
+
+    # ==================== Синхронизация ====================
+
+    def push(self) -> int:
+        """Отправить накопленные изменения статуса одним batch_update"""
+        with self._lock:
+            pending = self._conn.execute("SELECT order_id, status, updated_at FROM status_outbox").fetchall()
+        if not pending:
+            return 0
+
+        rows = self._row_numbers([order_id for order_id, _, _ in pending])
+        data, sent = [], []
+        for order_id, status, updated_at in pending:
+            row = rows.get(order_id)
+            if row is None:
+                # Строка ещё в очереди записи — отправим в следующий раз
+                continue
+            data.append({"range": f"{STATUS_COLUMN}{row}", "values": [[status]]})
+            data.append({"range": f"{UPDATED_AT_COLUMN}{row}", "values": [[updated_at]]})
+            sent.append((order_id, updated_at))
+        if not data:
+            return 0
+
+        self.connection.call("batch_update", data)
+        with self._lock, self._conn:
+            # Изменения, сделанные во время отправки, остаются в очереди
+            self._conn.executemany("DELETE FROM status_outbox WHERE order_id = ? AND updated_at = ?", sent)
+        return len(sent)
+
+    def pull(self) -> List[tuple]:
+        """
+        Прочитать строки, изменённые в таблице после прошлой синхронизации
+
+        Столбец updated_at читается целиком, а не по запомненным номерам строк:
+        это один запрос и несколько байт на строку, а после сортировки таблицы
+        или ручного добавления строк запомненные номера не покрывают изменения.
+
+        Returns:
+            Применённые изменения [(order_id, status), ...]
+        """
+        watermark = _parse_time(self._get_state("watermark", "")) or datetime.min
+        column = self.connection.call("batch_get", [f"{UPDATED_AT_COLUMN}1:{UPDATED_AT_COLUMN}"])[0]
+        changed, newest = [], watermark
+        for row, cells in enumerate(column, 1):
+            updated_at = _parse_time(cells[0]) if cells else None
+            # >= : правки в ту же секунду, что и прошлая синхронизация, не теряются
+            if updated_at is not None and updated_at >= watermark:
+                changed.append(row)
+                newest = max(newest, updated_at)
+        if not changed:
+            return []
+
+        blocks = self.connection.call("batch_get", [f"A{row}:{UPDATED_AT_COLUMN}{row}" for row in changed])
+        with self._lock:
+            local_pending = dict(self._conn.execute("SELECT order_id, updated_at FROM status_outbox").fetchall())
+
+        applied = []
+        for block in blocks:
+            cells = (block[0] if block else []) + [""] * 7
+            order_id, status, updated_at = str(cells[0]), cells[4], cells[6]
+            if not order_id or (self._allowed_statuses and status not in self._allowed_statuses):
+                continue
+            local_time = _parse_time(local_pending.get(order_id, ""))
+            remote_time = _parse_time(updated_at)
+            if local_time is not None and remote_time is not None and local_time >= remote_time:
+                # Локальное изменение новее — его отправит push
+                continue
+            if self._get_status is not None and self._get_status(order_id) not in (None, status):
+                self._apply_status(order_id, status)
+                applied.append((order_id, status))
+
+        self._set_state("watermark", newest.isoformat(timespec="seconds"))
+        return applied
+
+    def sync_once(self) -> List[tuple]:
+        """Один цикл: отправить локальные изменения, затем принять изменения из таблицы"""
+        pushed = self.push()
+        applied = self.pull()
+        if pushed or applied:
+            logger.info(f"Синхронизация Google Sheets: отправлено {pushed}, принято {len(applied)}")
+        return applied
+
+    async def run(self, on_change: Callable = None):
+        """
+        Фоновая задача периодической синхронизации
+
+        Args:
+            on_change: async-функция (order_id, status), вызывается для статусов из таблицы
+        """
+        loop = asyncio.get_event_loop()
+        while True:
+            await asyncio.sleep(self.interval)
+            if not self.connection.available:
+                continue
+            try:
+                applied = await loop.run_in_executor(None, self.sync_once)
+            except Exception as e:
+                logger.warning(f"Ошибка синхронизации с Google Sheets: {e}")
+                continue
+            if on_change is not None:
+                for order_id, status in applied:
+                    try:
+                        await on_change(order_id, status)
+                    except Exception as e:
+                        logger.warning(f"Ошибка обработки статуса из таблицы: {e}")
+
+
+# Глобальный экземпляр
+sheets_sync = SheetsSync(queue=sheets_queue)
@@ -0,0 +1,362 @@
+"""
+Модуль хранилищ записей с взаимозаменяемыми реализациями
+Хранилище держит записи {key: dict} с временем ts (unix-время) и умеет
+искать по ключу и по диапазону времени. Реализация выбирается в config.py:
+
+    STORAGE_BACKEND = "sqlite"   # "memory", "sqlite" или "jsonl"
+    STORAGE_DIR = "db"
+"""
+
+import os
+import json
+import time
+import bisect
+import sqlite3
+import logging
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+try:
+    from config import STORAGE_BACKEND
+except ImportError:
+    STORAGE_BACKEND = "sqlite"
+
+try:
+    from config import STORAGE_DIR
+except ImportError:
+    STORAGE_DIR = "db"
+
+
+class StorageBackend(ABC):
+    """Общий интерфейс хранилища записей
+
+    Записи — JSON-сериализуемые словари. Порядок записей и выборка
+    по диапазону определяются временем ts, при равном ts — ключом.
+    """
+
+    @abstractmethod
+    def put(self, key: str, record: dict, ts: int = None):
+        """Сохранить (или перезаписать) запись"""
+        raise NotImplementedError
+
+    def put_many(self, items: Iterable[Tuple[str, dict, Optional[int]]]):
+        """Сохранить несколько записей (key, record, ts)"""
+        for key, record, ts in items:
+            self.put(key, record, ts)
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[dict]:
+        """Получить запись по ключу (или None)"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete(self, key: str) -> bool:
+        """Удалить запись (True если она была)"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def range(self, since: int = None, until: int = None, limit: int = None,
+              newest_first: bool = False) -> List[Tuple[str, dict]]:
+        """Записи с since <= ts < until, отсортированные по времени"""
+        raise NotImplementedError
+
+    def items(self) -> List[Tuple[str, dict]]:
+        """Все записи в порядке времени"""
+        return self.range()
+
+    @abstractmethod
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    @abstractmethod
+    def clear(self):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    @staticmethod
+    def _ts(ts) -> int:
+        return int(time.time()) if ts is None else int(ts)
+
+
+class MemoryStorage(StorageBackend):
+    """Хранилище в памяти: словарь по ключу + отсортированный индекс по времени"""
+
+    def __init__(self, *args, **kwargs):
+        self._records: Dict[str, Tuple[int, dict]] = {}
+        self._order: List[Tuple[int, str]] = []
+
+    def put(self, key, record, ts=None):
+        ts = self._ts(ts)
+        old = self._records.get(key)
+        if old is not None:
+            self._order.pop(bisect.bisect_left(self._order, (old[0], key)))
+        self._records[key] = (ts, record)
+        bisect.insort(self._order, (ts, key))
+
+    def get(self, key):
+        entry = self._records.get(key)
+        return entry[1] if entry else None
+
+    def delete(self, key):
+        old = self._records.pop(key, None)
+        if old is None:
+            return False
+        self._order.pop(bisect.bisect_left(self._order, (old[0], key)))
+        return True
+
+    def range(self, since=None, until=None, limit=None, newest_first=False):
+        lo = 0 if since is None else bisect.bisect_left(self._order, (since, ""))
+        hi = len(self._order) if until is None else bisect.bisect_left(self._order, (until, ""))
+        if newest_first:
+            start = hi - limit if limit is not None else lo
+            keys = reversed(self._order[max(lo, start):hi])
+        else:
+            keys = self._order[lo:hi if limit is None else min(hi, lo + limit)]
+        return [(key, self._records[key][1]) for _, key in keys]
+
+    def __len__(self):
+        return len(self._records)
+
+    def clear(self):
+        self._records.clear()
+        self._order.clear()
+
+
+class SQLiteStorage(StorageBackend):
+    """Хранилище в таблице SQLite (WAL), индекс по времени"""
+
+    def __init__(self, name: str, directory: str = STORAGE_DIR, path: str = None):
+        """
+        Args:
+            name: Имя хранилища (имя таблицы)
+            directory: Директория файла storage.db
+            path: Явный путь к файлу базы (вместо directory/storage.db)
+        """
+        if not name.isidentifier():
+            raise ValueError(f"Недопустимое имя хранилища: {name}")
+        self.name = name
+        self.path = path or os.path.join(directory, "storage.db")
+        dirname = os.path.dirname(self.path)
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname)
+
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(f"""
+            CREATE TABLE IF NOT EXISTS {name} (
+                key  TEXT PRIMARY KEY,
+                ts   INTEGER NOT NULL,
+                data BLOB NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_{name}_ts ON {name}(ts, key);
+        """)
+
+    @staticmethod
+    def _dump(record: dict) -> bytes:
+        return json.dumps(record, ensure_ascii=False).encode("utf-8")
+
+    def put(self, key, record, ts=None):
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.name} VALUES (?, ?, ?)",
+                (key, self._ts(ts), self._dump(record))
+            )
+
+    def put_many(self, items):
+        params = [(key, self._ts(ts), self._dump(record)) for key, record, ts in items]
+        with self._lock, self._conn:
+            self._conn.executemany(f"INSERT OR REPLACE INTO {self.name} VALUES (?, ?, ?)", params)
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(f"SELECT data FROM {self.name} WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def delete(self, key):
+        with self._lock, self._conn:
+            cursor = self._conn.execute(f"DELETE FROM {self.name} WHERE key = ?", (key,))
+        return cursor.rowcount > 0
+
+    def range(self, since=None, until=None, limit=None, newest_first=False):
+        conditions, params = [], []
+        if since is not None:
+            conditions.append("ts >= ?")
+            params.append(int(since))
+        if until is not None:
+            conditions.append("ts < ?")
+            params.append(int(until))
+        query = f"SELECT key, data FROM {self.name}"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        order = "DESC" if newest_first else "ASC"
+        query += f" ORDER BY ts {order}, key {order}"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(int(limit))
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [(key, json.loads(data)) for key, data in rows]
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM {self.name}").fetchone()[0]
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute(f"DELETE FROM {self.name}")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class JsonLinesStorage(StorageBackend):
+    """Хранилище в файле JSON-lines: журнал операций + индекс в памяти
+
+    Каждое изменение дописывается строкой в {name}.jsonl, при открытии
+    журнал перечитывается в MemoryStorage. Когда устаревших строк
+    становится больше, чем живых записей, файл переписывается атомарно.
+    """
+
+    def __init__(self, name: str, directory: str = STORAGE_DIR, path: str = None, compact_min: int = 1000):
+        """
+        Args:
+            name: Имя хранилища (имя файла)
+            directory: Директория файла
+            path: Явный путь к файлу (вместо directory/{name}.jsonl)
+            compact_min: Не сжимать файл, пока в нём меньше строк
+        """
+        self.name = name
+        self.path = path or os.path.join(directory, f"{name}.jsonl")
+        self.compact_min = compact_min
+        dirname = os.path.dirname(self.path)
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname)
+
+        self._lock = threading.RLock()
+        self._mem = MemoryStorage()
+        self._lines = 0
+        self._load()
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        good_size = 0  # байт до конца последней целой строки
+        with open(self.path, 'rb') as f:
+            for line in f:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("строка без конца строки")
+                    op = json.loads(line)
+                except ValueError:
+                    # Недописанная последняя строка после сбоя
+                    logger.warning(f"Пропущена повреждённая строка в {self.path}")
+                    break
+                good_size += len(line)
+                self._lines += 1
+                if op.get("del"):
+                    self._mem.delete(op["key"])
+                else:
+                    self._mem.put(op["key"], op["value"], op["ts"])
+        if good_size < os.path.getsize(self.path):
+            # Обрезаем мусор, иначе новые строки допишутся к нему и потеряются
+            with open(self.path, 'r+b') as f:
+                f.truncate(good_size)
+                os.fsync(f.fileno())
+
+    def _write(self, ops: List[dict]):
+        self._file.write("".join(json.dumps(op, ensure_ascii=False) + "\n" for op in ops))
+        self._file.flush()
+        self._lines += len(ops)
+        if self._lines >= self.compact_min and self._lines > 2 * len(self._mem):
+            self.compact()
+
+    def put(self, key, record, ts=None):
+        ts = self._ts(ts)
+        with self._lock:
+            self._mem.put(key, record, ts)
+            self._write([{"key": key, "ts": ts, "value": record}])
+
+    def put_many(self, items):
+        ops = []
+        with self._lock:
+            for key, record, ts in items:
+                ts = self._ts(ts)
+                self._mem.put(key, record, ts)
+                ops.append({"key": key, "ts": ts, "value": record})
+            self._write(ops)
+
+    def get(self, key):
+        with self._lock:
+            return self._mem.get(key)
+
+    def delete(self, key):
+        with self._lock:
+            if not self._mem.delete(key):
+                return False
+            self._write([{"key": key, "del": True}])
+            return True
+
+    def range(self, since=None, until=None, limit=None, newest_first=False):
+        with self._lock:
+            return self._mem.range(since, until, limit, newest_first)
+
+    def __len__(self):
+        return len(self._mem)
+
+    def clear(self):
+        with self._lock:
+            self._mem.clear()
+            self._file.close()
+            self._file = open(self.path, 'w', encoding='utf-8')
+            self._lines = 0
+
+    def compact(self):
+        """Переписать файл, оставив только живые записи"""
+        with self._lock:
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for key, (ts, record) in self._mem._records.items():
+                    f.write(json.dumps({"key": key, "ts": ts, "value": record}, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._file.close()
+            os.replace(tmp_path, self.path)
+            self._file = open(self.path, 'a', encoding='utf-8')
+            self._lines = len(self._mem)
+
+    def close(self):
+        with self._lock:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+
+
+BACKENDS = {
+    "memory": MemoryStorage,
+    "sqlite": SQLiteStorage,
+    "jsonl": JsonLinesStorage,
+}
+
+
+def open_storage(name: str, backend: str = None, directory: str = None) -> StorageBackend:
+    """
+    Открыть хранилище выбранной реализации
+
+    Args:
+        name: Имя хранилища (таблица / файл)
+        backend: "memory", "sqlite" или "jsonl" (по умолчанию STORAGE_BACKEND)
+        directory: Директория данных (по умолчанию STORAGE_DIR)
+    """
+    backend = backend or STORAGE_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Неизвестное хранилище: {backend} (доступны: {', '.join(BACKENDS)})")
+    return BACKENDS[backend](name, directory or STORAGE_DIR)
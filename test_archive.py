@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки архива заказов
+"""
+
+import os
+import tempfile
+from datetime import datetime, timedelta
+
+import data
+from archive import SegmentArchive
+from data import TicketStore
+
+print("=" * 50)
+print("🧪 Тест архива заказов ClientBotManager")
+print("=" * 50)
+
+tmp_dir = tempfile.mkdtemp()
+
+# Сегменты: запись, поиск по разреженному индексу
+print("\n🗄 Запись и чтение сегмента...")
+archive = SegmentArchive(os.path.join(tmp_dir, "segments"), block_size=4)
+tickets = [{"order_id": f"o{i:03d}", "user_id": 1, "status": "выполнен",
+            "timestamp": "2025-01-01T00:00:00", "data": {"fio": f"Клиент {i}"}} for i in range(10)]
+name = archive.write(tickets)
+assert archive.get(name, "o007")["data"]["fio"] == "Клиент 7"
+assert archive.get(name, "o100") is None and archive.get(name, "a") is None
+assert set(archive.get_many([(name, "o001"), (name, "o009")])) == {"o001", "o009"}
+assert len(list(archive.iter_all())) == 10
+print("  ✅ Поиск по номеру читает один блок сегмента")
+
+# Политика хранения: старые и завершённые заказы уходят из tickets
+print("\n📦 Перенос заказов в архив...")
+data.ticket_store = store = TicketStore(os.path.join(tmp_dir, "tickets.db"))
+data.ticket_archive = SegmentArchive(os.path.join(tmp_dir, "archive"))
+now = datetime(2026, 6, 1)
+store.save(7, "old", {"status": "в работе", "timestamp": (now - timedelta(days=400)).isoformat(), "data": {}})
+store.save(7, "done", {"status": "выполнен", "timestamp": (now - timedelta(days=40)).isoformat(), "data": {"fio": "Иван"}})
+store.save(7, "fresh_done", {"status": "выполнен", "timestamp": (now - timedelta(days=2)).isoformat(), "data": {}})
+store.save(7, "active", {"status": "в работе", "timestamp": (now - timedelta(days=40)).isoformat(), "data": {}})
+assert data.archive_tickets(now) == 2
+assert sorted(store.get_user_tickets(7)) == ["active", "fresh_done"]
+assert data.archive_tickets(now) == 0
+print("  ✅ В архиве: старый и выполненный заказы, активные остались")
+
+# Архивные заказы доступны по номеру и в истории пользователя
+print("\n🔎 Чтение архива...")
+ticket = data.get_ticket("done")
+assert ticket.status == "выполнен" and ticket.data["fio"] == "Иван"
+assert data.is_ticket_archived("done") and not data.is_ticket_archived("active")
+page = data.get_archived_page(7, 5)
+assert [t.order_id for t in page["tickets"]] == ["done", "old"] and page["total"] == 2
+assert data.get_ticket_page(7, 5)["archived"] == 2
+print("  ✅ Заказы находятся по номеру и листаются в архиве")
+
+print("\n" + "=" * 50)
+print("✅ Все тесты пройдены успешно!")
+print("=" * 50)
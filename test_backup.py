@@ -3,15 +3,30 @@
 Тестовый скрипт для проверки системы бекапов
 """
 
+import os
+import json
+import tempfile
+
+import data
+from archive import SegmentArchive
 from backup import BackupManager
-from data import TICKETS_DB, REFERRALS_DB, BONUSES_DB
+from journal import Journal
+from data import TicketStore, TicketsView, BonusLedger, REFERRALS_DB, BONUSES_DB, export_state
 from reviews import REVIEWS
-import json
 
 print("=" * 50)
 print("🧪 Тест системы бекапов ClientBotManager")
 print("=" * 50)
 
+# Заказы, бонусы, журнал рефералов и бекапы — во временной директории,
+# рабочие db/ и backups/ тест не трогает
+tmp_dir = tempfile.mkdtemp()
+data.ticket_store = TicketStore(os.path.join(tmp_dir, "tickets.db"))
+data.ticket_archive = SegmentArchive(os.path.join(tmp_dir, "archive"))
+data.TICKETS_DB = TICKETS_DB = TicketsView(data.ticket_store)
+data.bonus_ledger = BonusLedger(os.path.join(tmp_dir, "tickets.db"))
+data._journal = Journal(os.path.join(tmp_dir, "journal"))
+
 # Добавим тестовые данные
 print("\n📝 Добавление тестовых данных...")
 TICKETS_DB['123456789'] = {
@@ -30,17 +45,13 @@ print(f"  ✅ Добавлено: 1 заказ, 1 реферальная гру
 
 # Инициализируем BackupManager
 print("\n🔧 Инициализация BackupManager...")
-manager = BackupManager('backups')
+manager = BackupManager(os.path.join(tmp_dir, "backups"))
 print("  ✅ BackupManager готов")
 
 # Создаем бекап
 print("\n📦 Создание бекапа...")
-data_to_backup = {
-    'tickets': TICKETS_DB,
-    'referrals': REFERRALS_DB,
-    'bonuses': BONUSES_DB,
-    'reviews': REVIEWS
-}
+data_to_backup = export_state()
+data_to_backup['reviews'] = REVIEWS
 
 backup_path = manager.create_backup(data_to_backup)
 if backup_path:
@@ -49,6 +60,11 @@ else:
     print("  ❌ Ошибка при создании бекапа")
     exit(1)
 
+# Бекап пишется напрямую в архив: временных файлов не остаётся
+leftovers = [f for f in os.listdir(manager.backup_dir) if not f.endswith('.zip') and f != 'manifest.json']
+assert not leftovers, leftovers
+print("  ✅ Временных файлов нет")
+
 # Получаем список бекапов
 print("\n📂 Просмотр списка бекапов...")
 backups = manager.list_backups()
@@ -69,6 +85,14 @@ for i, backup in enumerate(backups, 1):
         print(f"     Рефералов: {records.get('referrals', 0)}")
         print(f"     Отзывов: {records.get('reviews', 0)}")
 
+# Манифест: список берётся из manifest.json и совпадает с пересобранным по архивам
+print("\n🗂 Проверка манифеста...")
+assert os.path.exists(manager.manifest_path)
+assert any(b['filename'] == os.path.basename(backup_path) and b['sha256'] for b in backups)
+os.remove(manager.manifest_path)
+assert BackupManager(manager.backup_dir).list_backups() == backups
+print("  ✅ Манифест собран заново по архивам")
+
 # Восстанавливаем данные
 print("\n🔄 Восстановление из бекапа...")
 if backups:
@@ -83,6 +107,40 @@ if backups:
 else:
     print("  ⚠️  Нет доступных бекапов")
 
+# Цепочка: полный бекап + инкрементальный, восстановление собирает актуальное состояние
+print("\n⛓ Инкрементальный бекап...")
+from data import (export_memory_state, export_memory_changes, export_stored_changes,
+                  save_ticket, set_ticket_status, add_referral, add_bonus)
+
+full, watermark = export_stored_changes()
+full.update(export_memory_state())
+assert manager.create_backup(full, watermark)
+
+save_ticket(555, 'order_inc', {'fio': 'Пётр', 'idea': 'Интернет-магазин'})
+assert set_ticket_status('order_inc', 'в работе')
+add_referral(987654321, 222222222)
+add_bonus(987654321, 300, "Тест")
+
+changes, watermark = export_stored_changes(manager.chain_watermark)
+changes.update(export_memory_changes())
+assert list(changes['tickets']) == [555], changes['tickets']
+assert [e['amount'] for e in changes['bonus_ledger']] == [300]
+inc_path = manager.create_incremental_backup(changes, watermark)
+assert inc_path and manager.chain_length == 1
+
+restored = manager.restore_backup(inc_path)
+expected = json.loads(json.dumps(export_state(), ensure_ascii=False))
+assert restored['tickets'] == expected['tickets']
+assert restored['tickets']['555']['order_inc']['status'] == 'в работе'
+assert restored['referrals'] == expected['referrals']
+assert [e['id'] for e in restored['bonus_ledger']] == [e['id'] for e in expected['bonus_ledger']]
+print(f"  ✅ {os.path.basename(inc_path)}: {len(changes['bonus_ledger'])} операция с бонусами, заказ order_inc")
+
+# Очистка не удаляет полный бекап, от которого зависит инкрементальный
+manager.cleanup_old_backups(1)
+assert os.path.exists(inc_path) and manager.restore_backup(inc_path)
+print("  ✅ Цепочка пережила очистку старых бекапов")
+
 print("\n" + "=" * 50)
 print("✅ Все тесты пройдены успешно!")
 print("=" * 50)
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки кэша контента ContentManager
+"""
+
+import json
+import tempfile
+
+from content_manager import ContentManager
+
+print("=" * 50)
+print("🧪 Тест кэша контента ClientBotManager")
+print("=" * 50)
+
+tmp_dir = tempfile.mkdtemp()
+manager = ContentManager(tmp_dir, revalidate_interval=0)
+
+reads = []
+original_read = manager._read_json
+manager._read_json = lambda path, default: reads.append(path) or original_read(path, default)
+
+# Повторные чтения не трогают диск
+print("\n📖 Чтение из кэша...")
+manager.add_portfolio_case("Бот магазина", "Каталог и оплата", "Подробности")
+manager.add_faq("Сколько стоит?", "От 10 000 руб.")
+reads.clear()
+for _ in range(5):
+    assert manager.get_portfolio()[0]["title"] == "Бот магазина"
+    assert manager.get_portfolio_case("case_1")["desc"] == "Каталог и оплата"
+    assert len(manager.get_faq()) == 1
+assert reads == []
+print("  ✅ Файлы не перечитываются, пока не изменились")
+
+# Ручная правка файла замечается по mtime/размеру
+print("\n✏️ Ручная правка файла...")
+with open(manager.faq_file, "w", encoding="utf-8") as f:
+    json.dump([{"id": "faq_1", "q": "Сроки?", "a": "2 недели"}, {"id": "faq_2", "q": "Оплата?", "a": "Карта"}],
+              f, ensure_ascii=False)
+assert [item["q"] for item in manager.get_faq()] == ["Сроки?", "Оплата?"]
+assert reads == [manager.faq_file]
+print("  ✅ Изменённый файл перечитан")
+
+# Изменения через менеджер сразу видны, версия растёт
+print("\n🔄 Изменения через админку...")
+version = manager.get_version(manager.portfolio_file)
+manager.update_portfolio_case("case_1", title="Бот доставки")
+assert manager.get_portfolio_case("case_1")["title"] == "Бот доставки"
+assert manager.get_version(manager.portfolio_file) > version
+print("  ✅ Кэш и версия обновлены после сохранения")
+
+# Правки в работающем боте копятся и пишутся одной атомарной записью
+print("\n💾 Отложенная запись...")
+import asyncio
+import os
+
+manager = ContentManager(tempfile.mkdtemp(), write_delay=0.05)
+writes = []
+original_write = manager._write_file
+manager._write_file = lambda path: writes.append(path) or original_write(path)
+
+
+async def edit_many():
+    for i in range(20):
+        manager.add_faq(f"Вопрос {i}?", "Ответ")
+    assert len(manager.get_faq()) == 20 and not os.path.exists(manager.faq_file)
+    await asyncio.sleep(0.3)
+
+asyncio.run(edit_many())
+assert sorted(writes) == [manager.faq_file, manager.ids_file]
+with open(manager.faq_file, encoding="utf-8") as f:
+    assert [item["id"] for item in json.load(f)] == [f"faq_{i}" for i in range(1, 21)]
+assert sorted(os.listdir(manager.content_dir)) == [".history", "faq.json", "ids.json"]
+print("  ✅ 20 правок — одна запись файла, временных файлов не осталось")
+
+# Готовые ответы пересобираются только при смене версии контента
+print("\n🧱 Кэш готовых ответов...")
+from render_cache import RenderCache
+
+cache = RenderCache()
+builds = []
+
+
+def render_faq():
+    faq = manager.get_faq()
+    return cache.get("faq", manager.get_version(manager.faq_file),
+                     lambda: builds.append(1) or "\n".join(item["q"] for item in faq))
+
+assert render_faq() == render_faq()
+assert len(builds) == 1 and cache.hits == 1
+manager.add_faq("Гарантия?", "Год")
+assert render_faq().endswith("Гарантия?") and len(builds) == 2
+print("  ✅ Ответ собирается заново только после изменения FAQ")
+
+# Позиции кейсов для карусели портфолио
+print("\n🎠 Карусель портфолио...")
+manager.add_portfolio_case("Бот магазина", "Каталог и оплата", "Подробности")
+manager.add_portfolio_case("Бот записи", "Онлайн-запись", "Подробности")
+assert manager.get_portfolio_position("case_1") == 0 and manager.get_portfolio_position("case_2") == 1
+manager.delete_portfolio_case("case_1")
+assert manager.get_portfolio_position("case_1") is None and manager.get_portfolio_position("case_2") == 0
+print("  ✅ Позиция кейса по ID, индекс обновляется после удаления")
+
+# Наблюдатель: изменённый файл подменяется целиком, битый — отклоняется
+print("\n👀 Наблюдатель за файлами...")
+manager = ContentManager(tempfile.mkdtemp())
+manager.add_faq("Сроки?", "2 недели")
+assert manager.poll() == []
+with open(manager.faq_file, "w", encoding="utf-8") as f:
+    json.dump([{"id": "faq_1", "q": "Сроки?", "a": "3 недели"}], f, ensure_ascii=False)
+assert manager.poll() == [manager.faq_file]
+assert manager.get_faq()[0]["a"] == "3 недели"
+
+version = manager.get_version(manager.faq_file)
+for broken in ('[{"id": "faq_1", "q": "Сроки?"', '[{"id": "faq_1", "q": "Без ответа"}]', '{"q": "не список"}'):
+    with open(manager.faq_file, "w", encoding="utf-8") as f:
+        f.write(broken)
+    assert manager.poll() == []
+    assert manager.get_faq()[0]["a"] == "3 недели"
+assert manager.get_version(manager.faq_file) == version
+print("  ✅ Правка подхвачена, битые файлы отклонены, осталась рабочая версия")
+
+# История версий: правки, ручные изменения и откат
+print("\n🕘 История и откат...")
+manager = ContentManager(tempfile.mkdtemp())
+manager.add_faq("Сроки?", "2 недели")
+manager.add_faq("Оплата?", "Картой")
+manager.update_faq("faq_1", answer="3 недели")
+history = manager.get_history("faq")
+assert [entry["version"] for entry in history] == [3, 2, 1]
+assert history[0]["note"] == "админка" and history[0]["count"] == 2
+
+assert manager.rollback("faq", 1)
+assert [item["a"] for item in manager.get_faq()] == ["2 недели"]
+assert manager.get_history("faq", 1)[0]["note"] == "откат к версии 1"
+assert not manager.rollback("faq", 99) and not manager.rollback("nope", 1)
+
+# Неизменённые вопросы хранятся один раз на всю историю
+blobs = sum(len(files) for _, _, files in os.walk(manager.history.blobs_dir))
+assert blobs == 6  # 3 разных вопроса + 3 разных снимка (откат повторяет версию 1)
+print("  ✅ Версии сохраняются, откат — новая версия, общие вопросы не дублируются")
+
+# Недописанная строка журнала после сбоя обрезается, следующие версии читаются
+from content_history import ContentHistory
+with open(os.path.join(manager.history.directory, "faq.log"), "a", encoding="utf-8") as f:
+    f.write('{"version": 5, "ro')
+history = ContentHistory(manager.history.directory)
+assert [entry["version"] for entry in history.versions("faq")] == [4, 3, 2, 1]
+assert history.record("faq", [{"id": "faq_9", "q": "Новый?", "a": "Да"}], "ручная правка") == 5
+history = ContentHistory(manager.history.directory)
+assert [entry["version"] for entry in history.versions("faq")] == [5, 4, 3, 2, 1]
+assert history.load("faq", 5)[0]["q"] == "Новый?"
+print("  ✅ Повреждённый хвост журнала обрезан, версии после сбоя сохраняются")
+
+# ID не повторяются после удаления, поиск по ID — через индекс
+print("\n🆔 Выдача ID...")
+manager = ContentManager(tempfile.mkdtemp())
+for question in ("Сроки?", "Оплата?", "Гарантия?"):
+    manager.add_faq(question, "...")
+manager.delete_faq("faq_3")
+manager.add_faq("Поддержка?", "...")
+assert [item["id"] for item in manager.get_faq()] == ["faq_1", "faq_2", "faq_4"]
+assert manager.get_faq_item("faq_4")["q"] == "Поддержка?" and manager.get_faq_item("faq_3") is None
+assert not manager.update_faq("faq_3", answer="x") and not manager.delete_faq("faq_3")
+
+# Счётчик переживает перезапуск; ID, вписанные в файл вручную, пропускаются
+with open(manager.portfolio_file, "w", encoding="utf-8") as f:
+    json.dump([{"id": "case_2", "title": "Старый кейс", "desc": "", "details": ""}], f, ensure_ascii=False)
+manager = ContentManager(manager.content_dir)
+manager.add_faq("Хостинг?", "...")
+manager.add_portfolio_case("Новый кейс", "", "")
+assert manager.get_faq()[-1]["id"] == "faq_5"
+assert [case["id"] for case in manager.get_portfolio()] == ["case_2", "case_3"]
+print("  ✅ Номера только растут, существующие ID не занимаются повторно")
+
+print("\n" + "=" * 50)
+print("✅ Все тесты пройдены успешно!")
+print("=" * 50)
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки хранилища заказов
+"""
+
+import gc
+import os
+import asyncio
+import tempfile
+
+import data
+from data import TicketStore, TicketsView, BonusLedger, InsufficientBonusError
+
+print("=" * 50)
+print("🧪 Тест хранилища заказов ClientBotManager")
+print("=" * 50)
+
+tmp_dir = tempfile.mkdtemp()
+db_path = os.path.join(tmp_dir, "tickets.db")
+
+# Сохраняем заказы
+print("\n📝 Сохранение заказов...")
+store = TicketStore(db_path)
+store.save(111, "ord_a", {"status": "новый", "timestamp": "2026-01-10T10:00:00", "data": {"fio": "Иван"}})
+store.save(111, "ord_b", {"status": "в работе", "timestamp": "2026-01-11T10:00:00", "data": {"fio": "Иван"}})
+store.save(222, "ord_c", {"data": {"fio": "Мария"}})
+assert store.count() == 3
+assert store.count_users() == 2
+print("  ✅ Сохранено: 3 заказа от 2 пользователей")
+
+# Поиск по номеру и по пользователю
+print("\n🔎 Поиск заказов...")
+ticket = store.get("ord_b")
+assert ticket["user_id"] == 111 and ticket["status"] == "в работе"
+assert ticket["data"]["fio"] == "Иван"
+assert ticket["timestamp"] == "2026-01-11T10:00:00"
+assert list(store.get_user_tickets(111)) == ["ord_a", "ord_b"]
+assert store.get("missing") is None
+print("  ✅ Поиск по номеру и по пользователю работает")
+
+# Постраничная история заказов
+print("\n📄 Постраничная история заказов...")
+page_store = TicketStore(os.path.join(tmp_dir, "pages.db"))
+for i in range(7):
+    page_store.save(555, f"p{i}", {"timestamp": 1767225600 + i // 2, "data": {}})
+data.ticket_store, saved_store = page_store, data.ticket_store
+first = data.get_ticket_page(555, 3)
+assert [t.order_id for t in first["tickets"]] == ["p6", "p5", "p4"]
+assert first["newer"] is None and first["older"]
+second = data.get_ticket_page(555, 3, first["older"])
+assert [t.order_id for t in second["tickets"]] == ["p3", "p2", "p1"]
+last = data.get_ticket_page(555, 3, second["older"])
+assert [t.order_id for t in last["tickets"]] == ["p0"] and last["older"] is None
+back = data.get_ticket_page(555, 3, last["newer"], newer=True)
+assert [t.order_id for t in back["tickets"]] == ["p3", "p2", "p1"] and back["newer"]
+assert data.get_ticket_page(555, 3, back["newer"], newer=True)["newer"] is None
+data.ticket_store = saved_store
+print("  ✅ Листание вперёд и назад по курсору работает")
+
+# Выборка по статусу и времени
+print("\n📋 Выборка заказов по статусу и времени...")
+assert [t.order_id for t in store.query(status="новый")] == ["ord_c", "ord_a"]
+since = data._to_epoch("2026-01-11T00:00:00")
+until = data._to_epoch("2026-02-01T00:00:00")
+assert [t.order_id for t in store.query(since=since, until=until)] == ["ord_b"]
+assert [t.order_id for t in store.query(since=since, newest_first=False)] == ["ord_b", "ord_c"]
+assert [t.order_id for t in store.query(status="в работе", limit=1)] == ["ord_b"]
+assert store.count_by_status() == {"новый": 2, "в работе": 1}
+plan = store._conn.execute(
+    "EXPLAIN QUERY PLAN SELECT * FROM tickets WHERE status = ? AND timestamp >= ? ORDER BY timestamp DESC", ("новый", 0)
+).fetchall()
+assert "idx_tickets_status_ts" in str(plan)
+print("  ✅ Фильтры, сортировка и индекс статус+время работают")
+
+# Компактная запись заказа
+print("\n🗜️ Проверка записи Ticket...")
+ticket = store.get("ord_a")
+assert ticket._data is None  # анкета ещё не разобрана
+assert ticket.status is store.get("ord_c").status  # интернированный статус
+assert ticket.get("data")["fio"] == "Иван"
+assert ticket.to_dict()["timestamp"] == "2026-01-10T10:00:00"
+print("  ✅ Анкета разбирается лениво, статус интернирован")
+
+# Данные переживают перезапуск
+print("\n🔄 Переоткрытие базы...")
+store = TicketStore(db_path)
+assert store.count() == 3
+print("  ✅ Заказы сохранились на диске")
+
+# Совместимый словарный интерфейс
+print("\n📦 Проверка TICKETS_DB-совместимого интерфейса...")
+view = TicketsView(store)
+assert 111 in view and 333 not in view
+assert len(view) == 2
+exported = store.export()
+view.clear()
+assert len(view) == 0
+view.update(exported)
+assert store.count() == 3
+view["333"] = {"ord_d": {"status": "новый", "data": {}}}
+assert 333 in view and list(view[333]) == ["ord_d"]
+print("  ✅ Очистка, восстановление и запись через словарь работают")
+
+# Журнал бонусов
+print("\n🎁 Проверка журнала бонусов...")
+ledger = BonusLedger(db_path)
+assert ledger.post(111, 100, "Приглашение 222", key="referral:222") == (True, 100)
+assert ledger.post(111, 100, "Приглашение 222", key="referral:222") == (False, 100)
+assert ledger.post(111, -80, "Оплата заказа ord_a", key="order:ord_a") == (True, 20)
+assert ledger.post(111, -80, "Оплата заказа ord_a", key="order:ord_a") == (False, 20)
+try:
+    ledger.post(111, -50, "Оплата заказа ord_b", key="order:ord_b")
+    assert False, "списание больше баланса должно быть отклонено"
+except InsufficientBonusError:
+    pass
+assert ledger.balances() == {111: 20}
+assert [e["amount"] for e in ledger.history(111)] == [100, -80]
+assert ledger.history(111, limit=1)[0]["key"] == "order:ord_a"
+print("  ✅ Повторные операции не применяются, баланс не уходит в минус")
+
+# Блокировки пользователей: общие для одновременных операций, не копятся
+print("\n🔒 Проверка блокировок пользователей...")
+
+
+async def _locked(user_id, order):
+    async with data.user_lock(user_id):
+        order.append(("in", user_id))
+        await asyncio.sleep(0.01)
+        order.append(("out", user_id))
+
+async def _run_locked(order):
+    await asyncio.gather(_locked(1, order), _locked(1, order), _locked(2, order))
+
+order = []
+asyncio.run(_run_locked(order))
+assert order.index(("in", 1), 1) > order.index(("out", 1))  # второй вход пользователя 1 — после выхода первого
+gc.collect()
+assert len(data._user_locks) == 0
+print("  ✅ Операции одного пользователя идут по очереди, освобождённые блокировки удаляются")
+
+print("\n" + "=" * 50)
+print("✅ Все тесты пройдены успешно!")
+print("=" * 50)
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки поиска по FAQ
+"""
+
+from faq_search import FaqIndex, stem, tokenize
+
+print("=" * 50)
+print("🧪 Тест поиска по FAQ")
+print("=" * 50)
+
+FAQ = [
+    {"id": "faq_1", "q": "Сколько времени занимает разработка?", "a": "Простой бот — 2-4 недели."},
+    {"id": "faq_2", "q": "Есть ли гарантия на работу?", "a": "Исправляю ошибки бесплатно 30 дней."},
+    {"id": "faq_3", "q": "Какие интеграции вы поддерживаете?", "a": "Платёжные системы, CRM, Google Sheets."},
+    {"id": "faq_4", "q": "Можно ли потом добавить новые функции?", "a": "Да, бота можно развивать поэтапно."},
+]
+
+# Разные формы слова сводятся к одной основе
+print("\n🔤 Стемминг...")
+assert stem("разработка") == stem("разработки") == stem("разработке")
+assert stem("гарантия") == stem("гарантию")
+assert stem("интеграции") == stem("интеграция")
+assert tokenize("Как добавить функции?") == [stem("добавить"), stem("функции")]
+print("  ✅ Формы слов и стоп-слова")
+
+# Ранжирование, опечатки, отсечение нерелевантного
+print("\n🔎 Поиск...")
+index = FaqIndex()
+assert index.sync(FAQ, version=1) == 4
+assert index.search("сколько длится разработка бота")[0][0]["id"] == "faq_1"
+assert index.search("интеграция с CRM")[0][0]["id"] == "faq_3"
+assert index.search("гарантея есть?")[0][0]["id"] == "faq_2"  # опечатка
+assert index.search("погода в Москве") == []
+assert index.search("и как") == []
+print("  ✅ Лучший ответ первым, опечатки прощаются, мимо — пусто")
+
+# Правки FAQ переиндексируют только изменённые вопросы
+print("\n🔄 Обновление индекса...")
+assert index.sync(FAQ, version=1) == 0
+edited = [dict(item) for item in FAQ[:3]] + [{"id": "faq_5", "q": "Как оплатить заказ?", "a": "Картой или по счёту."}]
+edited[1]["a"] = "Гарантия 60 дней на исправление ошибок."
+assert index.sync(edited, version=2) == 3  # изменён faq_2, удалён faq_4, добавлен faq_5
+assert len(index) == 4
+assert index.search("новые функции") == []
+assert index.search("оплатить картой")[0][0]["id"] == "faq_5"
+print("  ✅ Переиндексированы 3 вопроса из 4")
+
+print("\n" + "=" * 50)
+print("✅ Все тесты пройдены успешно!")
+print("=" * 50)
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки журнала изменений
+"""
+
+import os
+import tempfile
+
+from journal import Journal
+
+print("=" * 50)
+print("🧪 Тест журнала изменений ClientBotManager")
+print("=" * 50)
+
+tmp_dir = tempfile.mkdtemp()
+
+# Пишем изменения в журнал
+print("\n📝 Запись изменений...")
+journal = Journal(tmp_dir)
+stores, records = journal.load()
+assert stores == {} and records == []
+journal.append("set", "bonuses", 111, 100)
+journal.append("append", "referrals", 111, 222)
+journal.append("set", "bonuses", 111, 200)
+journal.sync()
+print("  ✅ Записано 3 изменения")
+
+# Повторное открытие — все записи на месте
+print("\n🔄 Чтение журнала после перезапуска...")
+journal = Journal(tmp_dir)
+stores, records = journal.load()
+assert [r["seq"] for r in records] == [1, 2, 3]
+assert records[-1]["value"] == 200 and records[-1]["key"] == 111
+print("  ✅ Все записи прочитаны")
+
+# Снимок обнуляет журнал, новые записи идут после него
+print("\n📸 Снимок и хвост журнала...")
+journal.snapshot({"bonuses": [[111, 200]], "referrals": [[111, [222]]]})
+assert os.path.getsize(journal.journal_path) == 0
+journal.append("set", "bonuses", 333, 50)
+journal.sync()
+
+journal = Journal(tmp_dir)
+stores, records = journal.load()
+assert stores["bonuses"] == [[111, 200]]
+assert [(r["seq"], r["key"]) for r in records] == [(4, 333)]
+print("  ✅ Снимок + хвост журнала восстанавливаются")
+
+# Недописанная строка после сбоя не ломает загрузку
+print("\n💥 Повреждённый хвост журнала...")
+with open(journal.journal_path, "a", encoding="utf-8") as f:
+    f.write('{"seq": 5, "op": "se')
+journal = Journal(tmp_dir)
+stores, records = journal.load()
+assert [r["seq"] for r in records] == [4]
+print("  ✅ Повреждённая запись пропущена")
+
+# Записи после восстановления не теряются: мусорный хвост обрезан
+journal.append("set", "bonuses", 444, 70)
+journal.sync()
+journal = Journal(tmp_dir)
+stores, records = journal.load()
+assert [(r["seq"], r["key"]) for r in records] == [(4, 333), (5, 444)]
+print("  ✅ Запись после сбоя читается при следующей загрузке")
+
+print("\n" + "=" * 50)
+print("✅ Все тесты пройдены успешно!")
+print("=" * 50)
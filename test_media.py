@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки кэша медиафайлов портфолио
+"""
+
+import os
+import json
+import shutil
+import tempfile
+
+from storage import MemoryStorage
+from media import MediaCache, media_type
+from content_manager import ContentManager
+
+print("=" * 50)
+print("🧪 Тест медиафайлов портфолио")
+print("=" * 50)
+
+tmp_dir = tempfile.mkdtemp()
+os.makedirs(os.path.join(tmp_dir, "media"))
+for name, data in [("shop_1.jpg", b"jpeg-1"), ("shop_2.png", b"png-2"), ("demo.mp4", b"video")]:
+    with open(os.path.join(tmp_dir, "media", name), "wb") as f:
+        f.write(data)
+with open(os.path.join(tmp_dir, "portfolio.json"), "w", encoding="utf-8") as f:
+    json.dump([{"id": "case_1", "title": "Магазин", "desc": "", "details": "",
+                "media": ["media/shop_1.jpg", "media/shop_2.png", "media/demo.mp4", "media/missing.jpg",
+                          "notes.txt"]}], f)
+
+# Медиа кейса: тип по расширению, отсутствующие файлы пропускаются
+print("\n🖼 Медиа кейса...")
+manager = ContentManager(tmp_dir)
+media = manager.get_portfolio_media("case_1")
+assert [kind for kind, _ in media] == ["photo", "photo", "video"]
+assert media_type("a.JPG") == "photo" and media_type("a.txt") is None
+assert manager.get_portfolio_media("case_404") == []
+print("  ✅ 3 файла из 5, типы определены")
+
+# file_id по хэшу содержимого: копия файла не загружается заново
+print("\n🔑 Кэш file_id...")
+cache = MediaCache(MemoryStorage())
+first = os.path.join(tmp_dir, "media", "shop_1.jpg")
+digest = cache.digest(first)
+assert cache.get_file_id(digest) is None
+cache.remember(digest, "AgAD-file-1", "photo")
+copy_path = os.path.join(tmp_dir, "media", "shop_1_copy.jpg")
+shutil.copy(first, copy_path)
+assert cache.get_file_id(cache.digest(copy_path)) == "AgAD-file-1"
+
+with open(first, "wb") as f:
+    f.write(b"jpeg-1 new version")
+assert cache.digest(first) != digest  # изменённый файл загрузится заново
+cache.forget(digest)
+assert cache.get_file_id(digest) is None
+assert cache.digest(os.path.join(tmp_dir, "media", "missing.jpg")) is None
+print("  ✅ Повторная загрузка только для новых или изменённых файлов")
+
+print("\n" + "=" * 50)
+print("✅ Все тесты пройдены успешно!")
+print("=" * 50)
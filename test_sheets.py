@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки синхронизации заказов с Google Sheets
+(на локальном листе FakeWorksheet, без сети)
+"""
+
+import os
+import asyncio
+import tempfile
+from datetime import datetime, timedelta
+
+from fake_sheets import FakeWorksheet
+from sheets import SheetsConnection, SheetsWriteQueue, SheetsSync
+
+print("=" * 50)
+print("🧪 Тест синхронизации с Google Sheets")
+print("=" * 50)
+
+tmp_dir = tempfile.mkdtemp()
+state_path = os.path.join(tmp_dir, "sheets_queue.db")
+sheet = FakeWorksheet()
+connection = SheetsConnection(open_worksheet=lambda: sheet)
+queue = SheetsWriteQueue(state_path, connection)
+sync = SheetsSync(state_path, connection, queue)
+
+local = {}
+sync.bind(local.get, local.__setitem__, ["новый", "в работе", "выполнен", "отменён"])
+
+# Новые заказы уходят в таблицу пачкой, номера строк запоминаются
+print("\n📤 Запись заказов...")
+start = datetime(2026, 3, 1, 12, 0, 0)
+for i in range(3):
+    order_id = f"ord_{i}"
+    local[order_id] = "новый"
+    created = (start + timedelta(minutes=i)).isoformat()
+    queue.put([order_id, 100 + i, "ФИО", "контакт", "новый", created, created])
+assert asyncio.run(queue.flush())
+assert len(sheet.rows) == 3 and sheet.calls["append_rows"] == 1
+print("  ✅ 3 строки записаны одним append_rows")
+
+# Первая синхронизация: ничего не изменилось
+assert sync.sync_once() == []
+
+# Админ меняет статус в таблице
+print("\n📥 Изменение статуса в таблице...")
+sheet.user_edit(2, 5, "в работе", when=start + timedelta(hours=1))
+sheet.user_edit(3, 5, "что-то своё", when=start + timedelta(hours=1))
+gets_before = sheet.calls["batch_get"]
+assert sync.sync_once() == [("ord_1", "в работе")]
+assert local["ord_1"] == "в работе" and local["ord_2"] == "новый"
+assert sheet.calls["batch_get"] - gets_before == 2  # столбец G + изменённые строки
+assert sync.sync_once() == []
+print("  ✅ Статус принят, неизвестный статус проигнорирован")
+
+# Бот меняет статус — уходит одним batch_update
+print("\n📤 Изменение статуса в боте...")
+local["ord_0"] = "выполнен"
+sync.enqueue_status("ord_0", "выполнен", start + timedelta(hours=2))
+local["ord_2"] = "отменён"
+sync.enqueue_status("ord_2", "отменён", start + timedelta(hours=2))
+sync.sync_once()
+assert sheet.rows[0][4] == "выполнен" and sheet.rows[2][4] == "отменён"
+assert sheet.calls["batch_update"] == 1 and sync.pending() == 0
+assert "col_values" not in sheet.calls  # номера строк известны из append_rows
+print("  ✅ Статусы отправлены одним batch_update")
+
+# Таблицу отсортировали: запомненные номера строк указывают на чужие заказы
+print("\n🔀 Сортировка таблицы...")
+sheet.rows.reverse()  # ord_2, ord_1, ord_0
+local["ord_1"] = "выполнен"
+sync.enqueue_status("ord_1", "выполнен", start + timedelta(hours=2, minutes=30))
+local["ord_2"] = "в работе"
+sync.enqueue_status("ord_2", "в работе", start + timedelta(hours=2, minutes=30))
+assert sync.push() == 2
+assert [(row[0], row[4]) for row in sheet.rows] == [("ord_2", "в работе"), ("ord_1", "выполнен"), ("ord_0", "выполнен")]
+assert sheet.calls["col_values"] == 1
+# Строку удалили: статус не пишется в строку, которая заняла её место
+del sheet.rows[1]
+sync.enqueue_status("ord_1", "отменён", start + timedelta(hours=2, minutes=40))
+assert sync.push() == 0 and sync.pending() == 1
+assert [(row[0], row[4]) for row in sheet.rows] == [("ord_2", "в работе"), ("ord_0", "выполнен")]
+# Строку вернули на место — изменение уходит
+sheet.rows.reverse()
+sheet.rows.insert(1, ["ord_1", 101, "ФИО", "контакт", "выполнен", "", ""])
+assert sync.push() == 1 and sheet.rows[1][4] == "отменён"
+local["ord_1"] = "отменён"
+print("  ✅ Номера строк сверяются со столбцом A и находятся заново")
+
+# Конфликт: локальное изменение новее правки в таблице
+print("\n⚖️ Конфликт изменений...")
+sheet.user_edit(1, 5, "в работе", when=start + timedelta(hours=3))
+local["ord_0"] = "отменён"
+sync.enqueue_status("ord_0", "отменён", start + timedelta(hours=4))
+assert sync.pull() == []
+sync.push()
+assert local["ord_0"] == "отменён" and sheet.rows[0][4] == "отменён"
+print("  ✅ Побеждает более позднее изменение")
+
+print("\n" + "=" * 50)
+print("✅ Все тесты пройдены успешно!")
+print("=" * 50)
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки хранилищ storage.py
+"""
+
+import tempfile
+
+from storage import BACKENDS, JsonLinesStorage, StorageBackend, open_storage
+
+print("=" * 50)
+print("🧪 Тест хранилищ ClientBotManager")
+print("=" * 50)
+
+# Все реализации ведут себя одинаково
+for backend in BACKENDS:
+    print(f"\n📦 Хранилище {backend}...")
+    store = open_storage("orders", backend, tempfile.mkdtemp())
+    store.put("b", {"n": 2}, 200)
+    store.put("a", {"n": 1}, 100)
+    store.put_many([("c", {"n": 3}, 300), ("d", {"n": 4}, 300)])
+    store.put("a", {"n": 10}, 150)  # перезапись с новым временем
+    assert len(store) == 4
+    assert store.get("a") == {"n": 10} and store.get("missing") is None
+    assert [k for k, _ in store.items()] == ["a", "b", "c", "d"]
+    assert [k for k, _ in store.range(since=150, until=300)] == ["a", "b"]
+    assert [k for k, _ in store.range(newest_first=True, limit=3)] == ["d", "c", "b"]
+    assert store.delete("b") and not store.delete("b")
+    assert [k for k, _ in store.range(since=200)] == ["c", "d"]
+    store.clear()
+    assert len(store) == 0 and store.range() == []
+    store.close()
+    print(f"  ✅ {backend}: запись, поиск, диапазон, удаление")
+
+# Общий интерфейс абстрактный: реализация обязана определить все методы
+try:
+    StorageBackend()
+    raise AssertionError("StorageBackend создан без реализации")
+except TypeError:
+    pass
+
+# JSON-lines переживает перезапуск и сжимается
+print("\n🔄 JSON-lines: перезапуск и сжатие...")
+tmp_dir = tempfile.mkdtemp()
+store = JsonLinesStorage("reviews", tmp_dir, compact_min=10)
+for i in range(20):
+    store.put("same", {"v": i}, i)
+assert store._lines < 20  # устаревшие строки выброшены
+store.put("other", {"v": "x"}, 50)
+store.delete("other")
+store.close()
+with open(store.path, "a", encoding="utf-8") as f:
+    f.write('{"key": "broken", "ts"')
+store = JsonLinesStorage("reviews", tmp_dir)
+assert len(store) == 1 and store.get("same") == {"v": 19}
+store.put("after", {"v": "crash"}, 60)
+store.close()
+store = JsonLinesStorage("reviews", tmp_dir)
+assert [k for k, _ in store.items()] == ["same", "after"]
+print("  ✅ Данные восстановлены, повреждённый хвост обрезан, новые записи читаются")
+
+# Одобренные отзывы не перезаписывают друг друга и переживают перезапуск
+print("\n📝 Отзывы: одобрение и перезапуск...")
+import reviews
+
+reviews_dir = tempfile.mkdtemp()
+reviews._published_store = open_storage("reviews", "jsonl", reviews_dir)
+reviews._pending_store = open_storage("pending_reviews", "jsonl", reviews_dir)
+approved = []
+for author in ("Анна", "Борис"):
+    review_id = reviews.new_review_id()
+    reviews.add_pending_review({"id": review_id, "author": author, "rating": 5,
+                                "text": "Спасибо!", "date": "2026-03-01T10:00:00"})
+    # Как в обработчике одобрения: отзыв забирается из очереди и публикуется под тем же id
+    reviews.publish_review(reviews.take_pending_review(review_id))
+    approved.append(review_id)
+assert approved[0] != approved[1]
+
+# Перезапуск: в памяти ничего нет, всё читается из хранилища
+reviews._published_store.close()
+reviews._pending_store.close()
+reviews.REVIEWS[:] = []
+reviews.PENDING_REVIEWS[:] = []
+reviews._published_store = open_storage("reviews", "jsonl", reviews_dir)
+reviews._pending_store = open_storage("pending_reviews", "jsonl", reviews_dir)
+reviews._load_reviews()
+published = {review["id"]: review["author"] for review in reviews.REVIEWS}
+assert [published.get(review_id) for review_id in approved] == ["Анна", "Борис"], published
+assert not reviews.PENDING_REVIEWS
+print("  ✅ Оба одобренных отзыва на месте после перезапуска")
+
+print("\n" + "=" * 50)
+print("✅ Все тесты пройдены успешно!")
+print("=" * 50)
@@ -0,0 +1,82 @@
+# ticket.py
+# Компактная запись заказа. Модуль без побочных эффектов при импорте
+# (data.py при импорте открывает базы), поэтому его можно использовать
+# отдельно — например, в bench_tickets.py.
+
+import sys
+import json
+from datetime import datetime
+
+
+def to_epoch(value) -> int:
+    """Привести время (datetime, ISO-строка, число или None) к unix-времени в секундах"""
+    if value is None:
+        return int(datetime.now().timestamp())
+    if isinstance(value, datetime):
+        return int(value.timestamp())
+    if isinstance(value, (int, float)):
+        return int(value)
+    try:
+        return int(datetime.fromisoformat(value).timestamp())
+    except (TypeError, ValueError):
+        return int(datetime.now().timestamp())
+
+
+class Ticket:
+    """Компактная запись заказа
+
+    Время хранится как целое unix-время, статус интернирован (одна строка
+    на все заказы с тем же статусом), а анкета заказа хранится как JSON в
+    UTF-8 (bytes) и разбирается только при первом обращении к ticket.data.
+    Поддерживает доступ как к словарю: ticket["status"], ticket.get("data").
+    """
+
+    __slots__ = ("order_id", "user_id", "status", "ts", "_payload", "_data")
+
+    FIELDS = ("order_id", "user_id", "timestamp", "status", "data")
+
+    def __init__(self, order_id, user_id, status, ts, payload):
+        self.order_id = order_id
+        self.user_id = user_id
+        self.status = sys.intern(status)
+        self.ts = ts
+        if isinstance(payload, (bytes, str)):
+            self._payload = payload.encode("utf-8") if isinstance(payload, str) else payload
+            self._data = None
+        else:
+            self._payload = None
+            self._data = payload
+
+    @property
+    def data(self) -> dict:
+        if self._data is None:
+            self._data = json.loads(self._payload) if self._payload else {}
+        return self._data
+
+    @property
+    def payload(self) -> bytes:
+        """Анкета заказа в виде JSON (UTF-8) без повторного кодирования"""
+        if self._payload is None:
+            return json.dumps(self._data or {}, ensure_ascii=False).encode("utf-8")
+        return self._payload
+
+    @property
+    def timestamp(self) -> str:
+        return datetime.fromtimestamp(self.ts).isoformat()
+
+    def __getitem__(self, key):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def to_dict(self) -> dict:
+        return {key: self[key] for key in self.FIELDS}
+
+    def __repr__(self):
+        return f"Ticket({self.order_id!r}, user_id={self.user_id}, status={self.status!r})"